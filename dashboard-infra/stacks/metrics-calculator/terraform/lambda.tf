@@ -153,6 +153,18 @@ resource "aws_iam_policy" "metrics_calculator_function_policy" {
       "Action": "s3:PutObject",
       "Resource": "arn:aws:s3:::${var.metrics_bucket_name}/*"
     },
+    {
+      "Sid": "AllowReadMetricsBucket",
+      "Effect": "Allow",
+      "Action": "s3:ListBucket",
+      "Resource": "arn:aws:s3:::${var.metrics_bucket_name}"
+    },
+    {
+      "Sid": "AllowReadMigrationData",
+      "Effect": "Allow",
+      "Action": "s3:GetObject",
+      "Resource": "arn:aws:s3:::${var.metrics_bucket_name}/*"
+    },
     {
       "Sid": "AllowReadPatientRegistrationsBucket",
       "Effect": "Allow",
@@ -2,20 +2,35 @@ import boto3
 import json
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
 from decimal import ROUND_HALF_UP, Decimal
 from chalice import Chalice
 from statistics import fmean
 
-from chalicelib.get_data_from_splunk import get_telemetry_from_splunk, get_baseline_telemetry_from_splunk, \
-    parse_threshold_from_telemetry, SplunkTelemetryMissing
-from chalicelib.get_patient_registration_count import get_patient_registration_count, PatientRegistrationsError
+from chalicelib.get_data_from_splunk import get_telemetry_stream_from_splunk, get_baseline_telemetry_from_splunk, \
+    parse_threshold_from_telemetry, SplunkTelemetryMissing, configure_splunk_connections, close_splunk_connections, \
+    DEFAULT_SPLUNK_CONNECTION_POOL_SIZE, DEFAULT_SPLUNK_CONNECTION_IDLE_TIMEOUT
+from chalicelib.batched_splunk_queries import get_telemetry_batch_from_splunk, \
+    get_baseline_telemetry_batch_from_splunk, group_overlapping_date_ranges, DEFAULT_SPLUNK_QUERY_BATCH_SIZE
+from chalicelib.get_patient_registration_count import get_patient_registration_count, \
+    lookup_all_patient_registration_counts, PatientRegistrationsError
 from chalicelib.get_splunk_api_token import get_splunk_api_token
+from chalicelib.gzip_stream import GzipCompressingReader
+from chalicelib.load_lookup_files import DEFAULT_DOWNLOAD_WORKERS
 from chalicelib.lookup_all_asids import lookup_all_asids, AsidLookupError
-from chalicelib.metrics_engine import calculate_cutover_start_and_end_date, \
-    calculate_migrations_stats_per_supplier_combination
+from chalicelib.migration import MigrationMetrics, record_to_json
+from chalicelib.metrics_engine import calculate_cutover_start_and_end_date, SupplierCombinationStats
 from chalicelib.migration_occurrences import get_migration_occurrences
-from chalicelib.s3 import get_s3_resource, write_object_s3, objects_exist
-from chalicelib.telemetry import get_telemetry, upload_telemetry, GetTelemetryError
+from chalicelib.migration_results import load_migration_results
+from chalicelib.input_fingerprint import calculate_input_fingerprint, read_input_fingerprint, \
+    write_input_fingerprint
+from chalicelib.s3 import get_s3_resource, write_object_s3, objects_exist, list_object_etags
+from chalicelib.telemetry import get_telemetry, upload_telemetry, upload_telemetry_stream, GetTelemetryError
+from chalicelib.telemetry_series import TelemetryParseError
+from chalicelib.cutover_cube import CutoverCube
 from chalicelib.calculate_date_range import calculate_baseline_date_range, calculate_pre_cutover_date_range, \
     calculate_post_cutover_date_range
 
@@ -23,6 +38,8 @@ app = Chalice(app_name='metrics-calculator')
 logger = logging.getLogger("Metrics Calculator")
 logger.setLevel(logging.DEBUG)
 
+DEFAULT_EXPORT_WORKERS = 4
+
 
 @app.lambda_function()
 def calculate_dashboard_metrics_from_telemetry(event, context):
@@ -30,64 +47,81 @@ def calculate_dashboard_metrics_from_telemetry(event, context):
     asid_lookup_bucket_name = os.environ['ASID_LOOKUP_BUCKET_NAME']
     telemetry_bucket_name = os.environ['TELEMETRY_BUCKET_NAME']
     patient_registrations_bucket_name = os.environ['PATIENT_REGISTRATIONS_BUCKET_NAME']
+    asid_index_location = os.environ.get('ASID_INDEX_LOCATION')
+    asid_lookup_workers = int(os.environ.get('ASID_LOOKUP_WORKERS', DEFAULT_DOWNLOAD_WORKERS))
+    use_s3_select = os.environ.get('USE_S3_SELECT', 'false').lower() == 'true'
+    occurrences_manifest_location = os.environ.get('OCCURRENCES_MANIFEST_LOCATION')
+    migration_results_location = os.environ.get('MIGRATION_RESULTS_LOCATION')
+    input_fingerprint_uri = f"s3://{os.environ['METRICS_BUCKET_NAME']}/migrations-input-fingerprint.txt"
     s3 = get_s3_resource()
+
+    input_etags = {
+        bucket_name: list_object_etags(s3, bucket_name)
+        for bucket_name in [occurrences_bucket_name, asid_lookup_bucket_name, telemetry_bucket_name,
+                            patient_registrations_bucket_name]}
+    input_fingerprint = calculate_input_fingerprint(input_etags)
+    if not event.get("force", False) and read_input_fingerprint(s3, input_fingerprint_uri) == input_fingerprint:
+        logger.info("Inputs are unchanged since the metrics were last calculated - skipping")
+        return "ok"
+
     known_migrations = get_migration_occurrences(
-        s3, occurrences_bucket_name)
-    asids_lookup = lookup_all_asids(s3, asid_lookup_bucket_name, known_migrations)
+        s3, occurrences_bucket_name, occurrences_manifest_location)
+    asids_lookup = lookup_all_asids(
+        s3, asid_lookup_bucket_name, known_migrations, asid_index_location, asid_lookup_workers,
+        use_s3_select)
+
+    migration_results = None
+    migrations_to_calculate = known_migrations
+    if migration_results_location:
+        migration_results = load_migration_results(
+            s3, migration_results_location, input_etags[telemetry_bucket_name],
+            input_etags[patient_registrations_bucket_name])
+        migrations_to_calculate = [
+            migration for migration in known_migrations
+            if migration["ods_code"] not in asids_lookup
+            or migration_results.get(migration, asids_lookup[migration["ods_code"]]) is None]
+        logger.debug(f"Calculating {len(migrations_to_calculate)} of {len(known_migrations)} migrations")
+    registration_counts = lookup_all_patient_registration_counts(
+        s3, patient_registrations_bucket_name, migrations_to_calculate, use_s3_select)
 
     metrics = []
+    cutover_cube = CutoverCube()
+    supplier_combination_stats = SupplierCombinationStats()
     for migration in known_migrations:
         try:
-            ods_code = migration["ods_code"]
-            asid_lookup = get_asids_for_ods_code(asids_lookup, ods_code)
-            old_asid = asid_lookup["old"]["asid"]
-            logger.debug(f"Old asid: {old_asid}")
-            new_asid = asid_lookup["new"]["asid"]
-            logger.debug(f"New asid: {new_asid}")
-            old_telemetry_object_name = f"{old_asid}-telemetry.csv.gz"
-            new_telemetry_object_name = f"{new_asid}-telemetry.csv.gz"
-
-            old_telemetry_generator = get_telemetry(
-                s3, telemetry_bucket_name, old_telemetry_object_name)
-            new_telemetry_generator = get_telemetry(
-                s3, telemetry_bucket_name, new_telemetry_object_name)
-
-            migration_metrics = calculate_cutover_start_and_end_date(
-                old_telemetry_generator, new_telemetry_generator)
-
-            org_details = {
-                "ods_code": ods_code,
-                "ccg_name": migration["ccg_name"],
-                "practice_name": migration["practice_name"]
-            }
-
-            try:
-                patient_registration_count = get_patient_registration_count(
-                    s3, patient_registrations_bucket_name, migration)
-                org_details["patient_registration_count"] = patient_registration_count
-            except PatientRegistrationsError as e:
-                logging.error("Couldn't find patient registration count for migration", exc_info=True)
-
-            system_details = {
-                "source_system": asid_lookup["old"]["name"],
-                "target_system": asid_lookup["new"]["name"]
-            }
-            metrics.append(migration_metrics | org_details | system_details)
+            asid_lookup = get_asids_for_ods_code(asids_lookup, migration["ods_code"])
+            metric = None
+            if migration_results is not None:
+                metric = migration_results.get(migration, asid_lookup)
+            if metric is None:
+                metric = calculate_migration_metrics(
+                    migration, asid_lookup, s3, telemetry_bucket_name, registration_counts)
+                if migration_results is not None:
+                    migration_results.put(migration, asid_lookup, metric)
+            metrics.append(metric)
+            cutover_cube.add(migration["date"], metric)
+            supplier_combination_stats.add(metric)
         except AsidLookupError:
             logging.error("Couldn't find ASIDs for migration", exc_info=True)
         except GetTelemetryError:
             logging.error("Couldn't get telemetry for migration", exc_info=True)
+        except TelemetryParseError:
+            logging.error("Couldn't parse telemetry for migration", exc_info=True)
+
+    if migration_results is not None:
+        migration_results.save(s3, migration_results_location)
 
     if len(metrics) > 0:
         mean_cutover = calculate_mean_cutover(metrics)
-        supplier_combination_stats = calculate_migrations_stats_per_supplier_combination(metrics)
 
         migrations = {
             "mean_cutover_duration": mean_cutover,
-            "supplier_combination_stats": supplier_combination_stats,
+            "supplier_combination_stats": supplier_combination_stats.results(),
             "migrations": metrics
         }
         upload_migrations(s3, migrations)
+        upload_cutover_cube(s3, cutover_cube)
+        write_input_fingerprint(s3, input_fingerprint_uri, input_fingerprint)
 
     return "ok"
 
@@ -98,31 +132,206 @@ def export_splunk_data(event, context):
     asid_lookup_bucket_name = os.environ['ASID_LOOKUP_BUCKET_NAME']
     telemetry_bucket_name = os.environ['TELEMETRY_BUCKET_NAME']
     splunk_host = os.environ['SPLUNK_HOST']
+    asid_index_location = os.environ.get('ASID_INDEX_LOCATION')
+    asid_lookup_workers = int(os.environ.get('ASID_LOOKUP_WORKERS', DEFAULT_DOWNLOAD_WORKERS))
+    use_s3_select = os.environ.get('USE_S3_SELECT', 'false').lower() == 'true'
+    occurrences_manifest_location = os.environ.get('OCCURRENCES_MANIFEST_LOCATION')
+    export_workers = int(os.environ.get('EXPORT_WORKERS', DEFAULT_EXPORT_WORKERS))
+    splunk_query_batch_size = int(os.environ.get('SPLUNK_QUERY_BATCH_SIZE', DEFAULT_SPLUNK_QUERY_BATCH_SIZE))
+    splunk_connection_pool_size = int(
+        os.environ.get('SPLUNK_CONNECTION_POOL_SIZE', DEFAULT_SPLUNK_CONNECTION_POOL_SIZE))
+    splunk_connection_idle_timeout = float(
+        os.environ.get('SPLUNK_CONNECTION_IDLE_TIMEOUT', DEFAULT_SPLUNK_CONNECTION_IDLE_TIMEOUT))
 
     s3 = get_s3_resource()
     known_migrations = get_migration_occurrences(
-        s3, occurrences_bucket_name)
+        s3, occurrences_bucket_name, occurrences_manifest_location)
     number_of_successful_exports = 0
 
     if len(known_migrations) > 0:
         ssm = get_ssm_client()
         splunk_token = get_splunk_api_token(ssm, "/prod/splunk-api-token")
-        asids_lookup = lookup_all_asids(s3, asid_lookup_bucket_name, known_migrations)
-        for migration in known_migrations:
-            try:
-                export_data_for_migration(
-                    migration, s3, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host)
-                number_of_successful_exports += 1
-            except AsidLookupError:
-                logger.error("Error finding ASIDs", exc_info=True)
-            except SplunkTelemetryMissing:
-                logger.error("No telemetry found", exc_info=True)
+        asids_lookup = lookup_all_asids(
+            s3, asid_lookup_bucket_name, known_migrations, asid_index_location, asid_lookup_workers,
+            use_s3_select)
+        configure_splunk_connections(splunk_connection_pool_size, splunk_connection_idle_timeout)
+        try:
+            if splunk_query_batch_size > 1:
+                number_of_successful_exports = export_migrations_in_batches(
+                    known_migrations, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host, export_workers,
+                    splunk_query_batch_size)
+            else:
+                number_of_successful_exports = export_migrations(
+                    known_migrations, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host, export_workers)
+        finally:
+            close_splunk_connections()
     logger.info(
         f"Processed {len(known_migrations)} migrations, {number_of_successful_exports} exported successfully")
     return "ok"
 
 
+def calculate_migration_metrics(migration, asid_lookup, s3, telemetry_bucket_name, registration_counts):
+    old_asid = asid_lookup["old"]["asid"]
+    logger.debug(f"Old asid: {old_asid}")
+    new_asid = asid_lookup["new"]["asid"]
+    logger.debug(f"New asid: {new_asid}")
+    old_telemetry_object_name = f"{old_asid}-telemetry.csv.gz"
+    new_telemetry_object_name = f"{new_asid}-telemetry.csv.gz"
+
+    old_telemetry_generator = get_telemetry(
+        s3, telemetry_bucket_name, old_telemetry_object_name)
+    new_telemetry_generator = get_telemetry(
+        s3, telemetry_bucket_name, new_telemetry_object_name)
+
+    migration_metrics = calculate_cutover_start_and_end_date(
+        old_telemetry_generator, new_telemetry_generator)
+
+    try:
+        patient_registration_count = get_patient_registration_count(registration_counts, migration)
+    except PatientRegistrationsError as e:
+        patient_registration_count = None
+        logging.error("Couldn't find patient registration count for migration", exc_info=True)
+
+    return MigrationMetrics(
+        **migration_metrics,
+        ods_code=migration["ods_code"],
+        ccg_name=migration["ccg_name"],
+        practice_name=migration["practice_name"],
+        patient_registration_count=patient_registration_count,
+        source_system=asid_lookup["old"]["name"],
+        target_system=asid_lookup["new"]["name"]
+    )
+
+
+def export_migrations(migrations, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host, workers):
+    """
+    Exports the telemetry for up to workers migrations at a time, each thread with its own S3
+    resource as they can't be shared between threads. Returns how many were exported.
+    """
+    thread_resources = threading.local()
+
+    def export(migration):
+        if not hasattr(thread_resources, "s3"):
+            thread_resources.s3 = get_s3_resource()
+        try:
+            export_data_for_migration(
+                migration, thread_resources.s3, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host)
+            return True
+        except AsidLookupError:
+            logger.error("Error finding ASIDs", exc_info=True)
+        except SplunkTelemetryMissing:
+            logger.error("No telemetry found", exc_info=True)
+        return False
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return sum(executor.map(export, migrations))
+
+
+def export_migrations_in_batches(migrations, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host, workers,
+                                 batch_size):
+    """
+    Exports the telemetry for the migrations with one Splunk search for up to batch_size
+    ASIDs whose date ranges overlap, rather than three searches per migration. Returns how many
+    were exported.
+    """
+    s3 = get_s3_resource()
+    telemetry_exports = []
+    number_of_successful_exports = 0
+    for migration in migrations:
+        try:
+            telemetry_export = plan_telemetry_export(migration, s3, asids_lookup, telemetry_bucket_name)
+        except AsidLookupError:
+            logger.error("Error finding ASIDs", exc_info=True)
+            continue
+        if telemetry_export is None:
+            number_of_successful_exports += 1
+        else:
+            telemetry_exports.append(telemetry_export)
+
+    baseline_requests = [
+        (telemetry_export["old_asid"], telemetry_export["baseline_date_range"])
+        for telemetry_export in telemetry_exports]
+    cutover_requests = [
+        (telemetry_export["old_asid"], telemetry_export["pre_cutover_date_range"])
+        for telemetry_export in telemetry_exports
+    ] + [
+        (telemetry_export["new_asid"], telemetry_export["post_cutover_date_range"])
+        for telemetry_export in telemetry_exports]
+    thread_resources = threading.local()
+
+    def export(telemetry_export, baseline_telemetry, pre_cutover_telemetry, post_cutover_telemetry):
+        if not hasattr(thread_resources, "s3"):
+            thread_resources.s3 = get_s3_resource()
+        try:
+            upload_exported_telemetry(
+                thread_resources.s3, telemetry_bucket_name, telemetry_export, baseline_telemetry,
+                GzipCompressingReader(BytesIO(pre_cutover_telemetry)) if pre_cutover_telemetry else None,
+                GzipCompressingReader(BytesIO(post_cutover_telemetry)) if post_cutover_telemetry else None)
+            return True
+        except SplunkTelemetryMissing:
+            logger.error("No telemetry found", exc_info=True)
+        return False
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        baseline_telemetry = get_telemetry_in_batches(
+            executor, get_baseline_telemetry_batch_from_splunk, splunk_host, splunk_token, baseline_requests,
+            batch_size)
+        cutover_telemetry = get_telemetry_in_batches(
+            executor, get_telemetry_batch_from_splunk, splunk_host, splunk_token, cutover_requests, batch_size)
+        number_of_successful_exports += sum(executor.map(
+            export, telemetry_exports, baseline_telemetry, cutover_telemetry[:len(telemetry_exports)],
+            cutover_telemetry[len(telemetry_exports):]))
+    return number_of_successful_exports
+
+
+def get_telemetry_in_batches(executor, get_telemetry_batch, splunk_host, splunk_token, requests, batch_size):
+    """Runs get_telemetry_batch on the executor for each group of requests, returning the telemetry in order."""
+    groups = group_overlapping_date_ranges([date_range for _, date_range in requests], batch_size)
+    logger.debug(f"Querying splunk for {len(requests)} telemetry files in {len(groups)} searches")
+    group_telemetry = executor.map(
+        lambda group: get_telemetry_batch(splunk_host, splunk_token, [requests[index] for index in group]), groups)
+    telemetry = [None] * len(requests)
+    for group, batch_telemetry in zip(groups, group_telemetry):
+        for index, request_telemetry in zip(group, batch_telemetry):
+            telemetry[index] = request_telemetry
+    return telemetry
+
+
 def export_data_for_migration(migration, s3, asids_lookup, telemetry_bucket_name, splunk_token, splunk_host):
+    telemetry_export = plan_telemetry_export(migration, s3, asids_lookup, telemetry_bucket_name)
+    if telemetry_export is None:
+        return
+    old_asid = telemetry_export["old_asid"]
+    new_asid = telemetry_export["new_asid"]
+
+    # The threshold is stored alongside the telemetry rather than in it, so the queries can all
+    # run at once. The cutover telemetry is then streamed straight from Splunk to S3, once the
+    # baseline threshold is known to go in its metadata.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        baseline_telemetry_future = executor.submit(
+            get_baseline_telemetry_from_splunk, splunk_host, splunk_token, old_asid,
+            telemetry_export["baseline_date_range"])
+        pre_cutover_telemetry_future = executor.submit(
+            get_telemetry_stream_from_splunk, splunk_host, splunk_token, old_asid,
+            telemetry_export["pre_cutover_date_range"])
+        post_cutover_telemetry_future = executor.submit(
+            get_telemetry_stream_from_splunk, splunk_host, splunk_token, new_asid,
+            telemetry_export["post_cutover_date_range"])
+    with ExitStack() as telemetry_streams:
+        for telemetry_stream_future in [pre_cutover_telemetry_future, post_cutover_telemetry_future]:
+            telemetry_streams.callback(close_telemetry_stream, telemetry_stream_future)
+        upload_exported_telemetry(
+            s3, telemetry_bucket_name, telemetry_export, baseline_telemetry_future.result(),
+            pre_cutover_telemetry_future.result(), post_cutover_telemetry_future.result())
+
+
+def close_telemetry_stream(telemetry_stream_future):
+    if telemetry_stream_future.exception() is None and telemetry_stream_future.result() is not None:
+        telemetry_stream_future.result().close()
+
+
+def plan_telemetry_export(migration, s3, asids_lookup, telemetry_bucket_name):
+    """The ASIDs and date ranges to export telemetry for, or None if it has already been exported."""
     ods_code = migration["ods_code"]
     logger.debug(f"ODS code: {ods_code}")
     asid_lookup = get_asids_for_ods_code(asids_lookup, ods_code)
@@ -138,7 +347,7 @@ def export_data_for_migration(migration, s3, asids_lookup, telemetry_bucket_name
     telemetry_filenames = [baseline_telemetry_filename, pre_cutover_telemetry_filename, post_cutover_telemetry_filename]
     if objects_exist(s3, telemetry_bucket_name, telemetry_filenames):
         logger.debug("Existing files present in bucket - skipping further processing")
-        return
+        return None
 
     logger.debug("Querying splunk for telemetry data")
     baseline_date_range = calculate_baseline_date_range(
@@ -154,52 +363,58 @@ def export_data_for_migration(migration, s3, asids_lookup, telemetry_bucket_name
     logger.debug(
         f"Post-cutover date range: start date: {post_cutover_date_range['start_date']}, end date: {post_cutover_date_range['end_date']}")
 
-    baseline_telemetry = get_baseline_telemetry_from_splunk(
-        splunk_host, splunk_token, old_asid, baseline_date_range)
+    return {
+        "ods_code": ods_code,
+        "old_asid": old_asid,
+        "new_asid": new_asid,
+        "baseline_telemetry_filename": baseline_telemetry_filename,
+        "pre_cutover_telemetry_filename": pre_cutover_telemetry_filename,
+        "post_cutover_telemetry_filename": post_cutover_telemetry_filename,
+        "baseline_date_range": baseline_date_range,
+        "pre_cutover_date_range": pre_cutover_date_range,
+        "post_cutover_date_range": post_cutover_date_range
+    }
+
+
+def upload_exported_telemetry(s3, telemetry_bucket_name, telemetry_export, baseline_telemetry,
+                              pre_cutover_telemetry_stream, post_cutover_telemetry_stream):
+    """
+    Uploads the baseline telemetry and streams the cutover telemetry to S3, unless there is no
+    pre-cutover or post-cutover telemetry.
+    """
     baseline_threshold = parse_threshold_from_telemetry(baseline_telemetry)
     logger.debug(f"Baseline threshold value: {baseline_threshold}")
+    baseline_date_range = telemetry_export["baseline_date_range"]
+    pre_cutover_date_range = telemetry_export["pre_cutover_date_range"]
+    post_cutover_date_range = telemetry_export["post_cutover_date_range"]
 
-    pre_cutover_telemetry = get_telemetry_from_splunk(
-        splunk_host,
-        splunk_token,
-        old_asid,
-        pre_cutover_date_range,
-        baseline_threshold
-    )
-    post_cutover_telemetry = get_telemetry_from_splunk(
-        splunk_host,
-        splunk_token,
-        new_asid,
-        post_cutover_date_range,
-        baseline_threshold
-    )
-
-    if pre_cutover_telemetry and post_cutover_telemetry:
+    if pre_cutover_telemetry_stream is not None and post_cutover_telemetry_stream is not None:
         logger.debug("Uploading exported splunk data")
         upload_telemetry(
             s3,
             telemetry_bucket_name,
             baseline_telemetry,
-            baseline_telemetry_filename,
+            telemetry_export["baseline_telemetry_filename"],
             baseline_date_range['start_date'],
             baseline_date_range['end_date'])
-        upload_telemetry(
+        upload_telemetry_stream(
             s3,
             telemetry_bucket_name,
-            pre_cutover_telemetry,
-            pre_cutover_telemetry_filename,
+            pre_cutover_telemetry_stream,
+            telemetry_export["pre_cutover_telemetry_filename"],
             pre_cutover_date_range['start_date'],
-            pre_cutover_date_range['end_date'])
-        upload_telemetry(
+            pre_cutover_date_range['end_date'],
+            baseline_threshold=baseline_threshold)
+        upload_telemetry_stream(
             s3,
             telemetry_bucket_name,
-            post_cutover_telemetry,
-            post_cutover_telemetry_filename,
+            post_cutover_telemetry_stream,
+            telemetry_export["post_cutover_telemetry_filename"],
             post_cutover_date_range['start_date'],
             post_cutover_date_range['end_date'])
         logger.debug("Files successfully uploaded")
     else:
-        logger.debug(f"No telemetry files uploaded for {ods_code}")
+        logger.debug(f"No telemetry files uploaded for {telemetry_export['ods_code']}")
 
 
 def get_ssm_client():
@@ -209,7 +424,14 @@ def get_ssm_client():
 def upload_migrations(s3, migrations):
     metrics_bucket_name = os.environ["METRICS_BUCKET_NAME"]
     write_object_s3(
-        s3, f"s3://{metrics_bucket_name}/migrations.json", json.dumps(migrations))
+        s3, f"s3://{metrics_bucket_name}/migrations.json", json.dumps(migrations, default=record_to_json))
+
+
+def upload_cutover_cube(s3, cutover_cube):
+    metrics_bucket_name = os.environ["METRICS_BUCKET_NAME"]
+    write_object_s3(
+        s3, f"s3://{metrics_bucket_name}/cutover-cube.json",
+        json.dumps(cutover_cube.to_json(), separators=(",", ":")))
 
 
 def calculate_mean_cutover(metrics):
@@ -0,0 +1,67 @@
+"""
+Compares parsing a national-scale ASID lookup file with and without the byte-level ODS prefilter.
+
+    python -m benchmarks.benchmark_csv_prefilter [--rows 100000] [--practices 300]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from io import BytesIO
+
+from chalicelib.asid_lookup_file import index_asids_in_file
+from chalicelib.csv_rows import csv_rows, filtered_csv_rows
+from chalicelib.lookup_all_asids import ASID_LOOKUP_HEADERS
+from tests.builders.file import build_gzip_csv
+
+PRODUCTS = ["SystmOne", "EMIS Web", "Vision 3", "Other Product"]
+
+
+def measure(parse, contents):
+    started = time.perf_counter()
+    result = parse(BytesIO(contents))
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    parse(BytesIO(contents))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def asids_by_product(file_index):
+    # Row positions differ once lines are filtered out, but their order within a file does not
+    return {
+        ods_code: {product: asid for product, (_, asid) in sorted(products.items(), key=lambda item: item[1])}
+        for ods_code, products in file_index.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--practices", type=int, default=300)
+    arguments = parser.parse_args()
+
+    generator = random.Random(0)
+    contents = build_gzip_csv(
+        header=ASID_LOOKUP_HEADERS,
+        rows=[
+            [str(generator.randrange(10 ** 11, 10 ** 12)), f"A{row % 20000:05d}", "\"An Organisation, Ltd\"",
+             "A Supplier", generator.choice(PRODUCTS), "GP Practice", "LS1 4HR"]
+            for row in range(arguments.rows)
+        ])
+    ods_codes = {f"A{practice:05d}" for practice in generator.sample(range(20000), arguments.practices)}
+
+    unfiltered, unfiltered_time, unfiltered_peak = measure(
+        lambda stream: index_asids_in_file(csv_rows(stream), ods_codes), contents)
+    filtered, filtered_time, filtered_peak = measure(
+        lambda stream: index_asids_in_file(filtered_csv_rows(stream, "NACS", ods_codes), ods_codes), contents)
+    assert asids_by_product(filtered) == asids_by_product(unfiltered)
+
+    print(f"{arguments.rows} rows, {len(ods_codes)} ODS codes")
+    print(f"csv_rows:          {unfiltered_time:6.3f}s, peak {unfiltered_peak / 1024:8.0f}KiB")
+    print(f"filtered_csv_rows: {filtered_time:6.3f}s, peak {filtered_peak / 1024:8.0f}KiB "
+          f"({unfiltered_time / filtered_time:4.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
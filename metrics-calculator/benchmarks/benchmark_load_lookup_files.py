@@ -0,0 +1,63 @@
+"""
+Times loading a bucket of national-scale ASID lookup files with an increasing number of workers.
+
+    python -m benchmarks.benchmark_load_lookup_files [--files 24] [--rows 100000]
+"""
+import argparse
+import os
+import random
+import time
+
+import boto3
+from moto import mock_s3
+
+from chalicelib.load_lookup_files import LookupFileParsePool, load_lookup_files
+from chalicelib.lookup_all_asids import ASID_LOOKUP_HEADERS
+from tests.builders.file import build_gzip_csv
+
+PRODUCTS = ["SystmOne", "EMIS Web", "Vision 3", "Other Product"]
+
+
+def build_lookup_file(rows, seed):
+    generator = random.Random(seed)
+    return build_gzip_csv(
+        header=ASID_LOOKUP_HEADERS,
+        rows=[
+            [str(generator.randrange(10 ** 11, 10 ** 12)), f"A{row % 20000:05d}", "An Organisation", "A Supplier",
+             generator.choice(PRODUCTS), "GP Practice", "LS1 4HR"]
+            for row in range(rows)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--rows", type=int, default=100000)
+    arguments = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_s3():
+        s3 = boto3.resource("s3", region_name="us-east-1")
+        bucket = s3.create_bucket(Bucket="benchmark-asid-lookup")
+        for file_number in range(arguments.files):
+            year, month = 2020 + file_number // 12, file_number % 12 + 1
+            bucket.Object(f"{year}/{month}/asidLookup.csv.gz").put(
+                Body=build_lookup_file(arguments.rows, file_number))
+        lookup_file_summaries = list(bucket.objects.all())
+        ods_codes = {f"A{practice:05d}" for practice in range(0, 20000, 50)}
+
+        print(f"{arguments.files} files of {arguments.rows} rows, {len(ods_codes)} ODS codes, "
+              f"{os.cpu_count()} CPUs")
+        baseline = None
+        for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            started = time.perf_counter()
+            with LookupFileParsePool(workers, min_process_bytes=0) as parse_pool:
+                load_lookup_files(lookup_file_summaries, ods_codes, download_workers=workers, parse_pool=parse_pool)
+            elapsed = time.perf_counter() - started
+            baseline = baseline or elapsed
+            print(f"{workers:>3} workers: {elapsed:6.2f}s ({baseline / elapsed:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compares the memory held by migrations parsed from a large occurrences export as plain dicts
+and as Migration records.
+
+    python -m benchmarks.benchmark_migration_records [--migrations 50000]
+"""
+import argparse
+import random
+import tracemalloc
+from datetime import datetime
+
+from chalicelib.migration import Migration
+
+SUPPLIERS = [("10000", "10000-001"), ("10052", "10052-002"), ("10034", "10034-005")]
+
+
+def parsed_fields(migrations):
+    # Fresh strings for every row, as a CSV parser produces them
+    generator = random.Random(0)
+    for row in range(migrations):
+        supplier_id, product_id = generator.choice(SUPPLIERS)
+        yield (f"A{row:05d}", f"NHS CCG {row % 200}", f"Practice {row}", "".join(supplier_id), "".join(product_id),
+               datetime(2021, generator.randint(1, 12), generator.randint(1, 28)))
+
+
+def as_dict(fields):
+    return dict(zip(["ods_code", "ccg_name", "practice_name", "supplier_id", "product_id", "date"], fields))
+
+
+def measure(build, migrations):
+    tracemalloc.start()
+    result = [build(fields) for fields in parsed_fields(migrations)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--migrations", type=int, default=50000)
+    arguments = parser.parse_args()
+
+    dicts, dicts_current, dicts_peak = measure(as_dict, arguments.migrations)
+    records, records_current, records_peak = measure(lambda fields: Migration(*fields), arguments.migrations)
+    assert records == dicts
+
+    print(f"{arguments.migrations} migrations")
+    print(f"dicts:   {dicts_current / 1024:8.0f}KiB held, peak {dicts_peak / 1024:8.0f}KiB")
+    print(f"records: {records_current / 1024:8.0f}KiB held, peak {records_peak / 1024:8.0f}KiB "
+          f"({dicts_current / records_current:4.1f}x less)")
+
+
+if __name__ == "__main__":
+    main()
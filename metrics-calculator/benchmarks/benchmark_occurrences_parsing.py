@@ -0,0 +1,54 @@
+"""
+Compares parsing a large migration occurrences export row by row and column by column.
+
+    python -m benchmarks.benchmark_occurrences_parsing [--rows 50000]
+"""
+import argparse
+import random
+import time
+from io import BytesIO
+
+from chalicelib.csv_rows import csv_rows
+from chalicelib.migration_occurrences import _parse_occurrences_csv, _parse_occurrences_rows
+from tests.builders.file import build_gzip_csv
+
+HEADER = [
+    "Service Recipient ID (e.g. ODS code where this is available)", "Change Status", "Call Off Ordering Party name",
+    "Service Recipient Name", "Supplier ID", "Supplier Name", "Product Name ", "Product ID ",
+    "\"Product Type (Catalogue solution, Additional Service, Associated Service)\"", "M1 planned (Delivery Date)", "",
+    "Actual M1 date", "Buyer verification date (M2)"]
+SUPPLIERS = [("10000", "10000-001"), ("10052", "10052-002"), ("10034", "10034-005"), ("10046", "10046-001")]
+
+
+def measure(parse, contents):
+    started = time.perf_counter()
+    result = parse(BytesIO(contents))
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    arguments = parser.parse_args()
+
+    generator = random.Random(0)
+    rows = []
+    for row in range(arguments.rows):
+        supplier_id, product_id = generator.choice(SUPPLIERS)
+        rows.append([
+            f"A{row:05d}", "Activation", f"NHS CCG {row % 200}", f"Practice {row}", supplier_id, "A Supplier",
+            "A Product", product_id, "Catalogue Solution", "", "",
+            f"{generator.randint(1, 28)}/{generator.randint(1, 12)}/2021", ""])
+    contents = build_gzip_csv(header=HEADER, rows=rows)
+
+    by_row, by_row_time = measure(lambda stream: _parse_occurrences_rows(csv_rows(stream)), contents)
+    by_column, by_column_time = measure(_parse_occurrences_csv, contents)
+    assert by_column == by_row
+
+    print(f"{arguments.rows} rows, {len(by_row)} migrations")
+    print(f"row by row:       {by_row_time:6.3f}s")
+    print(f"column by column: {by_column_time:6.3f}s ({by_row_time / by_column_time:4.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import logging
+import os
+from botocore.exceptions import ClientError
+
+from chalicelib.s3 import read_object_s3, write_object_s3
+
+logger = logging.getLogger("Metrics Calculator")
+
+
+def read_artifact(s3, location):
+    """
+    Reads a previously persisted artifact from either an s3:// URI or a local file path.
+    Returns None when nothing has been persisted there yet.
+    """
+    if _is_s3_uri(location):
+        try:
+            return read_object_s3(s3, location).read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ["NoSuchKey", "404"]:
+                return None
+            raise
+    if not os.path.exists(location):
+        return None
+    with open(location, "rb") as f:
+        return f.read()
+
+
+def write_artifact(s3, location, body):
+    if _is_s3_uri(location):
+        write_object_s3(s3, location, body)
+        return
+    directory = os.path.dirname(location)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_location = f"{location}.partial"
+    with open(temporary_location, "wb") as f:
+        f.write(body)
+    os.replace(temporary_location, location)
+
+
+def _is_s3_uri(location):
+    return location.startswith("s3://")
@@ -0,0 +1,220 @@
+import glob
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from chalicelib.artifact_store import read_artifact, write_artifact
+from chalicelib.asid_lookup_file import PRODUCT_NAMES
+from chalicelib.load_lookup_files import load_lookup_files
+
+logger = logging.getLogger("Metrics Calculator")
+
+ASID_INDEX_VERSION = 1
+
+# Layout: header, length-prefixed JSON table of [key, etag] lookup files (sorted by key, so a
+# file's position in the table is its file id), then fixed width records sorted by NACS.
+_MAGIC = b"ASIDIDX\x00"
+_HEADER = struct.Struct("<8sB32sII")
+_TABLE_LENGTH = struct.Struct("<I")
+_FIELD_WIDTH = 16
+_RECORD = struct.Struct(f"<{_FIELD_WIDTH}sHBB{_FIELD_WIDTH}s")
+_PRODUCTS = list(PRODUCT_NAMES.values())
+
+
+class AsidIndexError(Exception):
+    pass
+
+
+class AsidIndex:
+    """
+    Read-only view over a persisted ASID index. The file is memory-mapped and searched in place,
+    so only the pages holding the requested NACS codes are ever read. Close it, or use it as a
+    context manager, to unmap the file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, self.fingerprint, _, self._record_count = _read_header(self._buffer)
+        table_length, = _TABLE_LENGTH.unpack_from(self._buffer, _HEADER.size)
+        table_offset = _HEADER.size + _TABLE_LENGTH.size
+        self.lookup_files = [
+            tuple(lookup_file) for lookup_file in
+            json.loads(self._buffer[table_offset:table_offset + table_length])]
+        self._records_offset = table_offset + table_length
+        self._cache = {}
+
+    def lookup(self, ods_code):
+        """Returns file id -> PName -> (rank, ASID) for every lookup file that lists the ODS code."""
+        if ods_code in self._cache:
+            return self._cache[ods_code]
+        asids_by_file = {}
+        key = _encode_field(ods_code)
+        if key is not None:
+            index = self._first_record_at_or_after(key)
+            while index < self._record_count:
+                nacs, file_id, rank, product, asid = _RECORD.unpack_from(
+                    self._buffer, self._records_offset + index * _RECORD.size)
+                if nacs != key:
+                    break
+                asids_by_file.setdefault(file_id, {})[_PRODUCTS[product]] = (rank, _decode_field(asid))
+                index += 1
+        self._cache[ods_code] = asids_by_file
+        return asids_by_file
+
+    def file_index(self, file_id, ods_codes):
+        """Returns the same shape as index_asids_in_file for a single lookup file."""
+        file_index = {}
+        for ods_code in ods_codes:
+            asids_by_product = self.lookup(ods_code).get(file_id)
+            if asids_by_product:
+                file_index[ods_code] = asids_by_product
+        return file_index
+
+    @property
+    def closed(self):
+        return self._buffer.closed
+
+    def close(self):
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _first_record_at_or_after(self, key):
+        low, high = 0, self._record_count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._records_offset + middle * _RECORD.size
+            if self._buffer[offset:offset + _FIELD_WIDTH] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def load_asid_index(s3, bucket_name, index_location, cache_directory=None, **loader_options):
+    """
+    Returns an AsidIndex for the current contents of the ASID lookup bucket. The index is keyed
+    by the keys and ETags of the lookup objects: a matching copy in the local cache directory is
+    used as is, a matching copy at index_location is downloaded once, and a stale copy is merged
+    with only the lookup files that were added or changed since it was built. Copies cached for
+    earlier contents of the bucket are deleted when a new one is cached. Lookup files are read
+    with load_lookup_files, which is given any loader_options.
+    """
+    lookup_file_summaries = sorted(s3.Bucket(bucket_name).objects.all(), key=lambda summary: summary.key)
+    lookup_files = [(summary.key, summary.e_tag) for summary in lookup_file_summaries]
+    fingerprint = _fingerprint(lookup_files)
+    cache_directory = cache_directory or tempfile.gettempdir()
+    cache_path = os.path.join(cache_directory, f"asid-index-{fingerprint.hex()}.bin")
+
+    if not os.path.exists(cache_path):
+        contents = read_artifact(s3, index_location)
+        if contents is None or _fingerprint_of(contents) != fingerprint:
+            contents = build_asid_index(lookup_file_summaries, contents, **loader_options)
+            write_artifact(s3, index_location, contents)
+        write_artifact(s3, cache_path, contents)
+        _remove_stale_cache_files(cache_directory, cache_path)
+    return AsidIndex(cache_path)
+
+
+def _remove_stale_cache_files(cache_directory, cache_path):
+    for stale_cache_path in glob.glob(os.path.join(cache_directory, "asid-index-*.bin")):
+        if stale_cache_path != cache_path:
+            logger.debug(f"Removing stale ASID index {stale_cache_path}")
+            os.remove(stale_cache_path)
+
+
+def build_asid_index(lookup_file_summaries, previous_contents=None, **loader_options):
+    lookup_files = [(summary.key, summary.e_tag) for summary in lookup_file_summaries]
+    file_ids = {lookup_file: file_id for file_id, lookup_file in enumerate(lookup_files)}
+    record_runs = []
+    indexed_files = set()
+
+    if previous_contents is not None and _fingerprint_of(previous_contents) is not None:
+        previous_files, previous_records = _read_records(previous_contents)
+        indexed_files = set(previous_files) & set(file_ids)
+        record_runs.append(
+            (nacs, file_ids[previous_files[file_id]], rank, product, asid)
+            for nacs, file_id, rank, product, asid in previous_records
+            if previous_files[file_id] in indexed_files)
+
+    new_file_summaries = [
+        summary for summary in lookup_file_summaries if (summary.key, summary.e_tag) not in indexed_files]
+    logger.debug(f"Indexing {len(new_file_summaries)} new lookup files")
+    new_file_indexes = load_lookup_files(new_file_summaries, **loader_options)
+    for summary, file_index in zip(new_file_summaries, new_file_indexes):
+        record_runs.append(sorted(_records_for_file(file_ids[(summary.key, summary.e_tag)], file_index)))
+
+    records = bytearray()
+    for record in heapq.merge(*record_runs, key=lambda record: record[0]):
+        records += _RECORD.pack(*record)
+
+    table = json.dumps(lookup_files).encode()
+    return b"".join([
+        _HEADER.pack(_MAGIC, ASID_INDEX_VERSION, _fingerprint(lookup_files), len(lookup_files),
+                     len(records) // _RECORD.size),
+        _TABLE_LENGTH.pack(len(table)),
+        table,
+        bytes(records)
+    ])
+
+
+def _records_for_file(file_id, file_index):
+    for ods_code, asids_by_product in file_index.items():
+        nacs = _encode_field(ods_code)
+        ordered_products = sorted(asids_by_product.items(), key=lambda item: item[1][0])
+        for rank, (product_name, (_, asid)) in enumerate(ordered_products):
+            encoded_asid = _encode_field(asid)
+            if nacs is None or encoded_asid is None:
+                logger.warning(f"Skipping ASID {asid} for NACS {ods_code} as it is too long to index")
+                continue
+            yield nacs, file_id, rank, _PRODUCTS.index(product_name), encoded_asid
+
+
+def _read_records(contents):
+    table_length, = _TABLE_LENGTH.unpack_from(contents, _HEADER.size)
+    table_offset = _HEADER.size + _TABLE_LENGTH.size
+    lookup_files = [tuple(lookup_file) for lookup_file in json.loads(contents[table_offset:table_offset + table_length])]
+    records = struct.iter_unpack(_RECORD.format, contents[table_offset + table_length:])
+    return lookup_files, records
+
+
+def _read_header(contents):
+    if len(contents) < _HEADER.size:
+        raise AsidIndexError("ASID index is truncated")
+    header = _HEADER.unpack_from(contents, 0)
+    magic, version = header[0], header[1]
+    if magic != _MAGIC or version != ASID_INDEX_VERSION:
+        raise AsidIndexError(f"Unsupported ASID index version {version}")
+    return header
+
+
+def _fingerprint_of(contents):
+    try:
+        return _read_header(contents)[2]
+    except AsidIndexError:
+        return None
+
+
+def _fingerprint(lookup_files):
+    return hashlib.sha256(json.dumps(lookup_files).encode()).digest()
+
+
+def _encode_field(value):
+    encoded = value.encode()
+    if len(encoded) > _FIELD_WIDTH:
+        return None
+    return encoded.ljust(_FIELD_WIDTH, b"\0")
+
+
+def _decode_field(value):
+    return value.rstrip(b"\0").decode()
@@ -0,0 +1,39 @@
+from io import BytesIO
+
+from chalicelib.csv_rows import csv_rows, filtered_csv_rows
+from chalicelib.product_ids import EMIS_PRODUCT_ID, TPP_PRODUCT_ID, VISION_PRODUCT_ID
+
+PRODUCT_NAMES = {
+    TPP_PRODUCT_ID: "SystmOne",
+    EMIS_PRODUCT_ID: "EMIS Web",
+    VISION_PRODUCT_ID: "Vision 3"
+}
+
+
+def index_asids_in_file(rows, ods_codes=None):
+    """
+    Streams the rows of a single lookup file once, keeping only the products of interest
+    (for the given ODS codes, or for every practice when none are given). The index maps
+    NACS -> PName -> (row position, ASID); later rows replace earlier ones, so the positions
+    record which row was last in the file.
+    """
+    file_index = {}
+    for position, row in enumerate(rows):
+        ods_code = row["NACS"]
+        product_name = row["PName"]
+        if ods_codes is not None and ods_code not in ods_codes:
+            continue
+        if not is_product_of_interest(product_name):
+            continue
+        file_index.setdefault(ods_code, {})[product_name] = (position, row["ASID"])
+    return file_index
+
+
+def index_lookup_file_contents(contents, ods_codes):
+    if ods_codes is None:
+        return index_asids_in_file(csv_rows(BytesIO(contents)))
+    return index_asids_in_file(filtered_csv_rows(BytesIO(contents), "NACS", ods_codes), ods_codes)
+
+
+def is_product_of_interest(product_name):
+    return product_name in PRODUCT_NAMES.values()
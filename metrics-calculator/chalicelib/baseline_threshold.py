@@ -0,0 +1,32 @@
+import numpy as np
+
+# The defaults of Splunk's outlier command, which the threshold used to be calculated with
+OUTLIER_IQR_MULTIPLIER = 2.5
+STANDARD_DEVIATIONS_BELOW_MEAN = 2
+
+
+def calculate_baseline_threshold(days, counts):
+    """
+    The activity threshold for an ASID from its daily message counts over the baseline period:
+    the mean weekday count less two standard deviations, ignoring unusually busy days. days are
+    anything numpy can read as datetime64[D], counts the number of messages on each. Returns NaN
+    when there are fewer than two weekdays to go on, like Splunk's stdev.
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    counts = np.asarray(counts, dtype=np.float64)
+    weekday_counts = counts[np.is_busday(days)]
+    usual_counts = remove_outliers(weekday_counts)
+    if len(usual_counts) < 2:
+        return float("nan")
+    return float(usual_counts.mean() - STANDARD_DEVIATIONS_BELOW_MEAN * usual_counts.std(ddof=1))
+
+
+def remove_outliers(counts, iqr_multiplier=OUTLIER_IQR_MULTIPLIER):
+    """
+    Drops counts more than iqr_multiplier times the interquartile range above the upper quartile,
+    as `outlier action=remove` does by default. Quiet days are kept.
+    """
+    if len(counts) == 0:
+        return counts
+    lower_quartile, upper_quartile = np.percentile(counts, [25, 75])
+    return counts[counts <= upper_quartile + iqr_multiplier * (upper_quartile - lower_quartile)]
@@ -0,0 +1,114 @@
+import csv
+import io
+import logging
+from datetime import date, datetime
+
+from chalicelib.get_data_from_splunk import make_splunk_request, convert_to_lines, SplunkParseError
+
+logger = logging.getLogger("Metrics Calculator")
+
+DEFAULT_SPLUNK_QUERY_BATCH_SIZE = 1
+
+
+def group_overlapping_date_ranges(date_ranges, max_group_size):
+    """
+    Groups the indexes of date_ranges so that every range in a group overlaps all the others,
+    with at most max_group_size in each. A search over the ranges in a group then scans no more
+    than twice the length of its longest range.
+    """
+    groups = []
+    group_end_date = None
+    for index in sorted(range(len(date_ranges)), key=lambda i: date_ranges[i]["start_date"]):
+        date_range = date_ranges[index]
+        if groups and len(groups[-1]) < max_group_size and date_range["start_date"] <= group_end_date:
+            groups[-1].append(index)
+            group_end_date = min(group_end_date, date_range["end_date"])
+        else:
+            groups.append([index])
+            group_end_date = date_range["end_date"]
+    return groups
+
+
+def get_telemetry_batch_from_splunk(splunk_host, token, asid_date_ranges):
+    """
+    Telemetry for several (asid, date_range) pairs from a single search, split into the CSV
+    get_telemetry_stream_from_splunk streams for each pair, in the same order. Weekends are dropped
+    here rather than in the search so that an ASID with no messages at all in its date range
+    gets no telemetry, as it would from a search of its own.
+    """
+    asids = list(dict.fromkeys(asid for asid, _ in asid_date_ranges))
+    search_text = f"""search index="spine2vfmmonitor" messageSender IN ({", ".join(asids)})
+| timechart span=1d limit=0 useother=false count by messageSender
+| fillnull
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)"""
+    rows = _get_rows_from_splunk(splunk_host, token, asid_date_ranges, search_text)
+
+    batch_telemetry = []
+    for asid, date_range in asid_date_ranges:
+        days = [(row["_time"], int(row.get(asid) or 0)) for row in rows if _in_date_range(row, date_range)]
+        if not any(count for _, count in days):
+            batch_telemetry.append(b"")
+            continue
+        batch_telemetry.append(_telemetry_csv(
+            (time, count) for time, count in days if _parse_date(time).weekday() < 5))
+    return batch_telemetry
+
+
+def get_baseline_telemetry_batch_from_splunk(splunk_host, token, asid_date_ranges):
+    """
+    Baseline telemetry for several (asid, date_range) pairs from a single search, split into
+    the CSV get_baseline_telemetry_from_splunk returns for each pair, in the same order.
+    """
+    asids = list(dict.fromkeys(asid for asid, _ in asid_date_ranges))
+    search_text = f"""search index="spine2vfmmonitor" messageSender IN ({", ".join(asids)})
+| bucket span=1d _time
+| stats count by _time, messageSender
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)"""
+    rows = _get_rows_from_splunk(splunk_host, token, asid_date_ranges, search_text)
+
+    return [
+        _telemetry_csv(
+            (row["_time"], row["count"]) for row in rows
+            if row.get("messageSender") == asid and _in_date_range(row, date_range))
+        for asid, date_range in asid_date_ranges
+    ]
+
+
+def _get_rows_from_splunk(splunk_host, token, asid_date_ranges, search_text):
+    date_range = {
+        "start_date": min(date_range["start_date"] for _, date_range in asid_date_ranges),
+        "end_date": max(date_range["end_date"] for _, date_range in asid_date_ranges)
+    }
+    telemetry = make_splunk_request(splunk_host, token, date_range, search_text)
+    if not telemetry:
+        logger.debug("Retrying splunk query")
+        telemetry = make_splunk_request(splunk_host, token, date_range, search_text)
+    try:
+        return list(csv.DictReader(convert_to_lines(telemetry)))
+    except csv.Error as exception:
+        raise SplunkParseError from exception
+
+
+def _in_date_range(row, date_range):
+    try:
+        day = _parse_date(row["_time"])
+    except (KeyError, AttributeError, ValueError) as exception:
+        raise SplunkParseError from exception
+    return _as_date(date_range["start_date"]) <= day <= _as_date(date_range["end_date"])
+
+
+def _parse_date(time):
+    return date.fromisoformat(time.strip()[:len("YYYY-MM-DD")])
+
+
+def _as_date(day):
+    return day.date() if isinstance(day, datetime) else day
+
+
+def _telemetry_csv(days):
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerows(days)
+    if output.tell() == 0:
+        return b""
+    return ("_time,count\n" + output.getvalue()).encode()
@@ -1,8 +1,142 @@
 import csv
 import gzip
+import re
+
+# The same size of read as csv_rows makes through gzip's text mode. Larger reads save little
+# time, but each chunk is copied as it's joined to the unmatched data left from the last one.
+_CHUNK_SIZE = 8 * 1024
 
 
 def csv_rows(stream):
     with gzip.open(stream, mode="rt") as f:
         input_csv = csv.DictReader(f)
         yield from input_csv
+
+
+def filtered_csv_rows(stream, column, values):
+    """
+    Like csv_rows, but only yields rows whose value in the given column may be one of values.
+    The decompressed bytes are searched for candidate records with a single automaton of the
+    wanted values, so the records that are skipped are never decoded or parsed. Records that
+    can't be matched without parsing them (a quoted field before or in the column) are passed
+    through, so callers still need to check the column themselves.
+    """
+    with gzip.open(stream, mode="rb") as f:
+        header, data = _read_header(f)
+        if header is None:
+            return
+        column_names = next(csv.reader([header.decode()]))
+        if column in column_names:
+            pattern = _candidate_record_pattern(column_names.index(column), values)
+        else:
+            pattern = _ANY_RECORD
+        records = _matching_records(f, data, pattern)
+        input_csv = csv.DictReader(_decode(record) for record in _prepend(header, records))
+        yield from input_csv
+
+
+# Patterns match from the newline before a record, which lets the regex engine skip ahead to
+# each line start rather than trying a match at every position.
+_ANY_RECORD = re.compile(rb"\n(?=[^\n])")
+
+
+def _candidate_record_pattern(index, values):
+    field = rb"[^,\n\"]*"
+    return re.compile(
+        rb"\n(?:(?:" + field + rb",){%d}(?:" % index
+        + _trie_pattern(value.encode() for value in values) + rb"(?=[,\r\n]|\Z)|" + field + rb"\")"
+        + rb"|(?:" + field + rb",){0,%d}" % max(index - 1, 0) + field + rb"\")")
+
+
+def _trie_pattern(values):
+    trie = {}
+    for value in values:
+        node = trie
+        for byte in value:
+            node = node.setdefault(byte, {})
+        node[None] = {}
+    if not trie:
+        return rb"(?!)"
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    branches = [re.escape(bytes([byte])) + _node_pattern(child) for byte, child in node.items() if byte is not None]
+    if not branches:
+        return b""
+    pattern = b"(?:" + b"|".join(branches) + b")"
+    if None in node:
+        pattern += b"?"
+    return pattern
+
+
+def _read_header(f):
+    data = b""
+    while True:
+        data = data.lstrip(b"\r\n")
+        end = data.find(b"\n")
+        if end != -1:
+            return data[:end].removesuffix(b"\r"), data[end:]
+        chunk = f.read(_CHUNK_SIZE)
+        if not chunk:
+            return (data or None), b"\n"
+        data += chunk
+
+
+def _matching_records(f, data, pattern):
+    """
+    Yields the records in the rest of the file (data starts with the newline before the first
+    one) that start with a match for pattern. Quotes are
+    counted between matches, so lines inside a quoted field never count as the start of a
+    record and a matching record spanning several lines is yielded whole.
+    """
+    final, quoted = False, False
+    while not final:
+        chunk = f.read(_CHUNK_SIZE)
+        final = not chunk
+        data += chunk
+        end = len(data) if final else data.rfind(b"\n")
+        if end <= 0:
+            continue
+        position = 0
+        for match in pattern.finditer(data, 0, end):
+            start = match.start() + 1
+            if start < position:
+                continue
+            quoted ^= data.count(b"\"", position, start) % 2 == 1
+            position = start
+            if quoted:
+                continue
+            record_end = _record_end(data, start, end)
+            if record_end is None:
+                position, quoted = start - 1, False
+                break
+            yield data[start:record_end]
+            position = record_end
+        else:
+            quoted ^= data.count(b"\"", position, end) % 2 == 1
+            position = end
+        data = data[position:]
+
+
+def _record_end(data, start, end):
+    record_end = data.find(b"\n", start, end)
+    quotes = data.count(b"\"", start, end if record_end == -1 else record_end)
+    while quotes % 2 == 1 and record_end != -1:
+        next_end = data.find(b"\n", record_end + 1, end)
+        quotes += data.count(b"\"", record_end, end if next_end == -1 else next_end)
+        record_end = next_end
+    if record_end == -1:
+        return end if end == len(data) else None
+    return record_end
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def _decode(record):
+    if b"\r" in record:
+        record = record.replace(b"\r\n", b"\n").removesuffix(b"\r")
+    return record.decode()
@@ -0,0 +1,97 @@
+from chalicelib.duration_sketch import DurationSketch
+
+CUTOVER_CUBE_VERSION = 1
+CUTOVER_CUBE_DIMENSIONS = ["month", "ccg_name", "source_system", "target_system"]
+
+
+class CutoverCubeError(Exception):
+    pass
+
+
+class CutoverCube:
+    """
+    Cutover durations aggregated by migration month, CCG and source and target system. Each cell
+    keeps the count, sum and sum of squares of its durations along with a DurationSketch, so
+    any slice of the cube can be summarised (mean, variance, quantiles) by merging its cells,
+    and cubes built by separate runs can be merged without going back to the telemetry.
+    """
+    __slots__ = ("_cells",)
+
+    def __init__(self):
+        self._cells = {}
+
+    def add(self, migration_date, metric):
+        key = (migration_date.strftime("%Y-%m"), metric["ccg_name"], metric["source_system"], metric["target_system"])
+        cell = self._cells.get(key)
+        if cell is None:
+            cell = self._cells[key] = _CutoverCubeCell()
+        cell.add(metric["cutover_duration"])
+
+    def merge(self, other):
+        for key, cell in other._cells.items():
+            self._cells.setdefault(key, _CutoverCubeCell()).merge(cell)
+        return self
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __eq__(self, other):
+        return isinstance(other, CutoverCube) and self._cells == other._cells
+
+    def to_json(self):
+        """
+        The cube with each dimension's values listed once, and a row per cell of the indexes of
+        its dimension values followed by count, sum, sum of squares and the sketch's histogram.
+        """
+        values = [{} for _ in CUTOVER_CUBE_DIMENSIONS]
+        cells = []
+        for key, cell in self._cells.items():
+            indexes = [dimension_values.setdefault(value, len(dimension_values))
+                       for dimension_values, value in zip(values, key)]
+            cells.append(indexes + [cell.count, cell.total, cell.total_of_squares, cell.durations.to_json()])
+        return {
+            "version": CUTOVER_CUBE_VERSION,
+            "dimensions": CUTOVER_CUBE_DIMENSIONS,
+            "values": [list(dimension_values) for dimension_values in values],
+            "cells": cells
+        }
+
+    @classmethod
+    def from_json(cls, cube_json):
+        if cube_json.get("version") != CUTOVER_CUBE_VERSION or cube_json.get("dimensions") != CUTOVER_CUBE_DIMENSIONS:
+            raise CutoverCubeError(f"Unsupported cutover cube version {cube_json.get('version')}")
+        values = cube_json["values"]
+        cube = cls()
+        dimension_count = len(CUTOVER_CUBE_DIMENSIONS)
+        for row in cube_json["cells"]:
+            key = tuple(values[dimension][index] for dimension, index in enumerate(row[:dimension_count]))
+            cell = cube._cells.setdefault(key, _CutoverCubeCell())
+            cell.merge(_CutoverCubeCell(DurationSketch.from_json(row[-1])))
+        return cube
+
+
+class _CutoverCubeCell:
+    __slots__ = ("durations", "total_of_squares")
+
+    def __init__(self, durations=None):
+        self.durations = durations or DurationSketch()
+        self.total_of_squares = sum(duration * duration * count for duration, count in self.durations.to_json())
+
+    @property
+    def count(self):
+        return self.durations.count
+
+    @property
+    def total(self):
+        return self.durations.total
+
+    def add(self, duration):
+        self.durations.add(duration)
+        self.total_of_squares += duration * duration
+
+    def merge(self, other):
+        self.durations.merge(other.durations)
+        self.total_of_squares += other.total_of_squares
+
+    def __eq__(self, other):
+        return isinstance(other, _CutoverCubeCell) and self.durations == other.durations
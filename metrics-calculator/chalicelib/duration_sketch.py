@@ -0,0 +1,78 @@
+from math import ceil, floor
+
+
+class DurationSketch:
+    """
+    A histogram of cutover durations in whole days, from which the count, mean, minimum,
+    maximum and quantiles can be read. The telemetry windows limit durations to a few weeks
+    either side of zero, so it holds at most a few dozen counts however many durations are
+    added, and it is exact. Sketches from separate runs are merged by adding their counts.
+    """
+    __slots__ = ("_counts", "count", "total")
+
+    def __init__(self, counts=None):
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        for duration, count in (counts or {}).items():
+            self.add(duration, count)
+
+    def add(self, duration, count=1):
+        if duration != int(duration):
+            raise ValueError(f"Cutover duration {duration} is not a whole number of days")
+        duration = int(duration)
+        self._counts[duration] = self._counts.get(duration, 0) + count
+        self.count += count
+        self.total += duration * count
+
+    def merge(self, other):
+        for duration, count in other._counts.items():
+            self.add(duration, count)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count
+
+    @property
+    def min(self):
+        return min(self._counts)
+
+    @property
+    def max(self):
+        return max(self._counts)
+
+    def quantile(self, q):
+        """
+        The q-quantile, interpolating linearly between the two nearest durations as numpy's
+        percentile does by default, so quantile(0.5) is the usual median.
+        """
+        position = (self.count - 1) * q
+        lower = self._duration_at(floor(position))
+        upper = self._duration_at(ceil(position))
+        return lower + (upper - lower) * (position - floor(position))
+
+    def _duration_at(self, rank):
+        seen = 0
+        for duration in sorted(self._counts):
+            seen += self._counts[duration]
+            if rank < seen:
+                return duration
+        raise IndexError(f"No duration at rank {rank} of {self.count}")
+
+    def to_json(self):
+        """The histogram as [duration, count] pairs in order of duration."""
+        return [[duration, self._counts[duration]] for duration in sorted(self._counts)]
+
+    @classmethod
+    def from_json(cls, pairs):
+        sketch = cls()
+        for duration, count in pairs:
+            sketch.add(duration, count)
+        return sketch
+
+    def __eq__(self, other):
+        return isinstance(other, DurationSketch) and self._counts == other._counts
+
+    def __repr__(self):
+        return f"DurationSketch({self._counts!r})"
@@ -1,8 +1,22 @@
 import csv
+import gzip
+import io
 import logging
+import zlib
 from http.client import HTTPSConnection
+from threading import Lock
 import urllib.parse
 
+import numpy as np
+
+from chalicelib.baseline_threshold import calculate_baseline_threshold
+from chalicelib.gzip_stream import GzipCompressingReader
+from chalicelib.splunk_connection_pool import SplunkConnectionPool
+
+DEFAULT_SPLUNK_CONNECTION_POOL_SIZE = 12
+DEFAULT_SPLUNK_CONNECTION_IDLE_TIMEOUT = 30
+SPLUNK_STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class SplunkQueryError(RuntimeError):
     pass
@@ -18,35 +32,42 @@ class SplunkTelemetryMissing(Exception):
 
 logger = logging.getLogger("Metrics Calculator")
 
+_connection_pools = {}
+_connection_pool_options = {
+    "size": DEFAULT_SPLUNK_CONNECTION_POOL_SIZE, "idle_timeout": DEFAULT_SPLUNK_CONNECTION_IDLE_TIMEOUT}
+_connection_pools_lock = Lock()
 
-def get_telemetry_from_splunk(splunk_host, token, asid, date_range, baseline_threshold):
-    search_text = f"""search index="spine2vfmmonitor" messageSender={asid}
+
+def get_telemetry_stream_from_splunk(splunk_host, token, asid, date_range):
+    """
+    The daily message counts for an ASID on weekdays in the date range, as a gzip-compressed CSV
+    stream to be read from the response as it arrives and then closed, or None if there isn't
+    any. An empty response is retried once.
+    """
+    search_text = _telemetry_search_text(asid)
+    telemetry_stream = open_splunk_request(
+        splunk_host, token, date_range, search_text)
+    if telemetry_stream is None:
+        logger.debug("Retrying splunk query")
+        telemetry_stream = open_splunk_request(
+            splunk_host, token, date_range, search_text)
+    return telemetry_stream
+
+
+def _telemetry_search_text(asid):
+    return f"""search index="spine2vfmmonitor" messageSender={asid}
 | timechart span=1d count
 | fillnull
 | eval day_of_week = strftime(_time,"%A")
 | where NOT (day_of_week="Saturday" OR day_of_week="Sunday")
-| eval avgmin2std={baseline_threshold}
 | fields - day_of_week
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)"""
-    telemetry = make_splunk_request(
-        splunk_host, token, date_range, search_text)
-    if not telemetry:
-        logger.debug("Retrying splunk query")
-        telemetry = make_splunk_request(
-            splunk_host, token, date_range, search_text)
-    return telemetry
 
 
 def get_baseline_telemetry_from_splunk(splunk_host, token, asid, baseline_date_range):
     search_text = f"""search index="spine2vfmmonitor" messageSender={asid}
 | bucket span=1d _time
-| eval day_of_week = strftime(_time,"%A")
-| where NOT (day_of_week="Saturday" OR day_of_week="Sunday")
 | stats count by _time
-| outlier action=remove
-| eventstats avg(count) as average stdev(count) as stdd
-| eval avgmin2std=average-(stdd*2)
-| fields - stdd
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)"""
     telemetry = make_splunk_request(
         splunk_host, token, baseline_date_range, search_text)
@@ -58,41 +79,159 @@ def get_baseline_telemetry_from_splunk(splunk_host, token, asid, baseline_date_r
 
 
 def make_splunk_request(splunk_host, token, date_range, search_text):
-    connection = HTTPSConnection(splunk_host)
-    connection.connect()
+    response = _get_connection_pool(splunk_host).open(
+        'POST', "/services/search/jobs/export", *_splunk_request(token, date_range, search_text))
+    try:
+        status, response_body = response.status, response.read()
+    finally:
+        response.close()
+
+    if status != 200:
+        raise SplunkQueryError(
+            f"Splunk request returned a {status} code with body {response_body}")
+    if _is_gzipped(response) and response_body:
+        try:
+            return gzip.decompress(response_body)
+        except (OSError, EOFError, zlib.error) as exception:
+            raise SplunkParseError from exception
+    return response_body
+
+
+def open_splunk_request(splunk_host, token, date_range, search_text):
+    """
+    Like make_splunk_request, but returns the response body as a gzip-compressed stream to be
+    read as it arrives, or None if the body is empty. A body Splunk sent gzipped is passed
+    through as it is, with only its first few bytes decompressed to check it isn't empty; any
+    other body is compressed as it's read.
+    """
+    response = _get_connection_pool(splunk_host).open(
+        'POST', "/services/search/jobs/export", *_splunk_request(token, date_range, search_text))
+    try:
+        if response.status != 200:
+            raise SplunkQueryError(
+                f"Splunk request returned a {response.status} code with body {response.read()}")
+        gzipped = _is_gzipped(response)
+        first_chunk = _read_first_chunk(response, gzipped)
+    except BaseException:
+        response.close()
+        raise
+    if not first_chunk:
+        response.close()
+        return None
+    response_stream = SplunkResponseStream(response, first_chunk)
+    return response_stream if gzipped else GzipCompressingReader(response_stream)
+
+
+def _is_gzipped(response):
+    return response.getheader("Content-Encoding", "").strip().lower() == "gzip"
+
+
+def _read_first_chunk(response, gzipped):
+    """
+    The start of the response body, or nothing if the body is empty. For a gzipped body, just
+    enough of it is read to decompress one byte.
+    """
+    chunk = response.read(SPLUNK_STREAM_CHUNK_SIZE)
+    if not gzipped:
+        return chunk
+    first_chunk = chunk
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while chunk:
+        try:
+            if decompressor.decompress(chunk, 1):
+                return first_chunk
+        except zlib.error as exception:
+            raise SplunkParseError from exception
+        chunk = response.read(SPLUNK_STREAM_CHUNK_SIZE)
+        first_chunk += chunk
+    return b""
+
+
+class SplunkResponseStream(io.RawIOBase):
+    """A Splunk response body, starting with the chunk read to check it wasn't empty."""
+
+    def __init__(self, response, first_chunk):
+        self._response = response
+        self._first_chunk = memoryview(first_chunk)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._first_chunk:
+            size = min(len(buffer), len(self._first_chunk))
+            buffer[:size] = self._first_chunk[:size]
+            self._first_chunk = self._first_chunk[size:]
+            return size
+        chunk = self._response.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+        super().close()
+
+
+def _splunk_request(token, date_range, search_text):
     request_body = urllib.parse.urlencode({
         "output_mode": "csv",
         "earliest_time": date_range["start_date"].strftime("%Y-%m-%dT00:00:00"),
         "latest_time": date_range["end_date"].strftime("%Y-%m-%dT24:00:00"),
         "search": search_text
     })
-    headers = {"Authorization": f"Bearer {token}"}
-    connection.request(
-        'POST', "/services/search/jobs/export", request_body, headers)
+    headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+    return request_body, headers
 
-    response = connection.getresponse()
-    if response.status != 200:
-        raise SplunkQueryError(
-            f"Splunk request returned a {response.status} code with body {response.read()}")
-    return response.read()
+
+def configure_splunk_connections(pool_size=DEFAULT_SPLUNK_CONNECTION_POOL_SIZE,
+                                 idle_timeout=DEFAULT_SPLUNK_CONNECTION_IDLE_TIMEOUT):
+    """
+    Sets how many idle connections are kept open to each Splunk host and for how many seconds,
+    closing any open connections.
+    """
+    close_splunk_connections()
+    with _connection_pools_lock:
+        _connection_pool_options.update(size=pool_size, idle_timeout=idle_timeout)
+
+
+def close_splunk_connections():
+    with _connection_pools_lock:
+        connection_pools = list(_connection_pools.values())
+        _connection_pools.clear()
+    for connection_pool in connection_pools:
+        connection_pool.close()
+
+
+def _get_connection_pool(splunk_host):
+    with _connection_pools_lock:
+        connection_pool = _connection_pools.get(splunk_host)
+        if connection_pool is None:
+            connection_pool = _connection_pools[splunk_host] = SplunkConnectionPool(
+                lambda: HTTPSConnection(splunk_host), **_connection_pool_options)
+        return connection_pool
 
 
 def parse_threshold_from_telemetry(telemetry):
+    """Calculates the baseline threshold from the daily counts in baseline telemetry."""
     lines = convert_to_lines(telemetry)
     if len(lines) == 0 or len(lines) == 1:
         raise SplunkTelemetryMissing(f"Telemetry received: \"{lines}\"")
-    threshold = extract_threshold(lines)
-    if float(threshold) <= 0:
+    days, counts = extract_daily_counts(lines)
+    if not np.is_busday(days).any():
+        raise SplunkTelemetryMissing(f"No weekday telemetry received: \"{lines}\"")
+    threshold = calculate_baseline_threshold(days, counts)
+    if not threshold > 0:
         raise ValueError("Threshold is not a positive value")
     return threshold
 
 
-def extract_threshold(lines):
+def extract_daily_counts(lines):
     try:
-        csv_reader = csv.DictReader(lines)
-        first_row = next(csv_reader)
-        threshold = first_row["avgmin2std"]
-        return threshold
+        rows = list(csv.DictReader(lines))
+        days = np.array([row["_time"].strip()[:len("YYYY-MM-DD")] for row in rows], dtype="datetime64[D]")
+        counts = np.array([row["count"] for row in rows], dtype=np.int64)
+        return days, counts
     except Exception as exception:
         raise SplunkParseError from exception
 
@@ -1,4 +1,11 @@
-from chalicelib.csv_rows import csv_rows
+import logging
+
+from botocore.exceptions import ClientError
+
+from chalicelib.csv_rows import filtered_csv_rows
+from chalicelib.s3 import select_csv_rows_s3
+
+logger = logging.getLogger("Metrics Calculator")
 
 
 class PatientRegistrationsError(Exception):
@@ -9,23 +16,79 @@ PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS = [
     "PUBLICATION", "EXTRACT_DATE", "TYPE", "CCG_CODE", "ONS_CCG_CODE", "CODE", "POSTCODE", "SEX", "AGE", "NUMBER_OF_PATIENTS"]
 
 
-def get_patient_registration_count(s3, bucket_name, migration):
+def lookup_all_patient_registration_counts(s3, bucket_name, migrations, use_s3_select=False):
+    """
+    Reads the registration data for each month with a migration once, keeping the rows for
+    every practice migrating that month. Returns month prefix -> ODS code -> number of patients,
+    leaving out months that have no data in the bucket. With use_s3_select, only those rows are
+    read using S3 Select, falling back to downloading the whole file if the query is rejected.
+    """
+    ods_codes_by_month = {}
+    for migration in migrations:
+        ods_codes_by_month.setdefault(_month_prefix(migration["date"]), set()).add(migration["ods_code"])
+
+    keys = sorted(summary.key for summary in s3.Bucket(bucket_name).objects.all())
+    result = {}
+    for month, ods_codes in ods_codes_by_month.items():
+        registration_data_key = find_registration_data_key(keys, month)
+        if registration_data_key is None:
+            continue
+        registration_data = s3.Object(bucket_name, registration_data_key)
+        registration_counts = None
+        if use_s3_select:
+            registration_counts = _select_registration_counts(registration_data, ods_codes)
+        if registration_counts is None:
+            registration_counts = _read_registration_counts(registration_data.get()["Body"], ods_codes)
+        result[month] = registration_counts
+    return result
+
+
+def find_registration_data_key(sorted_keys, month):
+    """The key of the registration data used for a month prefix (e.g. "april-2021"), if any."""
+    return next((key for key in sorted_keys if key.startswith(month)), None)
+
+
+def registration_month(migration):
+    return _month_prefix(migration["date"])
+
+
+def get_patient_registration_count(registration_counts, migration):
     ods_code = migration["ods_code"]
-    migration_date = migration["date"]
-    migration_date_as_string = migration_date.strftime("%B-%Y").lower()
-    patient_registrations_bucket = s3.Bucket(bucket_name)
-    patient_registration_count = 0
-    migration_month_data = list(
-        patient_registrations_bucket.objects.filter(Prefix=migration_date_as_string, MaxKeys=1))
-    if len(migration_month_data) == 0:
+    migration_date_as_string = _month_prefix(migration["date"])
+    if migration_date_as_string not in registration_counts:
         raise PatientRegistrationsError(f"Data for {migration_date_as_string} not found")
-    rows = list(csv_rows(migration_month_data[0].get()["Body"]))
-    for row in rows:
-        if ods_code == row["CODE"]:
-            patient_registration_count = row["NUMBER_OF_PATIENTS"]
-            break
+    patient_registration_count = registration_counts[migration_date_as_string].get(ods_code)
 
     if patient_registration_count:
         return int(patient_registration_count)
     else:
-        raise PatientRegistrationsError(f"ODS code {ods_code} not found")
\ No newline at end of file
+        raise PatientRegistrationsError(f"ODS code {ods_code} not found")
+
+
+def _select_registration_counts(registration_data, ods_codes):
+    try:
+        return _registration_counts_from_rows(
+            select_csv_rows_s3(registration_data, "CODE", ods_codes, ["CODE", "NUMBER_OF_PATIENTS"]), ods_codes)
+    except ClientError:
+        logger.warning(
+            f"Couldn't select from registration data {registration_data.key}, downloading it instead", exc_info=True)
+        return None
+
+
+def _read_registration_counts(body, ods_codes):
+    return _registration_counts_from_rows(filtered_csv_rows(body, "CODE", ods_codes), ods_codes)
+
+
+def _registration_counts_from_rows(rows, ods_codes):
+    registration_counts = {}
+    for row in rows:
+        ods_code = row["CODE"]
+        if ods_code in ods_codes and ods_code not in registration_counts:
+            registration_counts[ods_code] = row["NUMBER_OF_PATIENTS"]
+            if len(registration_counts) == len(ods_codes):
+                break
+    return registration_counts
+
+
+def _month_prefix(migration_date):
+    return migration_date.strftime("%B-%Y").lower()
@@ -0,0 +1,41 @@
+import io
+import zlib
+
+DEFAULT_GZIP_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class GzipCompressingReader(io.RawIOBase):
+    """
+    Reads another stream gzip-compressed, compressing it a chunk at a time as it's read so that
+    only a chunk of it is ever held in memory. Like other raw streams, a read can return fewer
+    bytes than asked for; wrap it in an io.BufferedReader where that matters. Closing it closes
+    the other stream.
+    """
+
+    def __init__(self, stream, chunk_size=DEFAULT_GZIP_STREAM_CHUNK_SIZE, compresslevel=9):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._compressed = memoryview(b"")
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._compressed and not self._finished:
+            chunk = self._stream.read(self._chunk_size)
+            if chunk:
+                self._compressed = memoryview(self._compressor.compress(chunk))
+            else:
+                self._compressed = memoryview(self._compressor.flush())
+                self._finished = True
+        size = min(len(buffer), len(self._compressed))
+        buffer[:size] = self._compressed[:size]
+        self._compressed = self._compressed[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        super().close()
@@ -0,0 +1,45 @@
+import hashlib
+import logging
+
+from botocore.exceptions import ClientError
+
+from chalicelib.s3 import read_object_s3, write_object_s3
+
+logger = logging.getLogger("Metrics Calculator")
+
+# Bump this whenever a change to the calculator changes its output for the same inputs
+INPUT_FINGERPRINT_VERSION = 1
+
+
+def calculate_input_fingerprint(object_etags_by_bucket):
+    """
+    A digest of the key and ETag of every object in the input buckets, given as bucket name ->
+    key -> ETag. It changes whenever an object is added, removed or replaced.
+    """
+    digest = hashlib.sha256(f"{INPUT_FINGERPRINT_VERSION}\n".encode())
+    for bucket_name in sorted(object_etags_by_bucket):
+        object_etags = object_etags_by_bucket[bucket_name]
+        for key in sorted(object_etags):
+            digest.update(f"{bucket_name}\t{key}\t{object_etags[key]}\n".encode())
+    return digest.hexdigest()
+
+
+def read_input_fingerprint(s3, object_uri):
+    """
+    The fingerprint stored at object_uri, or None if there isn't one. Without s3:ListBucket a
+    missing object is reported as AccessDenied, so that too is treated as no fingerprint, and
+    the metrics are calculated rather than the run failing.
+    """
+    try:
+        return read_object_s3(s3, object_uri).read().decode("utf-8")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ["NoSuchKey", "404"]:
+            return None
+        if e.response["Error"]["Code"] in ["AccessDenied", "403"]:
+            logger.warning(f"Couldn't read input fingerprint at {object_uri}, calculating metrics anyway")
+            return None
+        raise
+
+
+def write_input_fingerprint(s3, object_uri, input_fingerprint):
+    write_object_s3(s3, object_uri, input_fingerprint.encode("utf-8"))
@@ -0,0 +1,141 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from chalicelib.asid_lookup_file import index_asids_in_file, index_lookup_file_contents
+from chalicelib.s3 import select_csv_rows_s3
+
+logger = logging.getLogger("Metrics Calculator")
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+DEFAULT_MAX_BUFFERED_BYTES = 256 * 1024 * 1024
+# Starting workers takes 0.1-0.2s and indexing the rows for a set of ODS codes about 0.1s per
+# MiB of compressed lookup file, so below this the pool costs more than it saves
+DEFAULT_MIN_PROCESS_PARSE_BYTES = 8 * 1024 * 1024
+
+
+def load_lookup_files(lookup_files, ods_codes=None, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                      parse_pool=None, max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES, use_s3_select=False):
+    """
+    Downloads ASID lookup files on a bounded thread pool and decompresses and indexes them with
+    parse_pool, returning one file index per lookup file in the order they were given. Without
+    a parse_pool, one with the default settings is used for just this call.
+
+    At most max_buffered_bytes of compressed lookup files are held in memory waiting to be
+    indexed; a single file larger than that is still loaded, on its own.
+
+    With use_s3_select, only the rows for the given ODS codes are read from each file with
+    S3 Select, falling back to downloading the whole file if the query is rejected.
+    """
+    lookup_files = list(lookup_files)
+    if len(lookup_files) == 0:
+        return []
+    if parse_pool is None:
+        with LookupFileParsePool() as parse_pool:
+            return load_lookup_files(
+                lookup_files, ods_codes, download_workers, parse_pool, max_buffered_bytes, use_s3_select)
+    buffered_bytes = _ByteBudget(max_buffered_bytes)
+    if not use_s3_select or ods_codes is None:
+        parse_pool.start_for(sum(lookup_file.size for lookup_file in lookup_files))
+
+    with ThreadPoolExecutor(max_workers=max(1, download_workers)) as download_pool:
+        def load(lookup_file):
+            if use_s3_select and ods_codes is not None:
+                file_index = select_lookup_file_index(lookup_file, ods_codes)
+                if file_index is not None:
+                    return file_index
+            size = lookup_file.size
+            buffered_bytes.acquire(size)
+            try:
+                response = lookup_file.meta.client.get_object(Bucket=lookup_file.bucket_name, Key=lookup_file.key)
+                return parse_pool.index(response["Body"].read(), ods_codes)
+            finally:
+                buffered_bytes.release(size)
+
+        return list(download_pool.map(load, lookup_files))
+
+
+def select_lookup_file_index(lookup_file, ods_codes):
+    try:
+        return index_asids_in_file(
+            select_csv_rows_s3(lookup_file, "NACS", ods_codes, ["NACS", "PName", "ASID"]), ods_codes)
+    except ClientError:
+        logger.warning(f"Couldn't select from lookup file {lookup_file.key}, downloading it instead", exc_info=True)
+        return None
+
+
+class _ByteBudget:
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._used_bytes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._used_bytes == 0 or self._used_bytes + size <= self._max_bytes)
+            self._used_bytes += size
+
+    def release(self, size):
+        with self._condition:
+            self._used_bytes -= size
+            self._condition.notify_all()
+
+
+class LookupFileParsePool:
+    """
+    Indexes downloaded lookup files, on a process pool once there is enough to index to repay
+    starting one. The workers are started by the first load_lookup_files call given at least
+    min_process_bytes of lookup files, and are then shared by every later call made with this
+    pool, so that reading lookup files over several rounds starts them at most once. Until then,
+    and where the platform does not support process pools (e.g. AWS Lambda, which has no
+    /dev/shm), files are indexed on the download threads, where zlib still releases the GIL
+    while decompressing. workers defaults to the number of CPUs; with fewer than two, files are
+    always indexed on the download threads.
+    """
+
+    def __init__(self, workers=None, min_process_bytes=DEFAULT_MIN_PROCESS_PARSE_BYTES):
+        self._workers = (os.cpu_count() or 1) if workers is None else workers
+        self._min_process_bytes = min_process_bytes
+        self._executor = None
+
+    def start_for(self, total_bytes):
+        if self._executor is not None or self._workers < 2 or total_bytes < self._min_process_bytes:
+            return
+        try:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=_process_pool_context())
+        except (OSError, NotImplementedError, ImportError):
+            logger.warning("Process pools are not supported here, indexing lookup files on download threads")
+            self._workers = 0
+
+    def index(self, contents, ods_codes):
+        if self._executor is None:
+            return index_lookup_file_contents(contents, ods_codes)
+        return self._executor.submit(index_lookup_file_contents, contents, ods_codes).result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _process_pool_context():
+    """
+    Workers are started from the download threads, which may hold locks (in boto3, logging, ...)
+    that a forked child would inherit held, so they are never forked from this process. They
+    only import asid_lookup_file, to keep their startup cheap.
+    """
+    try:
+        return multiprocessing.get_context("forkserver")
+    except ValueError:
+        return multiprocessing.get_context("spawn")
@@ -1,6 +1,12 @@
 import logging
-from chalicelib.csv_rows import csv_rows
-from chalicelib.migration_occurrences import EMIS_PRODUCT_ID, TPP_PRODUCT_ID, VISION_PRODUCT_ID
+import re
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from chalicelib.asid_index import load_asid_index
+from chalicelib.asid_lookup_file import PRODUCT_NAMES
+from chalicelib.load_lookup_files import DEFAULT_DOWNLOAD_WORKERS, LookupFileParsePool, load_lookup_files
 
 logger = logging.getLogger("Metrics Calculator")
 
@@ -12,51 +18,131 @@ class AsidLookupError(Exception):
 ASID_LOOKUP_HEADERS = [
     "ASID", "NACS", "OrgName", "MName", "PName", "OrgType", "PostCode"]
 
+LOOKUP_FILE_MONTH_PATTERN = re.compile(r"^(\d{4})/(\d{1,2})/")
+
 
-def lookup_all_asids(s3, bucket_name, migrations):
+def lookup_all_asids(s3, bucket_name, migrations, index_location=None, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                     use_s3_select=False):
+    """
+    Resolves old and new ASIDs for each migration. Each migration reads the lookup files for the
+    months nearest its date first (newest first on ties), and files are only read while some
+    migration still needs them, so files for distant months are usually never downloaded.
+    Files whose keys don't follow the YYYY/M/ convention, and migrations without a date, fall
+    back to the bucket's listing order. The files needed in each round are downloaded concurrently,
+    or queried with S3 Select for just the migrating practices when use_s3_select is set and no
+    index is used.
+    """
     result = {}
     if len(migrations) == 0:
         return result
-    asid_lookup_bucket = s3.Bucket(bucket_name)
-    list_of_migrations = list(migrations)
-    for lookup_file in asid_lookup_bucket.objects.all():
-        logger.debug(f"Opened file {lookup_file.key}")
-        rows = list(csv_rows(lookup_file.get()["Body"]))
-        for migration in list(list_of_migrations):
-            ods_code = migration["ods_code"]
-            asids = {"old": {"asid": "", "name": ""}, "new": {"asid": "", "name": ""}}
-            if ods_code not in result:
-                result[ods_code] = asids
-            current_file_result = find_asids_in_file(migration, ods_code, rows)
-            result[ods_code] |= current_file_result
-            if result[ods_code]["old"]["asid"] and result[ods_code]["new"]["asid"]:
-                list_of_migrations.remove(migration)
-        logger.debug(f"Closed file {lookup_file.key}")
+    with ExitStack() as stack:
+        if index_location:
+            asid_index = stack.enter_context(
+                load_asid_index(s3, bucket_name, index_location, download_workers=download_workers))
+            lookup_files = {key: file_id for file_id, (key, _) in enumerate(asid_index.lookup_files)}
+
+            def read_file_indexes(file_ids, ods_codes):
+                return [asid_index.file_index(file_id, ods_codes) for file_id in file_ids]
+        else:
+            lookup_files = {lookup_file.key: lookup_file for lookup_file in s3.Bucket(bucket_name).objects.all()}
+            parse_pool = stack.enter_context(LookupFileParsePool())
+
+            def read_file_indexes(lookup_file_summaries, ods_codes):
+                return load_lookup_files(
+                    lookup_file_summaries, ods_codes, download_workers=download_workers, parse_pool=parse_pool,
+                    use_s3_select=use_s3_select)
+
+        _resolve_asids(result, migrations, lookup_files, read_file_indexes)
     if len(result) == 0:
         raise AsidLookupError(f"Bucket {bucket_name} is empty")
 
     return result
 
 
-def find_asids_in_file(migration, ods_code, rows):
+def _resolve_asids(result, migrations, lookup_files, read_file_indexes):
+    lookup_file_months = {key: parse_lookup_file_month(key) for key in lookup_files}
+    orderings = {}
+    unresolved_migrations = []
+    for migration in migrations:
+        migration_month = _month_of(migration.get("date"))
+        if migration_month not in orderings:
+            orderings[migration_month] = order_lookup_files(lookup_file_months, migration_month)
+        if len(orderings[migration_month]) > 0:
+            unresolved_migrations.append((migration, deque(orderings[migration_month])))
+
+    file_indexes = {}
+    started = time.perf_counter()
+    while len(unresolved_migrations) > 0:
+        ods_codes = {migration["ods_code"] for migration, _ in unresolved_migrations}
+        keys = list(dict.fromkeys(
+            remaining_files[0] for _, remaining_files in unresolved_migrations
+            if remaining_files[0] not in file_indexes))
+        round_started = time.perf_counter()
+        file_indexes |= zip(keys, read_file_indexes([lookup_files[key] for key in keys], ods_codes))
+        logger.debug(f"Read lookup files {keys} in {time.perf_counter() - round_started:.3f}s")
+        unresolved_migrations = [
+            (migration, remaining_files)
+            for migration, remaining_files in unresolved_migrations
+            if not _merge_asids_from_file(result, migration, file_indexes[remaining_files.popleft()])
+            and len(remaining_files) > 0]
+    logger.debug(
+        f"Read {len(file_indexes)} of {len(lookup_files)} lookup files in {time.perf_counter() - started:.3f}s")
+
+
+def parse_lookup_file_month(key):
+    match = LOOKUP_FILE_MONTH_PATTERN.match(key)
+    if match is None:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    if not 1 <= month <= 12:
+        return None
+    return year * 12 + month - 1
+
+
+def order_lookup_files(lookup_file_months, migration_month):
+    keys = list(lookup_file_months)
+    if migration_month is None:
+        return keys
+    dated_keys = [key for key in keys if lookup_file_months[key] is not None]
+    undated_keys = [key for key in keys if lookup_file_months[key] is None]
+    dated_keys.sort(key=lambda key: (
+        abs(lookup_file_months[key] - migration_month), -lookup_file_months[key]))
+    return dated_keys + undated_keys
+
+
+def _month_of(migration_date):
+    if migration_date is None:
+        return None
+    return migration_date.year * 12 + migration_date.month - 1
+
+
+def find_asids_in_index(migration, ods_code, file_index):
     current_file_result = {}
-    for row in rows:
-        if ods_code == row["NACS"] and _is_same_product(migration["product_id"], row["PName"]):
-            current_file_result["new"] = {"asid": row["ASID"], "name": row["PName"]}
-        elif ods_code == row["NACS"] and _is_product_of_interest(row["PName"]):
-            current_file_result["old"] = {"asid": row["ASID"], "name": row["PName"]}
-    return current_file_result
+    asids_by_product = file_index.get(ods_code)
+    if not asids_by_product:
+        return current_file_result
 
+    activated_product_name = PRODUCT_NAMES.get(migration["product_id"])
+    if activated_product_name in asids_by_product:
+        _, asid = asids_by_product[activated_product_name]
+        current_file_result["new"] = {"asid": asid, "name": activated_product_name}
 
-def _is_same_product(finance_product_id, asid_lookup_pname):
-    if finance_product_id == TPP_PRODUCT_ID and asid_lookup_pname == "SystmOne":
-        return True
-    elif finance_product_id == EMIS_PRODUCT_ID and asid_lookup_pname == "EMIS Web":
-        return True
-    elif finance_product_id == VISION_PRODUCT_ID and asid_lookup_pname == "Vision 3":
-        return True
-    return False
+    other_products = [
+        (position, asid, product_name)
+        for product_name, (position, asid) in asids_by_product.items()
+        if product_name != activated_product_name]
+    if other_products:
+        _, asid, product_name = max(other_products)
+        current_file_result["old"] = {"asid": asid, "name": product_name}
+    return current_file_result
 
 
-def _is_product_of_interest(product_name):
-    return product_name in ["SystmOne", "EMIS Web", "Vision 3"]
\ No newline at end of file
+def _merge_asids_from_file(result, migration, file_index):
+    ods_code = migration["ods_code"]
+    if ods_code not in result:
+        result[ods_code] = {"old": {"asid": "", "name": ""}, "new": {"asid": "", "name": ""}}
+    # Files are read nearest month first, so ASIDs already found take precedence
+    for side, asid in find_asids_in_index(migration, ods_code, file_index).items():
+        if not result[ods_code][side]["asid"]:
+            result[ods_code][side] = asid
+    return result[ods_code]["old"]["asid"] and result[ods_code]["new"]["asid"]
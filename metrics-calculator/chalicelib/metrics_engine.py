@@ -1,38 +1,52 @@
+from contextlib import closing
 from decimal import Decimal, ROUND_HALF_UP
 
-from dateutil.parser import *
-
-
-def index_of_entry_above_threshold(activity_per_day, threshold):
-    for i, day in enumerate(activity_per_day):
-        if float(day["count"]) > threshold:
-            return i
-    raise Exception("Invalid data - none exceeds threshold")
+from chalicelib.duration_sketch import DurationSketch
+from chalicelib.telemetry_series import TelemetryStream, start_of_day, telemetry_days_from_rows
 
 
 def calculate_cutover_start_and_end_date(stats_preceding_cutover, stats_following_cutover):
-    stats_preceding_cutover_list = list(stats_preceding_cutover)
-    stats_following_cutover_list = list(stats_following_cutover)
-
-    # The stats are in chronological order, so to search backwards for cutover start,
-    # we reverse the order
-    reversed_stats_preceding_cutover = list(
-        reversed(stats_preceding_cutover_list))
-
-    threshold = calculate_threshold(stats_preceding_cutover_list)
-
-    try:
-        cutover_start_date = find_date_of_entry_above_threshold(
-            reversed_stats_preceding_cutover, threshold, -1)
-    except Exception as exception:
-        raise Exception("Start date out of range") from exception
-
-    try:
-        cutover_end_date = find_date_of_entry_above_threshold(
-            stats_following_cutover_list, threshold)
-    except Exception as exception:
-        raise Exception("End date out of range") from exception
-
+    """
+    Takes the telemetry for the old and new ASIDs as a TelemetryStream or rows from the telemetry
+    CSV files, reading each in a single pass. Only the first and latest days preceding cutover
+    are kept, and the telemetry following cutover is only read up to the first day above the
+    threshold.
+    """
+    first_day = None
+    threshold = None
+    above_threshold_seen = False
+    cutover_start_day = None
+    with closing(telemetry_days(stats_preceding_cutover)) as preceding_cutover:
+        for day, count, day_threshold, tzinfo in preceding_cutover:
+            if first_day is None:
+                first_day = (day, tzinfo)
+                threshold = calculate_threshold(day_threshold)
+            if count > threshold:
+                above_threshold_seen = True
+                cutover_start_day = None
+            elif above_threshold_seen and cutover_start_day is None:
+                cutover_start_day = (day, tzinfo)
+
+    if first_day is None:
+        raise IndexError("No telemetry preceding cutover")
+    # The cutover starts the day after the last day above the threshold before it. If that is
+    # the last day we have, the first day is used.
+    if not above_threshold_seen:
+        raise Exception("Start date out of range")
+    if cutover_start_day is None:
+        cutover_start_day = first_day
+
+    cutover_end_day = None
+    with closing(telemetry_days(stats_following_cutover)) as following_cutover:
+        for day, count, _, tzinfo in following_cutover:
+            if count > threshold:
+                cutover_end_day = (day, tzinfo)
+                break
+    if cutover_end_day is None:
+        raise Exception("End date out of range")
+
+    cutover_start_date = start_of_day(*cutover_start_day)
+    cutover_end_date = start_of_day(*cutover_end_day)
     cutover_duration = cutover_end_date - cutover_start_date
     return {
         "cutover_startdate": cutover_start_date.isoformat(),
@@ -41,50 +55,56 @@ def calculate_cutover_start_and_end_date(stats_preceding_cutover, stats_followin
     }
 
 
-def find_date_of_entry_above_threshold(events_per_day_list, threshold, offset=0):
-    index = index_of_entry_above_threshold(
-        events_per_day_list, threshold)
-
-    day_stats = events_per_day_list[index + offset]
-
-    return isoparse(day_stats["_time"])
+def telemetry_days(stats):
+    """Iterates (day, count, threshold, tzinfo) tuples from any of the forms telemetry comes in."""
+    if isinstance(stats, TelemetryStream):
+        yield from stats
+    else:
+        yield from telemetry_days_from_rows(stats)
 
 
-def calculate_threshold(old_asid_activity_per_day):
-    first_day = old_asid_activity_per_day[0]
-    threshold = float(first_day["avgmin2std"])
+def calculate_threshold(threshold):
+    if threshold is None:
+        raise ValueError("No threshold in telemetry preceding cutover")
     return threshold
 
 
-def calculate_migrations_stats_per_supplier_combination(metrics):
-    running_stats = []
-    for metric in metrics:
-        supplier_combination_stats = next((x for x in running_stats if is_matching_combination(metric, x)), None)
-        if supplier_combination_stats is None:
-            running_stats.append({
-                "source_system": metric["source_system"],
-                "target_system": metric["target_system"],
-                "count": 1,
-                "cumulative_duration": metric["cutover_duration"]
-            })
-        if supplier_combination_stats:
-            supplier_combination_stats["count"] += 1
-            supplier_combination_stats["cumulative_duration"] += metric["cutover_duration"]
-
-    results = []
-    for stats in running_stats:
-        mean_duration = stats["cumulative_duration"] / stats["count"]
-        rounded_mean_duration = Decimal(mean_duration).quantize(
-            Decimal('.1'), rounding=ROUND_HALF_UP)
-        results.append({
-            "source_system": stats["source_system"],
-            "target_system": stats["target_system"],
-            "count": stats["count"],
-            "mean_duration": float(rounded_mean_duration)
-        })
-    return results
-
-
-def is_matching_combination(metric, combination):
-    return combination["source_system"] == metric["source_system"] and \
-           combination["target_system"] == metric["target_system"]
+class SupplierCombinationStats:
+    """
+    Cutover duration stats per source and target system pair, built up one migration at a time.
+    Each pair keeps a DurationSketch, so the stats take the same space however many migrations
+    are added, and stats built separately can be merged.
+    """
+    __slots__ = ("_durations",)
+
+    def __init__(self):
+        self._durations = {}
+
+    def add(self, metric):
+        combination = (metric["source_system"], metric["target_system"])
+        durations = self._durations.get(combination)
+        if durations is None:
+            durations = self._durations[combination] = DurationSketch()
+        durations.add(metric["cutover_duration"])
+
+    def merge(self, other):
+        for combination, durations in other._durations.items():
+            self._durations.setdefault(combination, DurationSketch()).merge(durations)
+        return self
+
+    def results(self):
+        return [{
+            "source_system": source_system,
+            "target_system": target_system,
+            "count": durations.count,
+            "mean_duration": round_duration(durations.mean),
+            "median_duration": round_duration(durations.quantile(0.5)),
+            "p90_duration": round_duration(durations.quantile(0.9)),
+            "min_duration": durations.min,
+            "max_duration": durations.max
+        } for (source_system, target_system), durations in self._durations.items()]
+
+
+def round_duration(duration):
+    rounded_duration = Decimal(duration).quantize(Decimal('.1'), rounding=ROUND_HALF_UP)
+    return float(rounded_duration)
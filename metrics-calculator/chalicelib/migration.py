@@ -0,0 +1,73 @@
+import sys
+from collections.abc import Mapping
+
+
+class _Record(Mapping):
+    """
+    A read-only record with a fixed set of fields stored in slots rather than a per-instance
+    dict. Records can still be read like the dicts they replace (record["field"], .get(), ==
+    against a dict); fields that are None are treated as absent.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        value = getattr(self, field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __iter__(self):
+        return (field for field in self.__slots__ if getattr(self, field) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class Migration(_Record):
+    """
+    A migration occurrence. CCG names and supplier and product IDs repeat across thousands of
+    migrations, so they are interned to share a single copy of each.
+    """
+    __slots__ = ("ods_code", "ccg_name", "practice_name", "supplier_id", "product_id", "date")
+
+    def __init__(self, ods_code, ccg_name, practice_name, supplier_id, product_id, date):
+        self.ods_code = ods_code
+        self.ccg_name = sys.intern(ccg_name)
+        self.practice_name = practice_name
+        self.supplier_id = sys.intern(supplier_id)
+        self.product_id = sys.intern(product_id)
+        self.date = date
+
+
+class MigrationMetrics(_Record):
+    """
+    The metrics calculated for a migration, in the order they are uploaded. The patient
+    registration count is left out when it isn't known.
+    """
+    __slots__ = (
+        "cutover_startdate", "cutover_enddate", "cutover_duration", "ods_code", "ccg_name", "practice_name",
+        "patient_registration_count", "source_system", "target_system")
+
+    def __init__(self, cutover_startdate, cutover_enddate, cutover_duration, ods_code, ccg_name, practice_name,
+                 source_system, target_system, patient_registration_count=None):
+        self.cutover_startdate = cutover_startdate
+        self.cutover_enddate = cutover_enddate
+        self.cutover_duration = cutover_duration
+        self.ods_code = ods_code
+        self.ccg_name = ccg_name
+        self.practice_name = practice_name
+        self.patient_registration_count = patient_registration_count
+        self.source_system = source_system
+        self.target_system = target_system
+
+
+def record_to_json(value):
+    """For use as json.dumps' default, serialising records exactly as the equivalent dicts."""
+    if isinstance(value, _Record):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,41 +1,172 @@
+import gzip
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from chalicelib.csv_rows import csv_rows
+import pandas as pd
+
+from chalicelib.artifact_store import read_artifact, write_artifact
+from chalicelib.migration import Migration
+from chalicelib.xlsx_rows import xlsx_rows
+
+logger = logging.getLogger("Metrics Calculator")
 
 
 EMIS_SUPPLIER_ID = "10000"
 VISION_SUPPLIER_ID = "10034"
 TPP_SUPPLIER_ID = "10052"
 
-EMIS_PRODUCT_ID = "10000-001"
-TPP_PRODUCT_ID = "10052-002"
-VISION_PRODUCT_ID = "10034-005"
+SUPPLIER_IDS = [EMIS_SUPPLIER_ID, VISION_SUPPLIER_ID, TPP_SUPPLIER_ID]
+
+OCCURRENCES_COLUMNS = {
+    "ods_code": "Service Recipient ID (e.g. ODS code where this is available)",
+    "ccg_name": "Call Off Ordering Party name",
+    "practice_name": "Service Recipient Name",
+    "supplier_id": "Supplier ID",
+    "product_id": "Product ID ",
+    "date": "Actual M1 date"
+}
+OCCURRENCES_DATE_FORMAT = "%d/%m/%Y"
+
+OCCURRENCES_MANIFEST_VERSION = 1
+DEFAULT_PARSE_WORKERS = 8
+
+_MANIFEST_DATE_FORMAT = "%Y-%m-%d"
+
+# The worksheet is usually named "Pending Act upload", but not consistently
+OCCURRENCES_WORKSHEET_PATTERN = re.compile(r"pending\s*act", re.IGNORECASE)
+
+
+def get_migration_occurrences(s3, bucket_name, manifest_location=None, parse_workers=DEFAULT_PARSE_WORKERS):
+    """
+    Returns the migrations in every object in the occurrences bucket, de-duplicated by ODS code,
+    product and M1 date. Where the same migration appears more than once, the row from the most
+    recently modified object (then the greatest key, then the last row) wins, keeping the
+    position of its first appearance in the bucket's listing order.
+
+    With manifest_location, the migrations parsed from each object are stored there keyed by the
+    object's ETag, and only objects that were added or changed since are parsed. Several new
+    objects are parsed concurrently. Objects are either gzipped CSV files or the finance
+    system's .xlsx exports, from which only the pending activations worksheet is read.
+    """
+    occurrences_summaries = list(s3.Bucket(bucket_name).objects.all())
+    manifest = _read_manifest(s3, manifest_location) if manifest_location else {}
+
+    migrations_by_key = {}
+    new_summaries = []
+    for summary in occurrences_summaries:
+        entry = manifest.get(summary.key)
+        if entry is not None and entry["etag"] == summary.e_tag:
+            migrations_by_key[summary.key] = [_decode_migration(fields) for fields in entry["migrations"]]
+        else:
+            new_summaries.append(summary)
+
+    logger.debug(f"Parsing {len(new_summaries)} of {len(occurrences_summaries)} migration occurrences objects")
+    if len(new_summaries) > 0:
+        with ThreadPoolExecutor(max_workers=max(1, min(parse_workers, len(new_summaries)))) as executor:
+            migrations_by_key |= zip(
+                [summary.key for summary in new_summaries], executor.map(_parse_occurrences_object, new_summaries))
+
+    if manifest_location and (len(new_summaries) > 0 or len(manifest) != len(occurrences_summaries)):
+        _write_manifest(s3, manifest_location, {
+            summary.key: {
+                "etag": summary.e_tag,
+                "migrations": [_encode_migration(migration) for migration in migrations_by_key[summary.key]]
+            }
+            for summary in occurrences_summaries
+        })
+
+    known_migrations = {
+        _migration_key(migration): None
+        for summary in occurrences_summaries for migration in migrations_by_key[summary.key]}
+    for summary in sorted(occurrences_summaries, key=lambda summary: (summary.last_modified, summary.key)):
+        for migration in migrations_by_key[summary.key]:
+            known_migrations[_migration_key(migration)] = migration
+    return list(known_migrations.values())
+
+
+def _migration_key(migration):
+    return migration["ods_code"], migration["product_id"], migration["date"]
 
 
-def get_migration_occurrences(s3, bucket_name):
-    occurrences_bucket = s3.Bucket(bucket_name)
+def _parse_occurrences_object(summary):
+    body = summary.get()["Body"]
+    if summary.key.lower().endswith(".xlsx"):
+        return _parse_occurrences_rows(xlsx_rows(body, is_occurrences_worksheet))
+    return _parse_occurrences_csv(body)
+
+
+def _parse_occurrences_csv(body):
+    """
+    Parses a gzipped occurrences CSV column by column: only the columns we use are read, as
+    strings, and the supplier filter and date parsing are done on whole columns at once.
+    """
+    occurrences = pd.read_csv(
+        body, compression="gzip", usecols=list(OCCURRENCES_COLUMNS.values()), dtype=str, na_filter=False)
+    occurrences = occurrences[occurrences[OCCURRENCES_COLUMNS["supplier_id"]].isin(SUPPLIER_IDS)]
+    dates = pd.to_datetime(occurrences[OCCURRENCES_COLUMNS["date"]], format=OCCURRENCES_DATE_FORMAT)
+    # Blank dates become NaT rather than raising, unlike in _parse_migration
+    if dates.isna().any():
+        raise ValueError(f"Missing {OCCURRENCES_COLUMNS['date']} in occurrences")
+    columns = [occurrences[column].tolist() for field, column in OCCURRENCES_COLUMNS.items() if field != "date"]
+    columns.append(list(dates.dt.to_pydatetime()))
+    return [Migration(*values) for values in zip(*columns)]
+
+
+def _parse_occurrences_rows(rows):
     known_migrations = []
-    for object in occurrences_bucket.objects.all():
-        rows = csv_rows(object.get()["Body"])
-        for row in rows:
-            if row["Supplier ID"] not in [
-                    EMIS_SUPPLIER_ID, VISION_SUPPLIER_ID, TPP_SUPPLIER_ID]:
-                continue
-
-            migration = _parse_migration(row)
-            known_migrations.append(migration)
+    for row in rows:
+        if row["Supplier ID"] not in SUPPLIER_IDS:
+            continue
+
+        migration = _parse_migration(row)
+        known_migrations.append(migration)
     return known_migrations
 
 
+def is_occurrences_worksheet(worksheet_name):
+    return OCCURRENCES_WORKSHEET_PATTERN.search(worksheet_name) is not None
+
+
 def _parse_migration(row):
     date_str = row["Actual M1 date"]
-    migration = {
-        "ods_code": row["Service Recipient ID (e.g. ODS code where this is available)"],
-        "ccg_name": row["Call Off Ordering Party name"],
-        "practice_name": row["Service Recipient Name"],
-        "supplier_id": row["Supplier ID"],
-        "product_id": row["Product ID "],
-        "date": datetime.strptime(date_str, "%d/%m/%Y")
-    }
+    migration = Migration(
+        ods_code=row["Service Recipient ID (e.g. ODS code where this is available)"],
+        ccg_name=row["Call Off Ordering Party name"],
+        practice_name=row["Service Recipient Name"],
+        supplier_id=row["Supplier ID"],
+        product_id=row["Product ID "],
+        date=datetime.strptime(date_str, OCCURRENCES_DATE_FORMAT)
+    )
 
     return migration
+
+
+def _read_manifest(s3, manifest_location):
+    contents = read_artifact(s3, manifest_location)
+    if contents is None:
+        return {}
+    try:
+        manifest = json.loads(gzip.decompress(contents))
+    except (OSError, ValueError):
+        logger.warning(f"Ignoring unreadable migration occurrences manifest at {manifest_location}")
+        return {}
+    if manifest.get("version") != OCCURRENCES_MANIFEST_VERSION:
+        return {}
+    return manifest["objects"]
+
+
+def _write_manifest(s3, manifest_location, objects):
+    manifest = {"version": OCCURRENCES_MANIFEST_VERSION, "objects": objects}
+    write_artifact(s3, manifest_location, gzip.compress(json.dumps(manifest, separators=(",", ":")).encode()))
+
+
+def _encode_migration(migration):
+    return [migration[field] for field in OCCURRENCES_COLUMNS if field != "date"] + \
+        [migration["date"].strftime(_MANIFEST_DATE_FORMAT)]
+
+
+def _decode_migration(fields):
+    return Migration(*fields[:-1], date=datetime.strptime(fields[-1], _MANIFEST_DATE_FORMAT))
@@ -0,0 +1,82 @@
+import gzip
+import json
+import logging
+
+from chalicelib.artifact_store import read_artifact, write_artifact
+from chalicelib.get_patient_registration_count import find_registration_data_key, registration_month
+from chalicelib.migration import MigrationMetrics
+
+logger = logging.getLogger("Metrics Calculator")
+
+MIGRATION_RESULTS_VERSION = 1
+
+
+class MigrationResults:
+    """
+    The metrics calculated for each migration by previous runs, stored with the inputs they were
+    calculated from: the practice details, the ASIDs found for it and the ETags of its telemetry
+    objects and patient registration data. A migration only needs calculating again when any of
+    those have changed.
+    """
+
+    def __init__(self, records, telemetry_etags, registration_etags):
+        self._records = records
+        self._telemetry_etags = telemetry_etags
+        self._registration_etags = registration_etags
+        self._registration_keys = sorted(registration_etags)
+        self._updated_records = {}
+
+    def get(self, migration, asid_lookup):
+        """The stored metrics for a migration, or None if it hasn't been calculated from these inputs."""
+        key = _migration_key(migration)
+        record = self._records.get(key)
+        if record is None or record["inputs"] != self._inputs(migration, asid_lookup):
+            return None
+        self._updated_records[key] = record
+        return MigrationMetrics(**record["metrics"])
+
+    def put(self, migration, asid_lookup, metrics):
+        self._updated_records[_migration_key(migration)] = {
+            "inputs": self._inputs(migration, asid_lookup), "metrics": dict(metrics)}
+
+    def _inputs(self, migration, asid_lookup):
+        old_asid, new_asid = asid_lookup["old"]["asid"], asid_lookup["new"]["asid"]
+        registration_data_key = find_registration_data_key(self._registration_keys, registration_month(migration))
+        return [
+            migration["ccg_name"], migration["practice_name"],
+            old_asid, asid_lookup["old"]["name"], new_asid, asid_lookup["new"]["name"],
+            self._telemetry_etags.get(f"{old_asid}-telemetry.csv.gz"),
+            self._telemetry_etags.get(f"{new_asid}-telemetry.csv.gz"),
+            registration_data_key, self._registration_etags.get(registration_data_key)
+        ]
+
+    def save(self, s3, location):
+        """Writes the records for the migrations got or put since loading, dropping the rest."""
+        results = {"version": MIGRATION_RESULTS_VERSION, "migrations": self._updated_records}
+        write_artifact(s3, location, gzip.compress(json.dumps(results, separators=(",", ":")).encode()))
+
+
+def load_migration_results(s3, location, telemetry_etags, registration_etags):
+    """
+    Loads the stored results, to be checked against the current ETags of the objects in the
+    telemetry and patient registrations buckets, as list_object_etags returns them.
+    """
+    return MigrationResults(_read_records(s3, location), telemetry_etags, registration_etags)
+
+
+def _read_records(s3, location):
+    contents = read_artifact(s3, location)
+    if contents is None:
+        return {}
+    try:
+        results = json.loads(gzip.decompress(contents))
+    except (OSError, ValueError):
+        logger.warning(f"Ignoring unreadable migration results at {location}")
+        return {}
+    if results.get("version") != MIGRATION_RESULTS_VERSION:
+        return {}
+    return results["migrations"]
+
+
+def _migration_key(migration):
+    return f"{migration['ods_code']}/{migration['product_id']}/{migration['date'].strftime('%Y-%m-%d')}"
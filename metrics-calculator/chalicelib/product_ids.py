@@ -0,0 +1,3 @@
+EMIS_PRODUCT_ID = "10000-001"
+TPP_PRODUCT_ID = "10052-002"
+VISION_PRODUCT_ID = "10034-005"
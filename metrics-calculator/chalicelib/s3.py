@@ -1,10 +1,23 @@
 
 import boto3
+import csv
 import logging
+import os
+from boto3.s3.transfer import TransferConfig
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# S3 Select rejects SQL expressions longer than 256KB
+S3_SELECT_MAX_EXPRESSION_BYTES = 256 * 1024
+
+# A streamed upload holds at most max_in_memory_upload_chunks parts waiting to be sent, plus the
+# part being read, so (max_concurrency + 1) 8MB parts at once. TransferConfig doesn't take
+# max_in_memory_upload_chunks as an argument, and it would otherwise default to 10.
+STREAM_UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=2)
+STREAM_UPLOAD_CONFIG.max_in_memory_upload_chunks = STREAM_UPLOAD_CONFIG.max_concurrency
+
 
 def _object_from_uri(client, uri: str):
     object_url = urlparse(uri)
@@ -14,14 +27,18 @@ def _object_from_uri(client, uri: str):
 
 
 def read_object_s3(client, object_uri: str):
+    body, _ = read_object_and_metadata_s3(client, object_uri)
+    return body
+
+
+def read_object_and_metadata_s3(client, object_uri: str):
     logger.info(
         "Reading file from: " + object_uri,
         extra={"event": "READING_FILE_FROM_S3", "object_uri": object_uri},
     )
     s3_object = _object_from_uri(client, object_uri)
     response = s3_object.get()
-    body = response["Body"]
-    return body
+    return response["Body"], response["Metadata"]
 
 
 def write_object_s3(client, object_uri: str, body, metadata={}):
@@ -29,8 +46,21 @@ def write_object_s3(client, object_uri: str, body, metadata={}):
     s3_object.put(Body=body, Metadata=metadata)
 
 
+def upload_object_stream_s3(client, object_uri: str, stream, metadata={}):
+    """
+    Uploads what's read from stream, in parts with a multipart upload once there's more than
+    one part's worth, so the object is never held in memory whole.
+    """
+    s3_object = _object_from_uri(client, object_uri)
+    s3_object.upload_fileobj(stream, ExtraArgs={"Metadata": metadata}, Config=STREAM_UPLOAD_CONFIG)
+
+
 def get_s3_resource():
-    s3 = boto3.resource("s3", region_name="eu-west-2")
+    """
+    S3_ENDPOINT_URL, when set, points the resource at another S3 endpoint, such as a local
+    stand-in. The pinned botocore predates support for AWS_ENDPOINT_URL.
+    """
+    s3 = boto3.resource("s3", region_name="eu-west-2", endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
     return s3
 
 
@@ -41,3 +71,66 @@ def objects_exist(s3, bucket_name, object_names):
         if len(list(iterator)) == 0:
             return False
     return True
+
+
+def list_object_etags(s3, bucket_name):
+    """Lists a bucket once, returning the ETag of every object by key."""
+    return {summary.key: summary.e_tag for summary in s3.Bucket(bucket_name).objects.all()}
+
+
+def select_csv_rows_s3(s3_object, column, values, columns):
+    """
+    Uses S3 Select to read only the given columns of the rows of a gzipped CSV object whose value
+    in column is one of values. The values are split across as many queries as needed to keep
+    each expression within the S3 Select size limit. Yields the matching rows as dicts as their
+    records arrive, in file order within each query.
+    """
+    projection = ", ".join(_select_identifier(name) for name in columns)
+    query = f"SELECT {projection} FROM S3Object s WHERE {_select_identifier(column)} IN ({{}})"
+    for batch in _batch_select_literals(sorted(values), S3_SELECT_MAX_EXPRESSION_BYTES - len(query.encode())):
+        response = s3_object.meta.client.select_object_content(
+            Bucket=s3_object.bucket_name,
+            Key=s3_object.key,
+            ExpressionType="SQL",
+            Expression=query.format(", ".join(batch)),
+            InputSerialization={
+                "CSV": {"FileHeaderInfo": "USE", "AllowQuotedRecordDelimiter": True},
+                "CompressionType": "GZIP"
+            },
+            OutputSerialization={"CSV": {}},
+        )
+        payloads = (event["Records"]["Payload"] for event in response["Payload"] if "Records" in event)
+        for row in csv.reader(_lines(payloads)):
+            yield dict(zip(columns, row))
+
+
+def _lines(payloads):
+    # Records can be split across payloads; the csv reader joins the lines of quoted fields
+    remainder = b""
+    for payload in payloads:
+        lines = (remainder + payload).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line.decode() + "\n"
+    if remainder:
+        yield remainder.decode()
+
+
+def _select_identifier(name):
+    escaped_name = name.replace('"', '""')
+    return f's."{escaped_name}"'
+
+
+def _batch_select_literals(values, max_bytes):
+    batch, batch_bytes = [], 0
+    for value in values:
+        escaped_value = value.replace("'", "''")
+        literal = f"'{escaped_value}'"
+        literal_bytes = len(literal.encode()) + 2
+        if batch and batch_bytes + literal_bytes > max_bytes:
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(literal)
+        batch_bytes += literal_bytes
+    if batch:
+        yield batch
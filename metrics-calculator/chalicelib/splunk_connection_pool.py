@@ -0,0 +1,118 @@
+import logging
+from http.client import HTTPException
+from threading import Lock
+from time import monotonic
+
+logger = logging.getLogger("Metrics Calculator")
+
+
+class SplunkConnectionPool:
+    """
+    Keep-alive connections to one Splunk host, so consecutive queries don't each pay for a TCP
+    and TLS handshake. Up to size idle connections are kept for reuse; any more opened by
+    concurrent queries are closed once their response has been read. Connections left idle for
+    longer than idle_timeout seconds are closed rather than reused, as the server will likely
+    have dropped them, and a query sent on a reused connection that turns out to be broken is
+    sent again on a new one.
+    """
+
+    def __init__(self, connect, size, idle_timeout):
+        self._connect = connect
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._idle_connections = []
+        self._lock = Lock()
+
+    def open(self, method, url, body, headers):
+        """
+        Sends the request and returns the response for its body to be read, in chunks if need
+        be. Closing the response returns its connection to the pool if the body was read to the
+        end, and closes it otherwise.
+        """
+        connection, reused = self._acquire()
+        try:
+            response = _send(connection, method, url, body, headers)
+        except (ConnectionError, HTTPException):
+            connection.close()
+            if not reused:
+                raise
+            logger.debug("Splunk connection was dropped, reconnecting")
+            connection = self._new_connection()
+            try:
+                response = _send(connection, method, url, body, headers)
+            except BaseException:
+                connection.close()
+                raise
+        return PooledResponse(self, connection, response)
+
+    def close(self):
+        with self._lock:
+            idle_connections, self._idle_connections = self._idle_connections, []
+        for connection, _ in idle_connections:
+            connection.close()
+
+    def _acquire(self):
+        now = monotonic()
+        while True:
+            with self._lock:
+                if not self._idle_connections:
+                    break
+                connection, released_at = self._idle_connections.pop()
+            if now - released_at <= self._idle_timeout:
+                return connection, True
+            connection.close()
+        return self._new_connection(), False
+
+    def _new_connection(self):
+        connection = self._connect()
+        connection.connect()
+        return connection
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle_connections) < self._size:
+                self._idle_connections.append((connection, monotonic()))
+                return
+        connection.close()
+
+
+class PooledResponse:
+    __slots__ = ("_pool", "_connection", "_response")
+
+    def __init__(self, pool, connection, response):
+        self._pool = pool
+        self._connection = connection
+        self._response = response
+
+    @property
+    def status(self):
+        return self._response.status
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, size=None):
+        try:
+            return self._response.read() if size is None else self._response.read(size)
+        except BaseException:
+            self._close_connection()
+            raise
+
+    def close(self):
+        if self._connection is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(self._connection)
+            self._connection = None
+        else:
+            self._close_connection()
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _send(connection, method, url, body, headers):
+    connection.request(method, url, body, headers)
+    return connection.getresponse()
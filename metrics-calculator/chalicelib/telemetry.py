@@ -1,28 +1,56 @@
 import gzip
+import io
 
-from chalicelib.s3 import read_object_s3, write_object_s3
-from chalicelib.csv_rows import csv_rows
+from chalicelib.s3 import read_object_and_metadata_s3, write_object_s3, upload_object_stream_s3
+from chalicelib.telemetry_series import TelemetryStream
 from botocore.exceptions import ClientError
 
 
+BASELINE_THRESHOLD_METADATA_KEY = "baseline_threshold"
+
+
 class GetTelemetryError(RuntimeError):
     pass
 
 
 def get_telemetry(s3, telemetry_bucket_name, new_telemetry_object_name):
+    """
+    Telemetry exported before the baseline threshold was stored in its metadata has the
+    threshold on every row instead.
+    """
     try:
-        new_telemetry_stream = read_object_s3(
+        new_telemetry_stream, metadata = read_object_and_metadata_s3(
             s3, f"s3://{telemetry_bucket_name}/{new_telemetry_object_name}")
-        new_telemetry_generator = csv_rows(new_telemetry_stream)
     except ClientError as e:
         raise GetTelemetryError from e
-    return new_telemetry_generator
+    baseline_threshold = metadata.get(BASELINE_THRESHOLD_METADATA_KEY)
+    return TelemetryStream(
+        new_telemetry_stream, float(baseline_threshold) if baseline_threshold is not None else None)
+
+
+def upload_telemetry(s3, bucket_name, telemetry_data, filename, start_date, end_date, baseline_threshold=None):
+    zipped_telemetry = gzip.compress(telemetry_data)
+    write_object_s3(
+        s3, f"s3://{bucket_name}/{filename}", zipped_telemetry,
+        _telemetry_metadata(start_date, end_date, baseline_threshold))
+
 
+def upload_telemetry_stream(s3, bucket_name, zipped_telemetry_stream, filename, start_date, end_date,
+                            baseline_threshold=None):
+    """
+    Like upload_telemetry, for telemetry that's already gzip-compressed, read from a stream and
+    uploaded a part at a time as it's read.
+    """
+    upload_object_stream_s3(
+        s3, f"s3://{bucket_name}/{filename}", io.BufferedReader(zipped_telemetry_stream),
+        _telemetry_metadata(start_date, end_date, baseline_threshold))
 
-def upload_telemetry(s3, bucket_name, telemetry_data, filename, start_date, end_date):
+
+def _telemetry_metadata(start_date, end_date, baseline_threshold):
     metadata = {
         "start_date": start_date.strftime("%Y-%m-%d"),
         "end_date": end_date.strftime("%Y-%m-%d")
     }
-    zipped_telemetry = gzip.compress(telemetry_data)
-    write_object_s3(s3, f"s3://{bucket_name}/{filename}", zipped_telemetry, metadata)
+    if baseline_threshold is not None:
+        metadata[BASELINE_THRESHOLD_METADATA_KEY] = str(baseline_threshold)
+    return metadata
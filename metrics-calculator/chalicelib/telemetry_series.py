@@ -0,0 +1,93 @@
+import csv
+import gzip
+from datetime import date, datetime, timedelta, timezone
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_MIDNIGHT = "00:00:00"
+
+
+class TelemetryParseError(Exception):
+    pass
+
+
+class TelemetryStream:
+    """
+    Telemetry read lazily from a gzipped telemetry CSV export: iterating it decodes one day at a
+    time as (day, count, threshold, tzinfo) tuples, and closes the stream once iteration stops,
+    so whatever hasn't been read yet is never downloaded. The threshold is taken from the
+    avgmin2std column where a row has one, and is otherwise the threshold given.
+    """
+    __slots__ = ("_stream", "_threshold")
+
+    def __init__(self, stream, threshold=None):
+        self._stream = stream
+        self._threshold = threshold
+
+    def __iter__(self):
+        try:
+            with gzip.open(self._stream, mode="rt") as f:
+                rows = csv.reader(f)
+                header = next(rows, None)
+                if header is None:
+                    return
+                time_index, count_index = header.index("_time"), header.index("count")
+                threshold_index = header.index("avgmin2std") if "avgmin2std" in header else None
+                for row in rows:
+                    if row:
+                        yield _telemetry_day(
+                            row[time_index], row[count_index],
+                            row[threshold_index] if threshold_index is not None else None, self._threshold)
+        finally:
+            self._stream.close()
+
+
+def telemetry_days_from_rows(rows):
+    """Lazily converts telemetry CSV rows as dicts into (day, count, threshold, tzinfo) tuples."""
+    return (_telemetry_day(row["_time"], row["count"], row.get("avgmin2std")) for row in rows)
+
+
+def _telemetry_day(time, count, threshold, default_threshold=None):
+    day, tzinfo = parse_day(time)
+    return day, int(count), float(threshold) if threshold else default_threshold, tzinfo
+
+
+def start_of_day(day, tzinfo=None):
+    """Midnight at the start of a day given as days since the Unix epoch."""
+    day = date.fromordinal(int(day) + _EPOCH_ORDINAL)
+    return datetime(day.year, day.month, day.day, tzinfo=tzinfo)
+
+
+def parse_day(timestamp):
+    """
+    Parses a Splunk daily timestamp (YYYY-MM-DDT00:00:00, optionally with fractional seconds
+    and a UTC offset) by position, returning days since the Unix epoch and the timezone.
+    """
+    try:
+        if timestamp[10] != "T" or timestamp[11:19] != _MIDNIGHT:
+            raise ValueError
+        day = date(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]))
+        suffix = timestamp[19:]
+        if suffix.startswith("."):
+            fraction_end = 1
+            while fraction_end < len(suffix) and suffix[fraction_end].isdigit():
+                fraction_end += 1
+            if fraction_end == 1 or suffix[1:fraction_end].strip("0"):
+                raise ValueError
+            suffix = suffix[fraction_end:]
+        return day.toordinal() - _EPOCH_ORDINAL, _parse_utc_offset(suffix)
+    except (IndexError, ValueError) as exception:
+        raise TelemetryParseError(f"Unexpected telemetry timestamp {timestamp}") from exception
+
+
+def _parse_utc_offset(suffix):
+    if suffix == "":
+        return None
+    if suffix == "Z":
+        return timezone.utc
+    offset = suffix[1:].replace(":", "")
+    if suffix[0] not in "+-" or len(offset) != 4 or not offset.isdigit():
+        raise ValueError
+    minutes = int(offset[:2]) * 60 + int(offset[2:])
+    if minutes == 0:
+        return timezone.utc
+    return timezone(timedelta(minutes=minutes if suffix[0] == "+" else -minutes))
@@ -0,0 +1,50 @@
+import logging
+import shutil
+from datetime import date, datetime
+from tempfile import SpooledTemporaryFile
+
+from openpyxl import load_workbook
+
+logger = logging.getLogger("Metrics Calculator")
+
+_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+_DATE_FORMAT = "%d/%m/%Y"
+
+
+def xlsx_rows(stream, is_wanted_worksheet):
+    """
+    Yields the rows of the first worksheet whose name is_wanted_worksheet accepts as dicts keyed
+    by its header row, like csv_rows. The workbook is opened in read-only mode so rows are
+    streamed from the worksheet's XML rather than loading the whole workbook, and cells are
+    converted to the text they would have in a CSV export (dates as DD/MM/YYYY).
+    """
+    with SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE) as f:
+        shutil.copyfileobj(stream, f)
+        f.seek(0)
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        try:
+            worksheet_names = [name for name in workbook.sheetnames if is_wanted_worksheet(name)]
+            if len(worksheet_names) == 0:
+                logger.warning(f"No matching worksheet found in workbook with worksheets {workbook.sheetnames}")
+                return
+            rows = (
+                [_cell_text(value) for value in row]
+                for row in workbook[worksheet_names[0]].iter_rows(values_only=True))
+            non_empty_rows = (row for row in rows if any(row))
+            header = next(non_empty_rows, None)
+            if header is None:
+                return
+            for row in non_empty_rows:
+                yield dict(zip(header, row + [""] * (len(header) - len(row))))
+        finally:
+            workbook.close()
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime(_DATE_FORMAT)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
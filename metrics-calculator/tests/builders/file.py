@@ -2,6 +2,8 @@ import gzip
 import shutil
 from io import BytesIO
 
+from openpyxl import Workbook
+
 
 def _build_csv_contents(header, rows):
     def build_line(values):
@@ -34,3 +36,15 @@ def read_file_to_gzip_buffer(input_file_path):
             shutil.copyfileobj(input_file, output_file)
     gzip_buffer.seek(0)
     return gzip_buffer
+
+
+def build_xlsx(worksheets):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in worksheets.items():
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
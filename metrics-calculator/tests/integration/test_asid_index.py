@@ -0,0 +1,183 @@
+import boto3
+import os
+import pytest
+
+from moto import mock_s3
+
+from chalicelib.asid_index import load_asid_index
+from chalicelib.lookup_all_asids import lookup_all_asids, ASID_LOOKUP_HEADERS
+from chalicelib.product_ids import EMIS_PRODUCT_ID, TPP_PRODUCT_ID
+from tests.builders.file import build_gzip_csv
+
+
+@pytest.fixture(scope='function')
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture(scope='function')
+def s3(aws_credentials):
+    with mock_s3():
+        yield boto3.resource('s3', region_name='us-east-1')
+
+
+@pytest.fixture(scope='function')
+def indexed_lookup_files(monkeypatch):
+    from chalicelib import asid_index
+    indexed_keys = []
+    original_load_lookup_files = asid_index.load_lookup_files
+
+    def spy(lookup_file_summaries, *args, **kwargs):
+        indexed_keys.extend(summary.key for summary in lookup_file_summaries)
+        return original_load_lookup_files(lookup_file_summaries, *args, **kwargs)
+    monkeypatch.setattr("chalicelib.asid_index.load_lookup_files", spy)
+    yield indexed_keys
+
+
+def test_load_asid_index_finds_asids_for_an_ods_code_in_every_lookup_file(s3, tmp_path):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    upload_lookup_file(asid_lookup_bucket, "2021/1/asidLookup.csv.gz", [
+        ["old-asid", "ods-code", "", "", "SystmOne", "", ""],
+        ["other-asid", "other-ods-code", "", "", "SystmOne", "", ""]
+    ])
+    upload_lookup_file(asid_lookup_bucket, "2021/2/asidLookup.csv.gz", [
+        ["not-a-gp-system", "ods-code", "", "", "Something Else", "", ""],
+        ["new-asid", "ods-code", "", "", "EMIS Web", "", ""],
+        ["old-asid", "ods-code", "", "", "SystmOne", "", ""]
+    ])
+
+    asid_index = load_asid_index(
+        s3, bucket_name, str(tmp_path / "asid-index.bin"), cache_directory=str(tmp_path / "cache"))
+
+    assert asid_index.lookup_files == [
+        ("2021/1/asidLookup.csv.gz", asid_lookup_bucket.Object("2021/1/asidLookup.csv.gz").e_tag),
+        ("2021/2/asidLookup.csv.gz", asid_lookup_bucket.Object("2021/2/asidLookup.csv.gz").e_tag)
+    ]
+    assert asid_index.lookup("ods-code") == {
+        0: {"SystmOne": (0, "old-asid")},
+        1: {"EMIS Web": (0, "new-asid"), "SystmOne": (1, "old-asid")}
+    }
+    assert asid_index.lookup("unknown-ods-code") == {}
+
+
+def test_load_asid_index_does_not_read_lookup_files_when_the_index_is_up_to_date(s3, tmp_path, indexed_lookup_files):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    upload_lookup_file(asid_lookup_bucket, "2021/1/asidLookup.csv.gz", [
+        ["old-asid", "ods-code", "", "", "SystmOne", "", ""]
+    ])
+    index_location = str(tmp_path / "asid-index.bin")
+    load_asid_index(s3, bucket_name, index_location, cache_directory=str(tmp_path / "first-run"))
+
+    asid_index = load_asid_index(s3, bucket_name, index_location, cache_directory=str(tmp_path / "second-run"))
+
+    assert indexed_lookup_files == ["2021/1/asidLookup.csv.gz"]
+    assert asid_index.lookup("ods-code") == {0: {"SystmOne": (0, "old-asid")}}
+
+
+def test_load_asid_index_only_reads_new_lookup_files_when_updating_the_index(s3, tmp_path, indexed_lookup_files):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    upload_lookup_file(asid_lookup_bucket, "2021/1/asidLookup.csv.gz", [
+        ["old-asid", "ods-code", "", "", "SystmOne", "", ""]
+    ])
+    upload_lookup_file(asid_lookup_bucket, "2021/3/asidLookup.csv.gz", [
+        ["new-asid", "ods-code", "", "", "EMIS Web", "", ""]
+    ])
+    index_location = f"s3://{bucket_name}-index/asid-index.bin"
+    s3.create_bucket(Bucket=f"{bucket_name}-index")
+    load_asid_index(s3, bucket_name, index_location, cache_directory=str(tmp_path / "first-run"))
+    upload_lookup_file(asid_lookup_bucket, "2021/2/asidLookup.csv.gz", [
+        ["vision-asid", "ods-code", "", "", "Vision 3", "", ""]
+    ])
+
+    asid_index = load_asid_index(s3, bucket_name, index_location, cache_directory=str(tmp_path / "second-run"))
+
+    assert indexed_lookup_files == [
+        "2021/1/asidLookup.csv.gz", "2021/3/asidLookup.csv.gz", "2021/2/asidLookup.csv.gz"]
+    assert asid_index.lookup("ods-code") == {
+        0: {"SystmOne": (0, "old-asid")},
+        1: {"Vision 3": (0, "vision-asid")},
+        2: {"EMIS Web": (0, "new-asid")}
+    }
+
+
+def test_lookup_all_asids_returns_the_same_asids_from_the_index_as_from_the_lookup_files(s3, tmp_path):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    upload_lookup_file(asid_lookup_bucket, "2021/1/asidLookup.csv.gz", [
+        ["old-asid-1", "ods-code-1", "", "", "Vision 3", "", ""],
+        ["old-asid-2", "ods-code-2", "", "", "EMIS Web", "", ""],
+        ["new-asid-2", "ods-code-2", "", "", "SystmOne", "", ""]
+    ])
+    upload_lookup_file(asid_lookup_bucket, "2021/2/asidLookup.csv.gz", [
+        ["old-asid-1", "ods-code-1", "", "", "Vision 3", "", ""],
+        ["new-asid-1", "ods-code-1", "", "", "EMIS Web", "", ""],
+        ["replaced-asid-2", "ods-code-2", "", "", "EMIS Web", "", ""],
+        ["replaced-asid-2", "ods-code-2", "", "", "SystmOne", "", ""]
+    ])
+    migrations = [
+        {"ods_code": "ods-code-1", "product_id": EMIS_PRODUCT_ID},
+        {"ods_code": "ods-code-2", "product_id": TPP_PRODUCT_ID},
+        {"ods_code": "ods-code-3", "product_id": TPP_PRODUCT_ID}
+    ]
+
+    expected_result = lookup_all_asids(s3, bucket_name, migrations)
+    result = lookup_all_asids(s3, bucket_name, migrations, str(tmp_path / "asid-index.bin"))
+
+    assert result == expected_result
+
+
+
+def test_load_asid_index_removes_index_cached_for_earlier_lookup_files(s3, tmp_path):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    upload_lookup_file(asid_lookup_bucket, "2021/1/asidLookup.csv.gz", [
+        ["old-asid", "ods-code", "", "", "SystmOne", "", ""]
+    ])
+    index_location = str(tmp_path / "asid-index.bin")
+    cache_directory = tmp_path / "cache"
+    unrelated_file = cache_directory / "unrelated.bin"
+    load_asid_index(s3, bucket_name, index_location, cache_directory=str(cache_directory)).close()
+    unrelated_file.write_bytes(b"")
+    upload_lookup_file(asid_lookup_bucket, "2021/2/asidLookup.csv.gz", [
+        ["new-asid", "ods-code", "", "", "EMIS Web", "", ""]
+    ])
+
+    with load_asid_index(s3, bucket_name, index_location, cache_directory=str(cache_directory)) as asid_index:
+        assert sorted(path.name for path in cache_directory.iterdir()) == [
+            f"asid-index-{asid_index.fingerprint.hex()}.bin", "unrelated.bin"]
+
+
+def test_lookup_all_asids_closes_the_index(s3, tmp_path, monkeypatch):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    upload_lookup_file(asid_lookup_bucket, "2021/1/asidLookup.csv.gz", [
+        ["old-asid", "ods-code", "", "", "SystmOne", "", ""]
+    ])
+    asid_indexes = []
+
+    def spy(*args, **kwargs):
+        asid_indexes.append(load_asid_index(*args, cache_directory=str(tmp_path / "cache"), **kwargs))
+        return asid_indexes[-1]
+    monkeypatch.setattr("chalicelib.lookup_all_asids.load_asid_index", spy)
+
+    lookup_all_asids(
+        s3, bucket_name, [{"ods_code": "ods-code", "product_id": EMIS_PRODUCT_ID}], str(tmp_path / "asid-index.bin"))
+
+    assert len(asid_indexes) == 1
+    assert asid_indexes[0].closed
+
+
+def upload_lookup_file(asid_lookup_bucket, key, rows):
+    asid_lookup_bucket.Object(key).put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=rows,
+        ))
@@ -1,13 +1,16 @@
 from datetime import date
+from unittest.mock import ANY, Mock
 
 import boto3
+from botocore.exceptions import ClientError
 import os
 import pytest
 
 from moto import mock_s3
 
-from chalicelib.get_patient_registration_count import get_patient_registration_count, PatientRegistrationsError, \
-    PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS
+from chalicelib.csv_rows import filtered_csv_rows
+from chalicelib.get_patient_registration_count import get_patient_registration_count, \
+    lookup_all_patient_registration_counts, PatientRegistrationsError, PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS
 from tests.builders.file import build_gzip_csv
 
 
@@ -44,7 +47,8 @@ def test_get_patient_registration_count_returns_number_of_patients_for_a_given_p
             ],
         ))
 
-    result = get_patient_registration_count(s3, bucket_name, migration)
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, [migration])
+    result = get_patient_registration_count(registration_counts, migration)
 
     expected_result = 1000
 
@@ -69,8 +73,10 @@ def test_get_patient_registration_count_raises_error_if_ods_code_not_found(s3):
             ],
         ))
 
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, [migration])
+
     with pytest.raises(PatientRegistrationsError, match="ODS code ods-code not found"):
-        get_patient_registration_count(s3, bucket_name, migration)
+        get_patient_registration_count(registration_counts, migration)
 
 
 def test_get_patient_registration_count_returns_number_of_patients_for_a_given_practice_during_a_migration(s3):
@@ -97,7 +103,8 @@ def test_get_patient_registration_count_returns_number_of_patients_for_a_given_p
             ],
         ))
 
-    result = get_patient_registration_count(s3, bucket_name, migration)
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, [migration])
+    result = get_patient_registration_count(registration_counts, migration)
 
     expected_result = 1000
 
@@ -121,5 +128,78 @@ def test_get_patient_registration_count_returns_error_if_migration_month_data_is
             ],
         ))
 
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, [migration])
+
     with pytest.raises(PatientRegistrationsError, match="Data for july-2021 not found"):
-        get_patient_registration_count(s3, bucket_name, migration)
+        get_patient_registration_count(registration_counts, migration)
+
+
+def test_lookup_all_patient_registration_counts_reads_each_month_once_for_all_migrations(s3, monkeypatch):
+    migrations = [
+        {"ods_code": "ods-code-1", "date": date(2021, 7, 11)},
+        {"ods_code": "ods-code-2", "date": date(2021, 7, 20)},
+        {"ods_code": "ods-code-3", "date": date(2021, 6, 1)},
+    ]
+    bucket_name = "test-bucket"
+    patient_registrations_bucket = s3.create_bucket(Bucket=bucket_name)
+
+    patient_registrations_bucket.Object("july-2021-patient-registration-data.csv.gz").put(
+        Body=build_gzip_csv(
+            header=PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS,
+            rows=[
+                ["", "", "", "", "", "ods-code-1", "", "", "", "1000"],
+                ["", "", "", "", "", "ods-code-2", "", "", "", "0"],
+                ["", "", "", "", "", "ods-code-3", "", "", "", "3000"],
+            ],
+        ))
+    patient_registrations_bucket.Object("june-2021-patient-registration-data.csv.gz").put(
+        Body=build_gzip_csv(
+            header=PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS,
+            rows=[
+                ["", "", "", "", "", "ods-code-3", "", "", "", "2000"],
+                ["", "", "", "", "", "ods-code-3", "", "", "", "2500"],
+            ],
+        ))
+    filtered_csv_rows_spy = Mock(wraps=filtered_csv_rows)
+    monkeypatch.setattr("chalicelib.get_patient_registration_count.filtered_csv_rows", filtered_csv_rows_spy)
+
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, migrations)
+
+    assert [get_patient_registration_count(registration_counts, migration) for migration in migrations] == \
+        [1000, 0, 2000]
+    assert filtered_csv_rows_spy.call_count == 2
+
+
+def test_lookup_all_patient_registration_counts_selects_matching_rows_when_s3_select_is_enabled(s3, monkeypatch):
+    migration = {"ods_code": "ods-code", "date": date(2021, 7, 11)}
+    bucket_name = "test-bucket"
+    patient_registrations_bucket = s3.create_bucket(Bucket=bucket_name)
+    patient_registrations_bucket.Object("july-2021-patient-registration-data.csv.gz").put(
+        Body=build_gzip_csv(header=PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS, rows=[]))
+    select_csv_rows_s3_mock = Mock(return_value=[{"CODE": "ods-code", "NUMBER_OF_PATIENTS": "1000"}])
+    monkeypatch.setattr("chalicelib.get_patient_registration_count.select_csv_rows_s3", select_csv_rows_s3_mock)
+
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, [migration], use_s3_select=True)
+
+    assert get_patient_registration_count(registration_counts, migration) == 1000
+    select_csv_rows_s3_mock.assert_called_once_with(ANY, "CODE", {"ods-code"}, ["CODE", "NUMBER_OF_PATIENTS"])
+
+
+def test_lookup_all_patient_registration_counts_downloads_data_when_s3_select_is_rejected(s3, monkeypatch):
+    migration = {"ods_code": "ods-code", "date": date(2021, 7, 11)}
+    bucket_name = "test-bucket"
+    patient_registrations_bucket = s3.create_bucket(Bucket=bucket_name)
+    patient_registrations_bucket.Object("july-2021-patient-registration-data.csv.gz").put(
+        Body=build_gzip_csv(
+            header=PATIENT_REGISTRATION_DATA_LOOKUP_HEADERS,
+            rows=[
+                ["", "", "", "", "", "ods-code", "", "", "", "1000"]
+            ],
+        ))
+    monkeypatch.setattr(
+        "chalicelib.get_patient_registration_count.select_csv_rows_s3",
+        Mock(side_effect=ClientError({"Error": {"Code": "MethodNotAllowed"}}, "SelectObjectContent")))
+
+    registration_counts = lookup_all_patient_registration_counts(s3, bucket_name, [migration], use_s3_select=True)
+
+    assert get_patient_registration_count(registration_counts, migration) == 1000
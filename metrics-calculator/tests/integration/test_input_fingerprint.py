@@ -0,0 +1,81 @@
+import boto3
+import os
+import pytest
+
+from botocore.exceptions import ClientError
+from moto import mock_s3
+from unittest.mock import Mock
+
+from chalicelib.input_fingerprint import calculate_input_fingerprint, read_input_fingerprint, \
+    write_input_fingerprint
+from chalicelib.s3 import list_object_etags
+
+
+@pytest.fixture(scope='function')
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture(scope='function')
+def s3(aws_credentials):
+    with mock_s3():
+        yield boto3.resource('s3', region_name='us-east-1')
+
+
+def fingerprint(s3, bucket_names):
+    return calculate_input_fingerprint({bucket_name: list_object_etags(s3, bucket_name) for bucket_name in bucket_names})
+
+
+def test_input_fingerprint_is_unchanged_until_an_object_is_added_replaced_or_removed(s3):
+    bucket = s3.create_bucket(Bucket="input-bucket")
+    s3.create_bucket(Bucket="other-input-bucket")
+    bucket.put_object(Key="a.csv.gz", Body=b"a")
+    original = fingerprint(s3, ["input-bucket", "other-input-bucket"])
+
+    assert fingerprint(s3, ["input-bucket", "other-input-bucket"]) == original
+
+    bucket.put_object(Key="a.csv.gz", Body=b"changed")
+    replaced = fingerprint(s3, ["input-bucket", "other-input-bucket"])
+    assert replaced != original
+
+    s3.Object("other-input-bucket", "b.csv.gz").put(Body=b"b")
+    added = fingerprint(s3, ["input-bucket", "other-input-bucket"])
+    assert added not in [original, replaced]
+
+    s3.Object("other-input-bucket", "b.csv.gz").delete()
+    assert fingerprint(s3, ["input-bucket", "other-input-bucket"]) == replaced
+
+
+def test_read_input_fingerprint_returns_none_when_not_written(s3):
+    s3.create_bucket(Bucket="metrics-bucket")
+
+    assert read_input_fingerprint(s3, "s3://metrics-bucket/migrations-input-fingerprint.txt") is None
+
+
+def test_read_input_fingerprint_returns_written_fingerprint(s3):
+    s3.create_bucket(Bucket="metrics-bucket")
+    write_input_fingerprint(s3, "s3://metrics-bucket/migrations-input-fingerprint.txt", "abc123")
+
+    assert read_input_fingerprint(s3, "s3://metrics-bucket/migrations-input-fingerprint.txt") == "abc123"
+
+
+def test_read_input_fingerprint_returns_none_when_access_is_denied():
+    s3 = Mock()
+    s3.Object.return_value.get.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}, "GetObject")
+
+    assert read_input_fingerprint(s3, "s3://metrics-bucket/migrations-input-fingerprint.txt") is None
+
+
+def test_read_input_fingerprint_raises_other_errors():
+    s3 = Mock()
+    s3.Object.return_value.get.side_effect = ClientError(
+        {"Error": {"Code": "SlowDown", "Message": "Slow Down"}}, "GetObject")
+
+    with pytest.raises(ClientError):
+        read_input_fingerprint(s3, "s3://metrics-bucket/migrations-input-fingerprint.txt")
@@ -0,0 +1,143 @@
+import boto3
+import os
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+from moto import mock_s3
+
+from chalicelib import load_lookup_files as load_lookup_files_module
+from chalicelib.asid_lookup_file import index_lookup_file_contents
+from chalicelib.load_lookup_files import LookupFileParsePool, load_lookup_files
+from chalicelib.lookup_all_asids import ASID_LOOKUP_HEADERS
+from tests.builders.file import build_gzip_csv
+
+
+@pytest.fixture(scope='function')
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture(scope='function')
+def s3(aws_credentials):
+    with mock_s3():
+        yield boto3.resource('s3', region_name='us-east-1')
+
+
+@pytest.fixture(scope='function')
+def asid_lookup_bucket(s3):
+    bucket = s3.create_bucket(Bucket="test-bucket")
+    for year in [2020, 2021, 2022]:
+        for month in range(1, 13):
+            bucket.Object(f"{year}/{month}/asidLookup.csv.gz").put(
+                Body=build_gzip_csv(
+                    header=ASID_LOOKUP_HEADERS,
+                    rows=[
+                        [f"{year}{month}{practice}1", f"ods-code-{practice}", "", "", "SystmOne", "", ""]
+                        for practice in range(50)
+                    ] + [
+                        [f"{year}{month}{practice}2", f"ods-code-{practice}", "", "", "EMIS Web", "", ""]
+                        for practice in range(0, 50, 3)
+                    ],
+                ))
+    yield bucket
+
+
+@pytest.fixture(scope='function')
+def process_pools(monkeypatch):
+    process_pools = []
+
+    class RecordingProcessPool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.submitted = 0
+            process_pools.append(self)
+
+        def submit(self, *args, **kwargs):
+            self.submitted += 1
+            return super().submit(*args, **kwargs)
+    monkeypatch.setattr(load_lookup_files_module, "ProcessPoolExecutor", RecordingProcessPool)
+    yield process_pools
+
+
+def index_sequentially(lookup_file_summaries, ods_codes):
+    return [index_lookup_file_contents(summary.get()["Body"].read(), ods_codes) for summary in lookup_file_summaries]
+
+
+@pytest.mark.parametrize(
+    "download_workers,parse_workers",
+    [(1, 0), (8, 0), (1, 2), (8, 4)])
+def test_load_lookup_files_returns_file_indexes_in_the_order_files_were_given(
+        asid_lookup_bucket, download_workers, parse_workers):
+    lookup_file_summaries = list(reversed(list(asid_lookup_bucket.objects.all())))
+    ods_codes = {"ods-code-3", "ods-code-10", "ods-code-42"}
+
+    with LookupFileParsePool(parse_workers, min_process_bytes=0) as parse_pool:
+        result = load_lookup_files(
+            lookup_file_summaries, ods_codes, download_workers=download_workers, parse_pool=parse_pool)
+
+    assert result == index_sequentially(lookup_file_summaries, ods_codes)
+
+
+def test_load_lookup_files_indexes_every_practice_when_no_ods_codes_are_given(asid_lookup_bucket):
+    lookup_file_summaries = list(asid_lookup_bucket.objects.all())[:4]
+
+    with LookupFileParsePool(2, min_process_bytes=0) as parse_pool:
+        result = load_lookup_files(lookup_file_summaries, download_workers=2, parse_pool=parse_pool)
+
+    assert result == index_sequentially(lookup_file_summaries, None)
+    assert len(result[0]) == 50
+
+
+def test_load_lookup_files_indexes_files_on_one_process_pool_without_forking(asid_lookup_bucket, process_pools):
+    lookup_file_summaries = list(asid_lookup_bucket.objects.all())[:8]
+    ods_codes = {"ods-code-3"}
+
+    with LookupFileParsePool(2, min_process_bytes=0) as parse_pool:
+        result = load_lookup_files(lookup_file_summaries[:4], ods_codes, download_workers=4, parse_pool=parse_pool)
+        result += load_lookup_files(lookup_file_summaries[4:], ods_codes, download_workers=4, parse_pool=parse_pool)
+
+    assert result == index_sequentially(lookup_file_summaries, ods_codes)
+    assert [process_pool.submitted for process_pool in process_pools] == [8]
+    assert process_pools[0]._mp_context.get_start_method() != "fork"
+
+
+def test_load_lookup_files_indexes_files_on_download_threads_until_there_is_enough_to_index(
+        asid_lookup_bucket, process_pools):
+    lookup_file_summaries = list(asid_lookup_bucket.objects.all())[:4]
+    ods_codes = {"ods-code-3"}
+    enough_to_index = sum(summary.size for summary in lookup_file_summaries[1:])
+
+    with LookupFileParsePool(2, min_process_bytes=enough_to_index) as parse_pool:
+        result = load_lookup_files(lookup_file_summaries[:1], ods_codes, download_workers=4, parse_pool=parse_pool)
+        assert process_pools == []
+        result += load_lookup_files(lookup_file_summaries[1:], ods_codes, download_workers=4, parse_pool=parse_pool)
+
+    assert result == index_sequentially(lookup_file_summaries, ods_codes)
+    assert [process_pool.submitted for process_pool in process_pools] == [3]
+
+
+def test_load_lookup_files_never_starts_processes_for_a_single_worker(asid_lookup_bucket, process_pools):
+    lookup_file_summaries = list(asid_lookup_bucket.objects.all())[:4]
+
+    with LookupFileParsePool(1, min_process_bytes=0) as parse_pool:
+        load_lookup_files(lookup_file_summaries, {"ods-code-3"}, download_workers=4, parse_pool=parse_pool)
+
+    assert process_pools == []
+
+
+def test_load_lookup_files_loads_files_larger_than_the_memory_limit_one_at_a_time(asid_lookup_bucket):
+    lookup_file_summaries = list(asid_lookup_bucket.objects.all())[:6]
+    ods_codes = {"ods-code-0"}
+
+    result = load_lookup_files(lookup_file_summaries, ods_codes, download_workers=4, max_buffered_bytes=1)
+
+    assert result == index_sequentially(lookup_file_summaries, ods_codes)
+
+
+def test_load_lookup_files_returns_nothing_for_no_files():
+    assert load_lookup_files([], {"ods-code"}) == []
@@ -2,10 +2,13 @@ import boto3
 import os
 import pytest
 
+from botocore.exceptions import ClientError
+from datetime import datetime
 from moto import mock_s3
+from unittest.mock import ANY, Mock
 
 from chalicelib.lookup_all_asids import lookup_all_asids, ASID_LOOKUP_HEADERS, AsidLookupError
-from chalicelib.migration_occurrences import EMIS_PRODUCT_ID, TPP_PRODUCT_ID, VISION_PRODUCT_ID
+from chalicelib.product_ids import EMIS_PRODUCT_ID, TPP_PRODUCT_ID, VISION_PRODUCT_ID
 from tests.builders.file import build_gzip_csv
 
 
@@ -326,4 +329,208 @@ def test_lookup_all_asids_stops_when_all_asids_are_found(s3):
             "old": old_asid_2
         }
     }
-    assert result == expected_result
\ No newline at end of file
+    assert result == expected_result
+
+def test_lookup_all_asids_uses_last_matching_row_for_each_product_in_a_file(s3):
+    ods_code = "ods-code"
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    asid_lookup_bucket.Object("asid-lookup.csv.gz").put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=[
+                ["old-asid-1", ods_code, "", "", "SystmOne", "", ""],
+                ["new-asid-1", ods_code, "", "", "EMIS Web", "", ""],
+                ["old-asid-2", ods_code, "", "", "Vision 3", "", ""],
+                ["new-asid-2", ods_code, "", "", "EMIS Web", "", ""]
+            ],
+        ))
+
+    migrations = [{
+        "ods_code": ods_code,
+        "product_id": EMIS_PRODUCT_ID
+    }]
+
+    result = lookup_all_asids(s3, bucket_name, migrations)
+
+    expected_result = {
+        "ods-code": {
+            "new": {"asid": "new-asid-2", "name": "EMIS Web"},
+            "old": {"asid": "old-asid-2", "name": "Vision 3"}
+        }}
+    assert result == expected_result
+
+
+def test_lookup_all_asids_prefers_lookup_files_nearest_to_the_migration_date(s3):
+    ods_code = "ods-code"
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    for key in ["2021/1/asidLookup.csv.gz", "2021/5/asidLookup.csv.gz", "2021/7/asidLookup.csv.gz",
+                "2021/12/asidLookup.csv.gz"]:
+        month = key.split("/")[1]
+        asid_lookup_bucket.Object(key).put(
+            Body=build_gzip_csv(
+                header=ASID_LOOKUP_HEADERS,
+                rows=[
+                    [f"old-asid-{month}", ods_code, "", "", "SystmOne", "", ""],
+                    [f"new-asid-{month}", ods_code, "", "", "EMIS Web", "", ""]
+                ],
+            ))
+
+    migrations = [{
+        "ods_code": ods_code,
+        "product_id": EMIS_PRODUCT_ID,
+        "date": datetime(2021, 6, 14)
+    }]
+
+    result = lookup_all_asids(s3, bucket_name, migrations)
+
+    expected_result = {
+        "ods-code": {
+            "new": {"asid": "new-asid-7", "name": "EMIS Web"},
+            "old": {"asid": "old-asid-7", "name": "SystmOne"}
+        }}
+    assert result == expected_result
+
+
+def test_lookup_all_asids_keeps_asid_found_in_nearer_lookup_file(s3):
+    ods_code = "ods-code"
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    asid_lookup_bucket.Object("2021/6/asidLookup.csv.gz").put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=[["new-asid-near", ods_code, "", "", "EMIS Web", "", ""]]))
+    asid_lookup_bucket.Object("2021/3/asidLookup.csv.gz").put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=[
+                ["old-asid-far", ods_code, "", "", "SystmOne", "", ""],
+                ["new-asid-far", ods_code, "", "", "EMIS Web", "", ""]
+            ]))
+
+    migrations = [{
+        "ods_code": ods_code,
+        "product_id": EMIS_PRODUCT_ID,
+        "date": datetime(2021, 6, 14)
+    }]
+
+    result = lookup_all_asids(s3, bucket_name, migrations)
+
+    assert result == {
+        "ods-code": {
+            "new": {"asid": "new-asid-near", "name": "EMIS Web"},
+            "old": {"asid": "old-asid-far", "name": "SystmOne"}
+        }}
+
+
+def test_lookup_all_asids_indexes_every_round_of_lookup_files_with_the_same_parse_pool(s3, monkeypatch):
+    ods_code = "ods-code"
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    asid_lookup_bucket.Object("2021/6/asidLookup.csv.gz").put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=[["new-asid", ods_code, "", "", "EMIS Web", "", ""]]))
+    asid_lookup_bucket.Object("2021/3/asidLookup.csv.gz").put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=[["old-asid", ods_code, "", "", "SystmOne", "", ""]]))
+    from chalicelib import lookup_all_asids as lookup_module
+    parse_pools = []
+    original_load_lookup_files = lookup_module.load_lookup_files
+
+    def load_lookup_files_spy(lookup_file_summaries, *args, **kwargs):
+        parse_pools.append(kwargs["parse_pool"])
+        return original_load_lookup_files(lookup_file_summaries, *args, **kwargs)
+    monkeypatch.setattr("chalicelib.lookup_all_asids.load_lookup_files", load_lookup_files_spy)
+
+    migrations = [{"ods_code": ods_code, "product_id": EMIS_PRODUCT_ID, "date": datetime(2021, 6, 14)}]
+
+    lookup_all_asids(s3, bucket_name, migrations)
+
+    assert len(parse_pools) == 2
+    assert parse_pools[0] is parse_pools[1]
+
+
+def test_lookup_all_asids_does_not_read_lookup_files_once_all_migrations_are_resolved(s3, monkeypatch):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    for key in ["2020/1/asidLookup.csv.gz", "2021/3/asidLookup.csv.gz", "2021/4/asidLookup.csv.gz",
+                "2022/1/asidLookup.csv.gz"]:
+        asid_lookup_bucket.Object(key).put(
+            Body=build_gzip_csv(
+                header=ASID_LOOKUP_HEADERS,
+                rows=[
+                    ["old-asid-1", "ods-code-1", "", "", "SystmOne", "", ""],
+                    ["new-asid-1", "ods-code-1", "", "", "EMIS Web", "", ""],
+                    ["old-asid-2", "ods-code-2", "", "", "EMIS Web", "", ""],
+                    ["new-asid-2", "ods-code-2", "", "", "SystmOne", "", ""]
+                ],
+            ))
+    from chalicelib import lookup_all_asids as lookup_module
+    read_keys = []
+    original_load_lookup_files = lookup_module.load_lookup_files
+
+    def load_lookup_files_spy(lookup_file_summaries, *args, **kwargs):
+        read_keys.extend(summary.key for summary in lookup_file_summaries)
+        return original_load_lookup_files(lookup_file_summaries, *args, **kwargs)
+    monkeypatch.setattr("chalicelib.lookup_all_asids.load_lookup_files", load_lookup_files_spy)
+
+    migrations = [
+        {"ods_code": "ods-code-1", "product_id": EMIS_PRODUCT_ID, "date": datetime(2021, 3, 2)},
+        {"ods_code": "ods-code-2", "product_id": TPP_PRODUCT_ID, "date": datetime(2021, 4, 20)}
+    ]
+
+    lookup_all_asids(s3, bucket_name, migrations)
+
+    assert read_keys == ["2021/3/asidLookup.csv.gz", "2021/4/asidLookup.csv.gz"]
+
+
+def test_lookup_all_asids_selects_matching_rows_when_s3_select_is_enabled(s3, monkeypatch):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    asid_lookup_bucket.Object("asid-lookup.csv.gz").put(
+        Body=build_gzip_csv(header=ASID_LOOKUP_HEADERS, rows=[]))
+    select_csv_rows_s3_mock = Mock(return_value=[
+        {"NACS": "ods-code", "PName": "SystmOne", "ASID": "09876"},
+        {"NACS": "ods-code", "PName": "EMIS Web", "ASID": "12345"}
+    ])
+    monkeypatch.setattr("chalicelib.load_lookup_files.select_csv_rows_s3", select_csv_rows_s3_mock)
+
+    migrations = [{"ods_code": "ods-code", "product_id": EMIS_PRODUCT_ID}]
+
+    result = lookup_all_asids(s3, bucket_name, migrations, use_s3_select=True)
+
+    assert result == {
+        "ods-code": {
+            "new": {"asid": "12345", "name": "EMIS Web"},
+            "old": {"asid": "09876", "name": "SystmOne"}
+        }}
+    select_csv_rows_s3_mock.assert_called_once_with(ANY, "NACS", {"ods-code"}, ["NACS", "PName", "ASID"])
+
+
+def test_lookup_all_asids_downloads_lookup_files_when_s3_select_is_rejected(s3, monkeypatch):
+    bucket_name = "test-bucket"
+    asid_lookup_bucket = s3.create_bucket(Bucket=bucket_name)
+    asid_lookup_bucket.Object("asid-lookup.csv.gz").put(
+        Body=build_gzip_csv(
+            header=ASID_LOOKUP_HEADERS,
+            rows=[
+                ["09876", "ods-code", "", "", "SystmOne", "", ""],
+                ["12345", "ods-code", "", "", "EMIS Web", "", ""]
+            ],
+        ))
+    monkeypatch.setattr(
+        "chalicelib.load_lookup_files.select_csv_rows_s3",
+        Mock(side_effect=ClientError({"Error": {"Code": "MethodNotAllowed"}}, "SelectObjectContent")))
+
+    migrations = [{"ods_code": "ods-code", "product_id": EMIS_PRODUCT_ID}]
+
+    result = lookup_all_asids(s3, bucket_name, migrations, use_s3_select=True)
+
+    assert result == {
+        "ods-code": {
+            "new": {"asid": "12345", "name": "EMIS Web"},
+            "old": {"asid": "09876", "name": "SystmOne"}
+        }}
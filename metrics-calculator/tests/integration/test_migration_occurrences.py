@@ -4,9 +4,11 @@ import pytest
 
 from datetime import datetime
 from moto import mock_s3
+from unittest.mock import Mock
 
+from chalicelib import migration_occurrences
 from chalicelib.migration_occurrences import get_migration_occurrences
-from tests.builders.file import build_gzip_csv
+from tests.builders.file import build_gzip_csv, build_xlsx
 
 
 @pytest.fixture(scope='function')
@@ -58,6 +60,7 @@ def test_returns_migration_data_for_foundation_supplier_solutions(s3, expected_s
     assert migration["supplier_id"] == expected_supplier_id
     assert migration["product_id"] == expected_product_id
     assert migration["date"] == datetime(2021, 5, 11)
+    assert type(migration["date"]) is datetime
 
 
 def test_does_not_return_data_for_other_solutions(s3):
@@ -70,14 +73,79 @@ def test_does_not_return_data_for_other_solutions(s3):
     assert len(known_migrations) == 0
 
 
+def test_returns_each_migration_once_using_the_most_recently_modified_object(s3):
+    occurrences_bucket = s3.create_bucket(Bucket="test-bucket")
+    upload_test_migration_occurrences(
+        occurrences_bucket, "T54321", "A Test CCG", "A Test Practice", "10000", "10000-001", key="2021-06-activations.csv")
+    upload_test_migration_occurrences(
+        occurrences_bucket, "T54321", "A Renamed CCG", "A Test Practice", "10000", "10000-001", key="2021-07-activations.csv")
+    upload_test_migration_occurrences(
+        occurrences_bucket, "T54321", "A Test CCG", "A Test Practice", "10052", "10052-002", key="2021-08-activations.csv")
+
+    known_migrations = get_migration_occurrences(s3, occurrences_bucket.name)
+
+    assert [(migration["product_id"], migration["ccg_name"]) for migration in known_migrations] == [
+        ("10000-001", "A Renamed CCG"), ("10052-002", "A Test CCG")]
+
+
+def test_only_parses_objects_added_or_changed_since_the_manifest_was_written(s3, monkeypatch, tmp_path):
+    manifest_location = str(tmp_path / "occurrences-manifest.json.gz")
+    occurrences_bucket = s3.create_bucket(Bucket="test-bucket")
+    upload_test_migration_occurrences(
+        occurrences_bucket, "T54321", "A Test CCG", "A Test Practice", "10000", "10000-001", key="2021-06-activations.csv")
+    upload_test_migration_occurrences(
+        occurrences_bucket, "T12345", "A Test CCG", "Another Practice", "10052", "10052-002", key="2021-07-activations.csv")
+    first_run = get_migration_occurrences(s3, occurrences_bucket.name, manifest_location)
+
+    parse_spy = Mock(wraps=migration_occurrences._parse_occurrences_csv)
+    monkeypatch.setattr("chalicelib.migration_occurrences._parse_occurrences_csv", parse_spy)
+    second_run = get_migration_occurrences(s3, occurrences_bucket.name, manifest_location)
+
+    assert second_run == first_run
+    assert parse_spy.call_count == 0
+
+    upload_test_migration_occurrences(
+        occurrences_bucket, "T12345", "A Test CCG", "A Renamed Practice", "10052", "10052-002", key="2021-07-activations.csv")
+    third_run = get_migration_occurrences(s3, occurrences_bucket.name, manifest_location)
+
+    assert [migration["practice_name"] for migration in third_run] == ["A Test Practice", "A Renamed Practice"]
+    assert parse_spy.call_count == 1
+
+
+def test_returns_migration_data_from_the_pending_activations_worksheet_of_a_finance_export(s3):
+    occurrences_bucket = s3.create_bucket(Bucket="test-bucket")
+    occurrences_bucket.Object("finance-export-jun21.xlsx").put(
+        Body=build_xlsx({
+            "Invoices": [["Supplier ID", "Amount"], ["10000", 100]],
+            "Pending Act Upload ": [
+                ["Service Recipient ID (e.g. ODS code where this is available)", "Call Off Ordering Party name",
+                 "Service Recipient Name", "Supplier ID", "Product ID ", "Actual M1 date"],
+                ["T54321", "A Test CCG", "A Test Practice", 10000, "10000-001", datetime(2021, 5, 11)],
+                ["T12345", "A Test CCG", "Another Practice", 10046, "10046-001", datetime(2021, 5, 12)],
+            ]
+        }))
+
+    known_migrations = get_migration_occurrences(s3, occurrences_bucket.name)
+
+    assert known_migrations == [{
+        "ods_code": "T54321",
+        "ccg_name": "A Test CCG",
+        "practice_name": "A Test Practice",
+        "supplier_id": "10000",
+        "product_id": "10000-001",
+        "date": datetime(2021, 5, 11)
+    }]
+
+
 def upload_test_migration_occurrences(
         occurrences_bucket,
         expected_ods_code,
         expected_ccg,
         expected_practice,
         expected_supplier_id,
-        expected_product_id):
-    occurrences_bucket.Object("activations-jun21.csv").put(
+        expected_product_id,
+        key="activations-jun21.csv"):
+    occurrences_bucket.Object(key).put(
         Body=build_gzip_csv(
             header=["Service Recipient ID (e.g. ODS code where this is available)", "Change Status", "Call Off Ordering Party name", "Service Recipient Name", "Supplier ID", "Supplier Name", "Product Name ",
                     "Product ID ", "\"Product Type (Catalogue solution, Additional Service, Associated Service)\"", "M1 planned (Delivery Date)", "", "Actual M1 date", "Buyer verification date (M2)"],
@@ -0,0 +1,112 @@
+import boto3
+import os
+import pytest
+
+from datetime import datetime
+from moto import mock_s3
+
+from chalicelib.migration import Migration, MigrationMetrics
+from chalicelib.migration_results import load_migration_results
+from chalicelib.s3 import list_object_etags
+
+TELEMETRY_BUCKET_NAME = "telemetry-bucket"
+PATIENT_REGISTRATIONS_BUCKET_NAME = "patient-registrations-bucket"
+
+
+@pytest.fixture(scope='function')
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture(scope='function')
+def s3(aws_credentials):
+    with mock_s3():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        telemetry_bucket = s3.create_bucket(Bucket=TELEMETRY_BUCKET_NAME)
+        telemetry_bucket.put_object(Key="12345-telemetry.csv.gz", Body=b"old telemetry")
+        telemetry_bucket.put_object(Key="09876-telemetry.csv.gz", Body=b"new telemetry")
+        registrations_bucket = s3.create_bucket(Bucket=PATIENT_REGISTRATIONS_BUCKET_NAME)
+        registrations_bucket.put_object(Key="july-2021-gp-reg-pat-prac-all.csv.gz", Body=b"registrations")
+        yield s3
+
+
+def a_migration(ods_code="A12345"):
+    return Migration(ods_code, "CCG", "Practice", "10000", "10000-001", datetime(2021, 7, 11))
+
+
+def an_asid_lookup(old_asid="12345", new_asid="09876"):
+    return {"old": {"asid": old_asid, "name": "EMIS Web"}, "new": {"asid": new_asid, "name": "SystmOne"}}
+
+
+def some_metrics(ods_code="A12345"):
+    return MigrationMetrics(
+        cutover_startdate="2021-07-10T00:00:00", cutover_enddate="2021-07-14T00:00:00", cutover_duration=4,
+        ods_code=ods_code, ccg_name="CCG", practice_name="Practice", patient_registration_count=1000,
+        source_system="EMIS Web", target_system="SystmOne")
+
+
+def load(s3, location):
+    return load_migration_results(
+        s3, location, list_object_etags(s3, TELEMETRY_BUCKET_NAME), list_object_etags(s3, PATIENT_REGISTRATIONS_BUCKET_NAME))
+
+
+def test_returns_stored_metrics_when_inputs_are_unchanged(s3, tmp_path):
+    location = str(tmp_path / "migration-results.json.gz")
+    first_run = load(s3, location)
+    assert first_run.get(a_migration(), an_asid_lookup()) is None
+    first_run.put(a_migration(), an_asid_lookup(), some_metrics())
+    first_run.save(s3, location)
+
+    second_run = load(s3, location)
+
+    assert second_run.get(a_migration(), an_asid_lookup()) == some_metrics()
+
+
+@pytest.mark.parametrize("change_inputs", [
+    lambda s3: s3.Object(TELEMETRY_BUCKET_NAME, "09876-telemetry.csv.gz").put(Body=b"updated telemetry"),
+    lambda s3: s3.Object(PATIENT_REGISTRATIONS_BUCKET_NAME, "july-2021-gp-reg-pat-prac-all.csv.gz").put(
+        Body=b"updated registrations"),
+])
+def test_returns_none_when_input_objects_have_changed(s3, tmp_path, change_inputs):
+    location = str(tmp_path / "migration-results.json.gz")
+    first_run = load(s3, location)
+    first_run.put(a_migration(), an_asid_lookup(), some_metrics())
+    first_run.save(s3, location)
+    change_inputs(s3)
+
+    second_run = load(s3, location)
+
+    assert second_run.get(a_migration(), an_asid_lookup()) is None
+
+
+def test_returns_none_when_asids_have_changed(s3, tmp_path):
+    location = str(tmp_path / "migration-results.json.gz")
+    first_run = load(s3, location)
+    first_run.put(a_migration(), an_asid_lookup(), some_metrics())
+    first_run.save(s3, location)
+
+    second_run = load(s3, location)
+
+    assert second_run.get(a_migration(), an_asid_lookup(new_asid="13579")) is None
+
+
+def test_drops_migrations_not_seen_since_loading_when_saved(s3):
+    s3.create_bucket(Bucket="results-bucket")
+    location = "s3://results-bucket/migration-results.json.gz"
+    first_run = load(s3, location)
+    first_run.put(a_migration("A12345"), an_asid_lookup(), some_metrics("A12345"))
+    first_run.put(a_migration("B12345"), an_asid_lookup(), some_metrics("B12345"))
+    first_run.save(s3, location)
+    second_run = load(s3, location)
+    second_run.get(a_migration("A12345"), an_asid_lookup())
+    second_run.save(s3, location)
+
+    third_run = load(s3, location)
+
+    assert third_run.get(a_migration("A12345"), an_asid_lookup()) == some_metrics("A12345")
+    assert third_run.get(a_migration("B12345"), an_asid_lookup()) is None
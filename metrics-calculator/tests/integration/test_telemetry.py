@@ -1,13 +1,15 @@
 import boto3
 import gzip
 import os
+from io import BytesIO
 import pytest
 
 from datetime import date
 from moto import mock_s3
 
 from chalicelib.s3 import read_object_s3, _object_from_uri
-from chalicelib.telemetry import upload_telemetry, GetTelemetryError, get_telemetry
+from chalicelib.telemetry import upload_telemetry, GetTelemetryError, get_telemetry, upload_telemetry_stream
+from tests.builders.file import build_gzip_csv
 
 
 @pytest.fixture(scope='function')
@@ -35,6 +37,19 @@ def test_get_telemetry_raises_error_when_no_telemetry_found(s3):
         get_telemetry(s3, bucket_name, filename)
 
 
+def test_get_telemetry_reads_telemetry_days(s3):
+    bucket_name = "bucket-name"
+    filename = "telemetry-file"
+    s3.create_bucket(Bucket=bucket_name)
+    s3.Object(bucket_name, filename).put(Body=build_gzip_csv(
+        header=["_time", "count", "avgmin2std"],
+        rows=[["2021-11-25T00:00:00", "2000", "1044.7"], ["2021-11-26T00:00:00", "2854", "1044.7"]]))
+
+    telemetry = get_telemetry(s3, bucket_name, filename)
+
+    assert list(telemetry) == [(18956, 2000, 1044.7, None), (18957, 2854, 1044.7, None)]
+
+
 def test_upload_telemetry_uploads_zipped_telemetry(s3):
     bucket_name = "bucket-name"
     telemetry_data = b"telemetry-data"
@@ -61,3 +76,41 @@ def test_upload_telemetry_saves_start_and_end_dates_as_metadata(s3):
     returned_metadata = response["Metadata"]
     assert returned_metadata["start_date"] == "2021-04-06"
     assert returned_metadata["end_date"] == "2021-06-28"
+
+
+def test_get_telemetry_reads_baseline_threshold_saved_by_upload_telemetry(s3):
+    bucket_name = "bucket-name"
+    filename = "telemetry-file"
+    s3.create_bucket(Bucket=bucket_name)
+    upload_telemetry(
+        s3, bucket_name, b'"_time",count\n"2021-11-25T00:00:00",2000\n', filename,
+        date(2021, 11, 25), date(2021, 11, 26), baseline_threshold=1044.7)
+
+    telemetry = get_telemetry(s3, bucket_name, filename)
+
+    assert list(telemetry) == [(18956, 2000, 1044.7, None)]
+
+
+def test_upload_telemetry_stream_uploads_zipped_telemetry_with_metadata(s3):
+    bucket_name = "bucket-name"
+    filename = "telemetry-file"
+    s3.create_bucket(Bucket=bucket_name)
+
+    upload_telemetry_stream(
+        s3, bucket_name, BytesIO(gzip.compress(b"telemetry-data")), filename, date(2021, 4, 6), date(2021, 6, 28),
+        baseline_threshold=1044.7)
+
+    response = _object_from_uri(s3, f"s3://{bucket_name}/{filename}").get()
+    assert gzip.decompress(response["Body"].read()) == b"telemetry-data"
+    assert response["Metadata"] == {"start_date": "2021-04-06", "end_date": "2021-06-28", "baseline_threshold": "1044.7"}
+
+
+def test_upload_telemetry_stream_uploads_large_telemetry_in_parts(s3):
+    bucket_name = "bucket-name"
+    filename = "telemetry-file"
+    s3.create_bucket(Bucket=bucket_name)
+    zipped_telemetry_data = os.urandom(9 * 1024 * 1024)
+
+    upload_telemetry_stream(s3, bucket_name, BytesIO(zipped_telemetry_data), filename, date(2021, 4, 6), date(2021, 6, 28))
+
+    assert _object_from_uri(s3, f"s3://{bucket_name}/{filename}").e_tag.endswith('-2"')
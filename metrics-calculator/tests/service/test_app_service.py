@@ -1,9 +1,11 @@
 import gzip
+from io import BytesIO
 
 import boto3
 import json
 import pytest
 import os
+import urllib.parse
 
 from moto import mock_s3, mock_ssm
 from unittest.mock import MagicMock, Mock
@@ -15,12 +17,17 @@ from chalicelib.lookup_all_asids import ASID_LOOKUP_HEADERS
 from tests.builders.file import build_gzip_csv
 
 
-SPINE_BASELINE_DATA = b"""_time,avgmin2std
-    2021-12-08T00:00:00.000+0000,200.0"""
-SPINE_PRE_CUTOVER_DATA = b"""_time,count,avgmin2std
-    2021-12-08T00:00:00.000+0000,20,200.0"""
-SPINE_POST_CUTOVER_DATA = b"""_time,count,avgmin2std
-    2021-12-08T00:00:00.000+0000,20,200.0"""
+SPINE_BASELINE_DATA = b"""_time,count
+    2021-12-06T00:00:00,210
+    2021-12-07T00:00:00,205
+    2021-12-08T00:00:00,215"""
+SPINE_PRE_CUTOVER_DATA = b"""_time,count
+2021-11-25T00:00:00.000+0000,210
+2021-11-26T00:00:00.000+0000,190
+2021-11-29T00:00:00.000+0000,190"""
+SPINE_POST_CUTOVER_DATA = b"""_time,count
+2021-12-01T00:00:00.000+0000,190
+2021-12-02T00:00:00.000+0000,210"""
 
 
 @pytest.fixture(scope='function')
@@ -54,10 +61,17 @@ def test_client():
 
 @pytest.fixture(scope="function")
 def splunk_response(monkeypatch):
+    """Called with the body of each request sent to Splunk, which can be sent on any thread."""
     response_mock = Mock()
-    connection_mock = Mock(return_value=MagicMock(getresponse=response_mock))
+
+    def connection(host):
+        requests = []
+        return MagicMock(
+            request=lambda method, url, body, headers: requests.append(body),
+            getresponse=lambda: response_mock(urllib.parse.parse_qs(requests[-1])))
+
     monkeypatch.setattr(
-        "chalicelib.get_data_from_splunk.HTTPSConnection", connection_mock)
+        "chalicelib.get_data_from_splunk.HTTPSConnection", connection)
     yield response_mock
 
 
@@ -114,7 +128,11 @@ def test_calculate_dashboard_metrics_from_telemetry(
             "source_system": "SystmOne",
             "target_system": "EMIS Web",
             "count": 1,
-            "mean_duration": 4
+            "mean_duration": 4,
+            "median_duration": 4,
+            "p90_duration": 4,
+            "min_duration": 4,
+            "max_duration": 4
         }],
         "migrations": [{
             "cutover_startdate": "2021-12-02T00:00:00+00:00",
@@ -128,6 +146,14 @@ def test_calculate_dashboard_metrics_from_telemetry(
             "ods_code": ods_code
         }]}
 
+    cutover_cube_body = metrics_bucket.Object("cutover-cube.json").get()['Body'].read().decode('utf-8')
+    assert json.loads(cutover_cube_body) == {
+        "version": 1,
+        "dimensions": ["month", "ccg_name", "source_system", "target_system"],
+        "values": [["2021-05"], [ccg], ["SystmOne"], ["EMIS Web"]],
+        "cells": [[0, 0, 0, 0, 1, 4, 16, [[4, 1]]]]
+    }
+
 
 def test_export_splunk_data(
         test_client, exporter_lambda_env_vars, s3, ssm, splunk_response):
@@ -145,7 +171,7 @@ def test_export_splunk_data(
         occurrences_bucket_name, s3, ods_code, ccg, practice)
     create_asid_lookup_data(
         asid_lookup_bucket_name, s3, ods_code, old_asid, new_asid)
-    create_mock_splunk_data(splunk_response)
+    create_mock_splunk_data(splunk_response, old_asid)
 
     response = test_client.lambda_.invoke('splunk-data-exporter')
     assert response.payload == "ok"
@@ -163,6 +189,39 @@ def test_export_splunk_data(
     assert unzipped_post_cutover_telemetry == SPINE_POST_CUTOVER_DATA
 
 
+def test_calculate_dashboard_metrics_from_exported_telemetry_uses_its_baseline_threshold(
+        test_client, exporter_lambda_env_vars, calculator_lambda_env_vars, s3, ssm, splunk_response):
+    ods_code = "A12345"
+    old_asid = "1234"
+    new_asid = "5678"
+    telemetry_bucket = s3.create_bucket(Bucket=exporter_lambda_env_vars["TELEMETRY_BUCKET_NAME"])
+    ccg = "My CCG"
+    practice = "My First Surgery"
+    set_splunk_api_token(ssm)
+    create_occurrences_data(
+        exporter_lambda_env_vars["OCCURRENCES_BUCKET_NAME"], s3, ods_code, ccg, practice)
+    create_asid_lookup_data(
+        exporter_lambda_env_vars["ASID_LOOKUP_BUCKET_NAME"], s3, ods_code, old_asid, new_asid)
+    create_patient_registrations_data(
+        calculator_lambda_env_vars["PATIENT_REGISTRATIONS_BUCKET_NAME"], s3, ods_code)
+    metrics_bucket = create_metrics_bucket(calculator_lambda_env_vars["METRICS_BUCKET_NAME"], s3)
+    create_mock_splunk_data(splunk_response, old_asid)
+
+    assert test_client.lambda_.invoke('splunk-data-exporter').payload == "ok"
+
+    # The baseline weekday counts of 210, 205 and 215 give a threshold of 210 - 2 * 5
+    pre_cutover_telemetry_obj = telemetry_bucket.Object(f"{old_asid}-telemetry.csv.gz").get()
+    assert float(pre_cutover_telemetry_obj["Metadata"]["baseline_threshold"]) == pytest.approx(200.0)
+
+    assert test_client.lambda_.invoke('calculate_dashboard_metrics_from_telemetry').payload == "ok"
+
+    migrations_body = metrics_bucket.Object("migrations.json").get()['Body'].read().decode('utf-8')
+    [migration] = json.loads(migrations_body)["migrations"]
+    assert migration["cutover_startdate"] == "2021-11-26T00:00:00+00:00"
+    assert migration["cutover_enddate"] == "2021-12-02T00:00:00+00:00"
+    assert migration["cutover_duration"] == 6
+
+
 def set_splunk_api_token(ssm):
     ssm.put_parameter(
         Name="/prod/splunk-api-token",
@@ -242,10 +301,19 @@ def create_metrics_bucket(metrics_bucket_name, s3):
     return metrics_bucket
 
 
-def create_mock_splunk_data(splunk_response):
+def create_mock_splunk_data(splunk_response, old_asid):
+    def splunk_data(request):
+        search_text = request["search"][0]
+        if "stats count by _time" in search_text:
+            return aSplunkResponse(SPINE_BASELINE_DATA)
+        if f"messageSender={old_asid}" in search_text:
+            return aSplunkResponse(SPINE_PRE_CUTOVER_DATA)
+        return aSplunkResponse(SPINE_POST_CUTOVER_DATA)
+
+    splunk_response.side_effect = splunk_data
+
 
-    splunk_response.side_effect = [
-        Mock(status=200, read=lambda: SPINE_BASELINE_DATA),
-        Mock(status=200, read=lambda: SPINE_PRE_CUTOVER_DATA),
-        Mock(status=200, read=lambda: SPINE_POST_CUTOVER_DATA),
-    ]
+def aSplunkResponse(body):
+    body_stream = BytesIO(body)
+    return Mock(
+        status=200, read=body_stream.read, will_close=False, isclosed=lambda: body_stream.tell() == len(body))
@@ -1,8 +1,10 @@
+import gzip
 import json
 import os
 from datetime import date, timedelta
 from functools import reduce
 from itertools import chain
+from threading import Barrier
 from unittest.mock import ANY, Mock
 
 import pytest
@@ -11,6 +13,7 @@ from app import calculate_dashboard_metrics_from_telemetry, export_splunk_data
 from chalicelib.get_data_from_splunk import SplunkTelemetryMissing
 from chalicelib.get_patient_registration_count import PatientRegistrationsError
 from chalicelib.telemetry import GetTelemetryError
+from chalicelib.telemetry_series import TelemetryParseError
 from anys import AnyWithEntries, Not
 
 NEW_ASID = "09876"
@@ -58,6 +61,13 @@ def upload_telemetry_mock(monkeypatch):
     yield mock
 
 
+@pytest.fixture
+def upload_telemetry_stream_mock(monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr("app.upload_telemetry_stream", mock)
+    yield mock
+
+
 @pytest.fixture
 def occurrences_mock(monkeypatch):
     mock = Mock(return_value=[aMigrationOccurrence()])
@@ -105,7 +115,7 @@ def get_splunk_api_token_mock(monkeypatch):
 
 @pytest.fixture
 def parse_threshold_from_telemetry_mock(monkeypatch):
-    mock = Mock(return_value="101")
+    mock = Mock(return_value=101.0)
     monkeypatch.setattr("app.parse_threshold_from_telemetry", mock)
     yield mock
 
@@ -113,18 +123,16 @@ def parse_threshold_from_telemetry_mock(monkeypatch):
 @pytest.fixture
 def get_baseline_telemetry_from_splunk_mock(monkeypatch):
     mock = Mock(
-        return_value="""_time",count,avgmin2std
-"2021-09-06T00:00:00.000+0000",1500,"4537.33933970307""")
+        return_value="""_time",count
+"2021-09-06T00:00:00.000+0000",1500""")
     monkeypatch.setattr("app.get_baseline_telemetry_from_splunk", mock)
     yield mock
 
 
 @pytest.fixture
-def get_telemetry_from_splunk_mock(monkeypatch):
-    mock = Mock(
-        return_value="""_time",count,avgmin2std
-"2021-09-06T00:00:00.000+0000",2,"4537.33933970307""")
-    monkeypatch.setattr("app.get_telemetry_from_splunk", mock)
+def get_telemetry_stream_from_splunk_mock(monkeypatch):
+    mock = Mock(return_value=Mock())
+    monkeypatch.setattr("app.get_telemetry_stream_from_splunk", mock)
     yield mock
 
 
@@ -153,6 +161,13 @@ def engine_mock(monkeypatch):
     yield mock
 
 
+@pytest.fixture
+def lookup_all_patient_registration_counts_mock(monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr("app.lookup_all_patient_registration_counts", mock)
+    yield mock
+
+
 @pytest.fixture
 def get_patient_registration_count_mock(monkeypatch):
     mock = Mock()
@@ -162,9 +177,9 @@ def get_patient_registration_count_mock(monkeypatch):
 
 
 @pytest.fixture
-def calculate_migrations_stats_per_supplier_combination_mock(monkeypatch):
+def supplier_combination_stats_mock(monkeypatch):
     mock = Mock()
-    monkeypatch.setattr("app.calculate_migrations_stats_per_supplier_combination", mock)
+    monkeypatch.setattr("app.SupplierCombinationStats", mock)
     yield mock
 
 
@@ -175,6 +190,34 @@ def upload_migrations_mock(monkeypatch):
     yield mock
 
 
+@pytest.fixture(scope="function")
+def upload_cutover_cube_mock(monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr("app.upload_cutover_cube", mock)
+    yield mock
+
+
+@pytest.fixture(scope="function")
+def list_object_etags_mock(monkeypatch):
+    mock = Mock(return_value={"key": "etag"})
+    monkeypatch.setattr("app.list_object_etags", mock)
+    yield mock
+
+
+@pytest.fixture(scope="function")
+def read_input_fingerprint_mock(monkeypatch):
+    mock = Mock(return_value=None)
+    monkeypatch.setattr("app.read_input_fingerprint", mock)
+    yield mock
+
+
+@pytest.fixture(scope="function")
+def write_input_fingerprint_mock(monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr("app.write_input_fingerprint", mock)
+    yield mock
+
+
 @pytest.fixture(scope="function")
 def mock_defaults(
         s3_resource_mock,
@@ -186,13 +229,19 @@ def mock_defaults(
         lookup_all_asids_mock,
         parse_threshold_from_telemetry_mock,
         get_splunk_api_token_mock,
-        get_telemetry_from_splunk_mock,
+        get_telemetry_stream_from_splunk_mock,
         upload_telemetry_mock,
+        upload_telemetry_stream_mock,
         get_baseline_telemetry_from_splunk_mock,
         objects_exist_mock,
         engine_mock,
+        lookup_all_patient_registration_counts_mock,
         get_patient_registration_count_mock,
-        upload_migrations_mock):
+        upload_migrations_mock,
+        upload_cutover_cube_mock,
+        list_object_etags_mock,
+        read_input_fingerprint_mock,
+        write_input_fingerprint_mock):
     pass
 
 
@@ -271,7 +320,11 @@ def test_calculate_dashboard_metrics_from_telemetry_ignores_asid_lookup_failures
                 "source_system": ANY,
                 "target_system": ANY,
                 "count": ANY,
-                "mean_duration": ANY
+                "mean_duration": ANY,
+                "median_duration": ANY,
+                "p90_duration": ANY,
+                "min_duration": ANY,
+                "max_duration": ANY
             }],
             "migrations": [AnyWithEntries({
                 "practice_name": migration_occurrence_2["practice_name"],
@@ -312,7 +365,11 @@ def test_calculate_dashboard_metrics_from_telemetry_ignores_migrations_with_miss
                 "source_system": ANY,
                 "target_system": ANY,
                 "count": ANY,
-                "mean_duration": ANY
+                "mean_duration": ANY,
+                "median_duration": ANY,
+                "p90_duration": ANY,
+                "min_duration": ANY,
+                "max_duration": ANY
             }],
             "migrations": [AnyWithEntries({
                 "practice_name": migration_occurrence_2["practice_name"],
@@ -322,6 +379,36 @@ def test_calculate_dashboard_metrics_from_telemetry_ignores_migrations_with_miss
         })
 
 
+def test_calculate_dashboard_metrics_from_telemetry_ignores_migrations_with_malformed_telemetry(
+        mock_defaults,
+        occurrences_mock,
+        lookup_all_asids_mock,
+        telemetry_mock,
+        engine_mock,
+        upload_migrations_mock):
+    migration_occurrence_1 = aMigrationOccurrence("A11111")
+    migration_occurrence_2 = aMigrationOccurrence("B22222", "CCG Name", "Practice Name")
+    occurrences_mock.return_value = [
+        migration_occurrence_1, migration_occurrence_2]
+    lookup_all_asids_mock.return_value = {
+        migration_occurrence_1["ods_code"]: anAsidPair("12345", "098765"),
+        migration_occurrence_2["ods_code"]: anAsidPair("13579", "08642")
+    }
+    telemetry_mock.side_effect = lambda s3, telemetry_bucket_name, telemetry_object_name: iter([])
+    engine_mock.side_effect = [
+        TelemetryParseError("Unexpected telemetry timestamp 2021-11-25T13:00:00"), engine_mock.return_value]
+
+    calculate_dashboard_metrics_from_telemetry({}, {})
+
+    upload_migrations_mock.assert_called_once_with(
+        ANY,
+        {
+            "mean_cutover_duration": ANY,
+            "supplier_combination_stats": ANY,
+            "migrations": [AnyWithEntries({"ods_code": migration_occurrence_2["ods_code"]})]
+        })
+
+
 def test_calculate_dashboard_metrics_from_telemetry_includes_metrics_for_multiple_migrations(
         mock_defaults,
         occurrences_mock,
@@ -389,7 +476,7 @@ def test_calculate_dashboard_metrics_from_telemetry_calculates_average_cutover_d
     telemetry_mock.side_effect = chain(
         *map(lambda _: (old_telemetry_generator(), new_telemetry_generator()), durations))
     engine_mock.side_effect = map(
-        lambda x: {"ods_code": "", "cutover_duration": x}, durations)
+        lambda x: {"cutover_startdate": "", "cutover_enddate": "", "cutover_duration": x}, durations)
 
     calculate_dashboard_metrics_from_telemetry({}, {})
 
@@ -411,6 +498,108 @@ def test_calculate_dashboard_metrics_from_telemetry_retrieves_number_of_register
     get_patient_registration_count_mock.assert_called_once()
 
 
+def test_calculate_dashboard_metrics_from_telemetry_looks_up_registrations_once_for_all_migrations(
+        mock_defaults,
+        calculator_lambda_env_vars,
+        occurrences_mock,
+        lookup_all_patient_registration_counts_mock,
+        get_patient_registration_count_mock):
+
+    calculate_dashboard_metrics_from_telemetry({}, {})
+
+    lookup_all_patient_registration_counts_mock.assert_called_once_with(
+        ANY, calculator_lambda_env_vars["PATIENT_REGISTRATIONS_BUCKET_NAME"], occurrences_mock.return_value, False)
+    get_patient_registration_count_mock.assert_called_once_with(
+        lookup_all_patient_registration_counts_mock.return_value, ANY)
+
+
+def test_calculate_dashboard_metrics_from_telemetry_only_calculates_migrations_without_stored_results(
+        mock_defaults,
+        calculator_lambda_env_vars,
+        occurrences_mock,
+        lookup_all_asids_mock,
+        engine_mock,
+        lookup_all_patient_registration_counts_mock,
+        list_object_etags_mock,
+        upload_migrations_mock,
+        monkeypatch):
+    stored_migration = aMigrationOccurrence("A11111")
+    new_migration = aMigrationOccurrence("A32323")
+    occurrences_mock.return_value = [stored_migration, new_migration]
+    lookup_all_asids_mock.return_value = {"A11111": anAsidPair(), "A32323": anAsidPair()}
+    stored_metrics = {"cutover_duration": 3, "ods_code": "A11111", "source_system": "EMIS Web",
+                      "target_system": "SystmOne", "ccg_name": "Test CCG"}
+    migration_results = Mock()
+    migration_results.get.side_effect = \
+        lambda migration, asid_lookup: stored_metrics if migration is stored_migration else None
+    load_migration_results_mock = Mock(return_value=migration_results)
+    monkeypatch.setattr("app.load_migration_results", load_migration_results_mock)
+    monkeypatch.setenv("MIGRATION_RESULTS_LOCATION", "s3://results-bucket/migration-results.json.gz")
+
+    calculate_dashboard_metrics_from_telemetry({}, {})
+
+    load_migration_results_mock.assert_called_once_with(
+        ANY, "s3://results-bucket/migration-results.json.gz", list_object_etags_mock.return_value,
+        list_object_etags_mock.return_value)
+    engine_mock.assert_called_once()
+    lookup_all_patient_registration_counts_mock.assert_called_once_with(ANY, ANY, [new_migration], False)
+    migration_results.put.assert_called_once_with(new_migration, ANY, AnyWithEntries({"ods_code": "A32323"}))
+    migration_results.save.assert_called_once_with(ANY, "s3://results-bucket/migration-results.json.gz")
+    upload_migrations_mock.assert_called_once_with(ANY, AnyWithEntries({
+        "migrations": [stored_metrics, AnyWithEntries({"ods_code": "A32323"})]
+    }))
+
+
+def test_calculate_dashboard_metrics_from_telemetry_fingerprints_a_listing_of_each_input_bucket(
+        mock_defaults,
+        calculator_lambda_env_vars,
+        list_object_etags_mock,
+        write_input_fingerprint_mock):
+    calculate_dashboard_metrics_from_telemetry({}, {})
+
+    assert sorted(call.args[1] for call in list_object_etags_mock.call_args_list) == sorted([
+        calculator_lambda_env_vars["OCCURRENCES_BUCKET_NAME"],
+        calculator_lambda_env_vars["ASID_LOOKUP_BUCKET_NAME"],
+        calculator_lambda_env_vars["TELEMETRY_BUCKET_NAME"],
+        calculator_lambda_env_vars["PATIENT_REGISTRATIONS_BUCKET_NAME"]])
+    write_input_fingerprint_mock.assert_called_once_with(
+        ANY, f"s3://{calculator_lambda_env_vars['METRICS_BUCKET_NAME']}/migrations-input-fingerprint.txt", ANY)
+
+
+def test_calculate_dashboard_metrics_from_telemetry_skips_run_when_inputs_are_unchanged(
+        mock_defaults,
+        occurrences_mock,
+        read_input_fingerprint_mock,
+        write_input_fingerprint_mock,
+        upload_migrations_mock):
+    calculate_dashboard_metrics_from_telemetry({}, {})
+    read_input_fingerprint_mock.return_value = write_input_fingerprint_mock.call_args.args[2]
+    occurrences_mock.reset_mock()
+    upload_migrations_mock.reset_mock()
+
+    result = calculate_dashboard_metrics_from_telemetry({}, {})
+
+    assert result == "ok"
+    occurrences_mock.assert_not_called()
+    upload_migrations_mock.assert_not_called()
+
+
+def test_calculate_dashboard_metrics_from_telemetry_recalculates_unchanged_inputs_when_forced(
+        mock_defaults,
+        telemetry_mock,
+        read_input_fingerprint_mock,
+        write_input_fingerprint_mock,
+        upload_migrations_mock):
+    telemetry_mock.side_effect = None
+    calculate_dashboard_metrics_from_telemetry({}, {})
+    read_input_fingerprint_mock.return_value = write_input_fingerprint_mock.call_args.args[2]
+    upload_migrations_mock.reset_mock()
+
+    calculate_dashboard_metrics_from_telemetry({"force": True}, {})
+
+    upload_migrations_mock.assert_called_once()
+
+
 def test_calculate_dashboard_metrics_from_telemetry_uploads_number_of_registered_patients_per_practice(
         mock_defaults,
         get_patient_registration_count_mock,
@@ -457,7 +646,7 @@ def test_calculate_dashboard_metrics_from_telemetry_calculates_correct_stats_per
         lookup_all_asids_mock,
         engine_mock,
         get_patient_registration_count_mock,
-        calculate_migrations_stats_per_supplier_combination_mock):
+        supplier_combination_stats_mock):
     migration_occurrence = aMigrationOccurrence()
     engine_mock.return_value = {
         "cutover_startdate": "2021-12-02T00:00:00+00:00",
@@ -475,24 +664,18 @@ def test_calculate_dashboard_metrics_from_telemetry_calculates_correct_stats_per
         "source_system": lookup_all_asids_mock.return_value[ods_code]["old"]["name"],
         "target_system": lookup_all_asids_mock.return_value[ods_code]["new"]["name"]
     }
-    calculate_migrations_stats_per_supplier_combination_mock.return_value = [{
-        "source_system": "source-system",
-        "target_system": "target-system",
-        "count": 1,
-        "mean_duration": 4
-    }]
-    metrics = [(engine_mock.return_value | org_details | system_details)]
+    metric = engine_mock.return_value | org_details | system_details
 
     calculate_dashboard_metrics_from_telemetry({}, {})
 
-    calculate_migrations_stats_per_supplier_combination_mock.assert_called_once_with(metrics)
+    supplier_combination_stats_mock.return_value.add.assert_called_once_with(metric)
 
 
 def test_calculate_dashboard_metrics_from_telemetry_returns_correct_stats_per_supplier_combination(
         mock_defaults,
         upload_migrations_mock,
-        calculate_migrations_stats_per_supplier_combination_mock):
-    calculate_migrations_stats_per_supplier_combination_mock.return_value = [{
+        supplier_combination_stats_mock):
+    supplier_combination_stats_mock.return_value.results.return_value = [{
         "source_system": "source-system",
         "target_system": "target-system",
         "count": 1,
@@ -503,12 +686,43 @@ def test_calculate_dashboard_metrics_from_telemetry_returns_correct_stats_per_su
 
     expected_migrations = {
         "mean_cutover_duration": ANY,
-        "supplier_combination_stats": calculate_migrations_stats_per_supplier_combination_mock.return_value,
+        "supplier_combination_stats": supplier_combination_stats_mock.return_value.results.return_value,
         "migrations": ANY
     }
     upload_migrations_mock.assert_called_once_with(ANY, expected_migrations)
 
 
+def test_calculate_dashboard_metrics_from_telemetry_uploads_cutover_cube(
+        mock_defaults,
+        occurrences_mock,
+        telemetry_mock,
+        lookup_all_asids_mock,
+        upload_cutover_cube_mock):
+    occurrences_mock.return_value = [
+        aMigrationOccurrence("A11111", "CCG 1"),
+        aMigrationOccurrence("B22222", "CCG 1"),
+        aMigrationOccurrence("C33333", "CCG 2", migration_date=date(2021, 8, 1))]
+    lookup_all_asids_mock.return_value = {
+        "A11111": anAsidPair(), "B22222": anAsidPair(), "C33333": anAsidPair()}
+    telemetry_mock.side_effect = None
+
+    calculate_dashboard_metrics_from_telemetry({}, {})
+
+    upload_cutover_cube_mock.assert_called_once_with(ANY, ANY)
+    cutover_cube = upload_cutover_cube_mock.call_args.args[1]
+    assert cutover_cube.to_json()["values"] == [["2021-07", "2021-08"], ["CCG 1", "CCG 2"], ["EMIS Web"], ["SystmOne"]]
+    assert cutover_cube.to_json()["cells"] == [[0, 0, 0, 0, 2, 2, 2, [[1, 2]]], [1, 1, 0, 0, 1, 1, 1, [[1, 1]]]]
+
+
+def test_calculate_dashboard_metrics_from_telemetry_does_not_upload_cutover_cube_without_metrics(
+        mock_defaults, occurrences_mock, upload_cutover_cube_mock):
+    occurrences_mock.return_value = []
+
+    calculate_dashboard_metrics_from_telemetry({}, {})
+
+    upload_cutover_cube_mock.assert_not_called()
+
+
 def test_export_splunk_data_runs_without_any_occurrences_data(mock_defaults, occurrences_mock):
     occurrences_mock.return_value = []
     result = export_splunk_data({}, {})
@@ -527,10 +741,84 @@ def test_export_splunk_data_gets_asids_for_ods_code_in_occurrences_data(
     lookup_all_asids_mock.assert_called_once_with(
         ANY,
         exporter_lambda_env_vars["ASID_LOOKUP_BUCKET_NAME"],
-        occurrences_mock.return_value
+        occurrences_mock.return_value,
+        None,
+        ANY,
+        False
+    )
+
+
+def test_export_splunk_data_looks_up_asids_using_configured_asid_index(
+        mock_defaults,
+        occurrences_mock,
+        lookup_all_asids_mock,
+        exporter_lambda_env_vars,
+        monkeypatch):
+    monkeypatch.setenv("ASID_INDEX_LOCATION", "s3://index-bucket/asid-index.bin")
+
+    export_splunk_data({}, {})
+
+    lookup_all_asids_mock.assert_called_once_with(
+        ANY,
+        exporter_lambda_env_vars["ASID_LOOKUP_BUCKET_NAME"],
+        occurrences_mock.return_value,
+        "s3://index-bucket/asid-index.bin",
+        ANY,
+        ANY
     )
 
 
+def test_export_splunk_data_looks_up_asids_using_configured_number_of_workers(
+        mock_defaults,
+        lookup_all_asids_mock,
+        monkeypatch):
+    monkeypatch.setenv("ASID_LOOKUP_WORKERS", "3")
+
+    export_splunk_data({}, {})
+
+    lookup_all_asids_mock.assert_called_once_with(ANY, ANY, ANY, ANY, 3, ANY)
+
+
+def test_export_splunk_data_keeps_configured_number_of_splunk_connections_and_closes_them(
+        mock_defaults,
+        monkeypatch):
+    configure_splunk_connections_mock = Mock()
+    close_splunk_connections_mock = Mock()
+    monkeypatch.setattr("app.configure_splunk_connections", configure_splunk_connections_mock)
+    monkeypatch.setattr("app.close_splunk_connections", close_splunk_connections_mock)
+    monkeypatch.setenv("SPLUNK_CONNECTION_POOL_SIZE", "2")
+    monkeypatch.setenv("SPLUNK_CONNECTION_IDLE_TIMEOUT", "10")
+
+    export_splunk_data({}, {})
+
+    configure_splunk_connections_mock.assert_called_once_with(2, 10.0)
+    close_splunk_connections_mock.assert_called_once()
+
+
+def test_export_splunk_data_reads_occurrences_using_configured_manifest(
+        mock_defaults,
+        occurrences_mock,
+        exporter_lambda_env_vars,
+        monkeypatch):
+    monkeypatch.setenv("OCCURRENCES_MANIFEST_LOCATION", "s3://manifest-bucket/occurrences.json.gz")
+
+    export_splunk_data({}, {})
+
+    occurrences_mock.assert_called_once_with(
+        ANY, exporter_lambda_env_vars["OCCURRENCES_BUCKET_NAME"], "s3://manifest-bucket/occurrences.json.gz")
+
+
+def test_export_splunk_data_looks_up_asids_with_s3_select_when_enabled(
+        mock_defaults,
+        lookup_all_asids_mock,
+        monkeypatch):
+    monkeypatch.setenv("USE_S3_SELECT", "true")
+
+    export_splunk_data({}, {})
+
+    lookup_all_asids_mock.assert_called_once_with(ANY, ANY, ANY, ANY, ANY, True)
+
+
 def test_export_splunk_data_skips_migrations_with_missing_asids(
         mock_defaults,
         occurrences_mock,
@@ -546,7 +834,7 @@ def test_export_splunk_data_skips_migrations_with_missing_asids(
 
     export_splunk_data({}, {})
 
-    calculate_baseline_date_range_mock.assert_called_with(migration_occurrence_2["date"])
+    calculate_baseline_date_range_mock.assert_any_call(migration_occurrence_2["date"])
 
 
 def test_export_splunk_data_skips_migrations_with_missing_baseline_telemetry(
@@ -571,10 +859,102 @@ def test_export_splunk_data_skips_migrations_with_missing_baseline_telemetry(
 
     export_splunk_data({}, {})
 
-    get_baseline_telemetry_from_splunk_mock.assert_called_with(
+    get_baseline_telemetry_from_splunk_mock.assert_any_call(
         ANY, ANY, lookup_all_asids_mock.return_value[migration_occurrence_2["ods_code"]]["old"]["asid"], ANY)
 
 
+def test_export_splunk_data_counts_only_successful_exports(
+        mock_defaults,
+        occurrences_mock,
+        lookup_all_asids_mock,
+        caplog):
+    migration_occurrence_1 = aMigrationOccurrence("A32323", "First CCG", "First Surgery")
+    migration_occurrence_2 = aMigrationOccurrence("B22222", "Second CCG", "Second Surgery")
+    occurrences_mock.return_value = [migration_occurrence_1, migration_occurrence_2]
+    lookup_all_asids_mock.return_value = {
+        migration_occurrence_1["ods_code"]: anAsidPair("", "", "", ""),
+        migration_occurrence_2["ods_code"]: anAsidPair()
+    }
+
+    export_splunk_data({}, {})
+
+    assert "Processed 2 migrations, 1 exported successfully" in caplog.messages
+
+
+def test_export_splunk_data_exports_migrations_concurrently(
+        mock_defaults,
+        occurrences_mock,
+        lookup_all_asids_mock,
+        get_baseline_telemetry_from_splunk_mock,
+        monkeypatch):
+    migration_occurrence_1 = aMigrationOccurrence("A32323", "First CCG", "First Surgery")
+    migration_occurrence_2 = aMigrationOccurrence("B22222", "Second CCG", "Second Surgery")
+    occurrences_mock.return_value = [migration_occurrence_1, migration_occurrence_2]
+    lookup_all_asids_mock.return_value = {
+        migration_occurrence_1["ods_code"]: anAsidPair("12345", "098765"),
+        migration_occurrence_2["ods_code"]: anAsidPair("13579", "08642")
+    }
+    monkeypatch.setenv("EXPORT_WORKERS", "2")
+    both_migrations_exporting = Barrier(2, timeout=5)
+    baseline_telemetry = get_baseline_telemetry_from_splunk_mock.return_value
+
+    def wait_for_other_migration(splunk_host, splunk_token, old_asid, baseline_date_range):
+        both_migrations_exporting.wait()
+        return baseline_telemetry
+    get_baseline_telemetry_from_splunk_mock.side_effect = wait_for_other_migration
+
+    export_splunk_data({}, {})
+
+    assert get_baseline_telemetry_from_splunk_mock.call_count == 2
+
+
+def test_export_splunk_data_queries_splunk_in_batches_when_batch_size_is_configured(
+        mock_defaults,
+        occurrences_mock,
+        lookup_all_asids_mock,
+        exporter_lambda_env_vars,
+        get_splunk_api_token_mock,
+        get_telemetry_stream_from_splunk_mock,
+        get_baseline_telemetry_from_splunk_mock,
+        parse_threshold_from_telemetry_mock,
+        upload_telemetry_mock,
+        upload_telemetry_stream_mock,
+        monkeypatch):
+    migration_occurrence_1 = aMigrationOccurrence("A32323", "First CCG", "First Surgery")
+    migration_occurrence_2 = aMigrationOccurrence("B22222", "Second CCG", "Second Surgery")
+    occurrences_mock.return_value = [migration_occurrence_1, migration_occurrence_2]
+    lookup_all_asids_mock.return_value = {
+        migration_occurrence_1["ods_code"]: anAsidPair("12345", "098765"),
+        migration_occurrence_2["ods_code"]: anAsidPair("13579", "08642")
+    }
+    monkeypatch.setenv("SPLUNK_QUERY_BATCH_SIZE", "10")
+    get_baseline_telemetry_batch_mock = Mock(side_effect=lambda splunk_host, token, requests: [
+        f"baseline-{asid}".encode() for asid, _ in requests])
+    get_telemetry_batch_mock = Mock(side_effect=lambda splunk_host, token, requests: [
+        f"telemetry-{asid}".encode() for asid, _ in requests])
+    monkeypatch.setattr("app.get_baseline_telemetry_batch_from_splunk", get_baseline_telemetry_batch_mock)
+    monkeypatch.setattr("app.get_telemetry_batch_from_splunk", get_telemetry_batch_mock)
+
+    export_splunk_data({}, {})
+
+    get_baseline_telemetry_from_splunk_mock.assert_not_called()
+    get_telemetry_stream_from_splunk_mock.assert_not_called()
+    get_baseline_telemetry_batch_mock.assert_called_once_with(
+        exporter_lambda_env_vars["SPLUNK_HOST"], get_splunk_api_token_mock.return_value, [("098765", ANY), ("08642", ANY)])
+    get_telemetry_batch_mock.assert_called_once_with(
+        ANY, ANY, [("098765", ANY), ("08642", ANY), ("12345", ANY), ("13579", ANY)])
+    parse_threshold_from_telemetry_mock.assert_any_call(b"baseline-08642")
+    upload_telemetry_mock.assert_any_call(ANY, ANY, b"baseline-08642", "08642-baseline-telemetry.csv.gz", ANY, ANY)
+    uploaded_streams = {
+        upload_call.args[3]: gzip.decompress(upload_call.args[2].read()) for upload_call in upload_telemetry_stream_mock.call_args_list}
+    assert uploaded_streams == {
+        "098765-telemetry.csv.gz": b"telemetry-098765",
+        "08642-telemetry.csv.gz": b"telemetry-08642",
+        "12345-telemetry.csv.gz": b"telemetry-12345",
+        "13579-telemetry.csv.gz": b"telemetry-13579"
+    }
+
+
 def test_export_splunk_data_gets_baseline_date_range(
         mock_defaults,
         calculate_baseline_date_range_mock):
@@ -666,13 +1046,13 @@ def test_export_splunk_data_does_not_export_duplicate_telemetry_data(
         mock_defaults,
         objects_exist_mock,
         get_baseline_telemetry_from_splunk_mock,
-        get_telemetry_from_splunk_mock):
+        get_telemetry_stream_from_splunk_mock):
     objects_exist_mock.return_value = True
 
     export_splunk_data({}, {})
 
     get_baseline_telemetry_from_splunk_mock.assert_not_called()
-    get_telemetry_from_splunk_mock.assert_not_called()
+    get_telemetry_stream_from_splunk_mock.assert_not_called()
 
 
 def test_export_splunk_data_queries_splunk_for_baseline_telemetry(
@@ -707,7 +1087,7 @@ def test_export_splunk_data_parses_baseline_threshold_from_telemetry(
     parse_threshold_from_telemetry_mock.assert_called_once_with(expected_telemetry)
 
 
-def test_export_splunk_data_queries_splunk_data_using_baseline_threshold(
+def test_export_splunk_data_queries_splunk_for_cutover_telemetry(
         mock_defaults,
         occurrences_mock,
         calculate_pre_cutover_date_range_mock,
@@ -715,29 +1095,24 @@ def test_export_splunk_data_queries_splunk_data_using_baseline_threshold(
         lookup_all_asids_mock,
         exporter_lambda_env_vars,
         get_splunk_api_token_mock,
-        parse_threshold_from_telemetry_mock,
-        get_telemetry_from_splunk_mock):
+        get_telemetry_stream_from_splunk_mock):
     ods_code = occurrences_mock.return_value[0]["ods_code"]
     lookup_all_asids_mock.return_value = {
         ods_code: anAsidPair()
     }
-    baseline_threshold = "10"
-    parse_threshold_from_telemetry_mock.return_value = baseline_threshold
 
     export_splunk_data({}, {})
 
-    get_telemetry_from_splunk_mock.assert_any_call(
+    get_telemetry_stream_from_splunk_mock.assert_any_call(
         exporter_lambda_env_vars["SPLUNK_HOST"],
         get_splunk_api_token_mock.return_value,
         OLD_ASID,
-        calculate_pre_cutover_date_range_mock.return_value,
-        baseline_threshold)
-    get_telemetry_from_splunk_mock.assert_any_call(
+        calculate_pre_cutover_date_range_mock.return_value)
+    get_telemetry_stream_from_splunk_mock.assert_any_call(
         exporter_lambda_env_vars["SPLUNK_HOST"],
         get_splunk_api_token_mock.return_value,
         NEW_ASID,
-        calculate_post_cutover_date_range_mock.return_value,
-        baseline_threshold)
+        calculate_post_cutover_date_range_mock.return_value)
 
 
 def test_export_splunk_data_uploads_baseline_telemetry_to_s3(
@@ -765,65 +1140,71 @@ def test_export_splunk_data_uploads_baseline_telemetry_to_s3(
     )
 
 
-def test_export_splunk_data_uploads_cutover_telemetry_to_s3(
+def test_export_splunk_data_streams_cutover_telemetry_to_s3(
         mock_defaults,
         occurrences_mock,
-        upload_telemetry_mock,
+        parse_threshold_from_telemetry_mock,
+        upload_telemetry_stream_mock,
         lookup_all_asids_mock,
         exporter_lambda_env_vars,
-        get_telemetry_from_splunk_mock,
+        get_telemetry_stream_from_splunk_mock,
         calculate_pre_cutover_date_range_mock,
         calculate_post_cutover_date_range_mock):
     ods_code = occurrences_mock.return_value[0]["ods_code"]
     lookup_all_asids_mock.return_value = {
         ods_code: anAsidPair()
     }
-    old_telemetry_data = "old"
-    new_telemetry_data = "new"
-    get_telemetry_from_splunk_mock.side_effect = [
-        old_telemetry_data, new_telemetry_data]
+    old_telemetry_stream = Mock()
+    new_telemetry_stream = Mock()
+    get_telemetry_stream_from_splunk_mock.side_effect = \
+        lambda splunk_host, token, asid, date_range: {OLD_ASID: old_telemetry_stream, NEW_ASID: new_telemetry_stream}[asid]
 
     export_splunk_data({}, {})
 
-    upload_telemetry_mock.assert_any_call(
+    upload_telemetry_stream_mock.assert_any_call(
         ANY,
         exporter_lambda_env_vars["TELEMETRY_BUCKET_NAME"],
-        old_telemetry_data,
+        old_telemetry_stream,
         f"{OLD_ASID}-telemetry.csv.gz",
         calculate_pre_cutover_date_range_mock.return_value["start_date"],
-        calculate_pre_cutover_date_range_mock.return_value["end_date"]
+        calculate_pre_cutover_date_range_mock.return_value["end_date"],
+        baseline_threshold=parse_threshold_from_telemetry_mock.return_value
     )
-    upload_telemetry_mock.assert_any_call(
+    upload_telemetry_stream_mock.assert_any_call(
         ANY,
         exporter_lambda_env_vars["TELEMETRY_BUCKET_NAME"],
-        new_telemetry_data,
+        new_telemetry_stream,
         f"{NEW_ASID}-telemetry.csv.gz",
         calculate_post_cutover_date_range_mock.return_value["start_date"],
         calculate_post_cutover_date_range_mock.return_value["end_date"]
     )
+    old_telemetry_stream.close.assert_called_once()
+    new_telemetry_stream.close.assert_called_once()
 
 
 def test_export_splunk_data_does_not_upload_empty_cutover_telemetry_to_s3(
         mock_defaults,
         occurrences_mock,
         upload_telemetry_mock,
+        upload_telemetry_stream_mock,
         lookup_all_asids_mock,
         exporter_lambda_env_vars,
-        get_telemetry_from_splunk_mock,
+        get_telemetry_stream_from_splunk_mock,
         calculate_pre_cutover_date_range_mock,
         calculate_post_cutover_date_range_mock):
     ods_code = occurrences_mock.return_value[0]["ods_code"]
     lookup_all_asids_mock.return_value = {
         ods_code: anAsidPair()
     }
-    old_telemetry_data = b""
-    new_telemetry_data = "new"
-    get_telemetry_from_splunk_mock.side_effect = [
-        old_telemetry_data, new_telemetry_data]
+    new_telemetry_stream = Mock()
+    get_telemetry_stream_from_splunk_mock.side_effect = \
+        lambda splunk_host, token, asid, date_range: {OLD_ASID: None, NEW_ASID: new_telemetry_stream}[asid]
 
     export_splunk_data({}, {})
 
     upload_telemetry_mock.assert_not_called()
+    upload_telemetry_stream_mock.assert_not_called()
+    new_telemetry_stream.close.assert_called_once()
 
 
 def aMigrationOccurrence(ods_code="A32323", ccg_name="Test CCG", practice_name="Test Surgery", migration_date=date(2021, 7, 11)):
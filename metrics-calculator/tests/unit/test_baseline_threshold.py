@@ -0,0 +1,51 @@
+import math
+import random
+import statistics
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from chalicelib.baseline_threshold import calculate_baseline_threshold, remove_outliers
+
+
+def test_calculate_baseline_threshold_is_mean_less_two_standard_deviations_of_weekday_counts():
+    # Friday to Tuesday: the weekend's counts are ignored
+    days = ["2021-09-03", "2021-09-04", "2021-09-05", "2021-09-06", "2021-09-07"]
+    counts = [1000, 5, 5, 1100, 1200]
+
+    assert calculate_baseline_threshold(days, counts) == pytest.approx(1100 - 2 * 100)
+
+
+def test_calculate_baseline_threshold_ignores_unusually_busy_days():
+    days = np.arange("2021-09-06", "2021-09-11", dtype="datetime64[D]")
+    counts = [100, 110, 90, 100, 10000]
+
+    assert calculate_baseline_threshold(days, counts) == pytest.approx(100 - 2 * statistics.stdev([100, 110, 90, 100]))
+
+
+def test_calculate_baseline_threshold_is_nan_with_fewer_than_two_weekdays():
+    assert math.isnan(calculate_baseline_threshold(["2021-09-04", "2021-09-05", "2021-09-06"], [100, 100, 100]))
+
+
+def test_remove_outliers_only_drops_counts_far_above_upper_quartile():
+    counts = np.array([0, 100, 100, 100, 110, 140, 1000])
+
+    # Quartiles are 100 and 125, so anything above 125 + 2.5 * 25 is removed
+    assert remove_outliers(counts).tolist() == [0, 100, 100, 100, 110, 140]
+
+
+def test_calculate_baseline_threshold_matches_straightforward_calculation():
+    generator = random.Random(0)
+    first_day = date(2021, 1, 1)
+    days = [first_day + timedelta(days=i) for i in range(84)]
+    counts = [generator.randint(0, 5000) if generator.random() > 0.05 else generator.randint(20000, 50000)
+              for _ in days]
+
+    weekday_counts = sorted(count for day, count in zip(days, counts) if day.weekday() < 5)
+    lower_quartile, _, upper_quartile = statistics.quantiles(weekday_counts, n=4, method="inclusive")
+    usual_counts = [count for count in weekday_counts
+                    if count <= upper_quartile + 2.5 * (upper_quartile - lower_quartile)]
+    expected = statistics.mean(usual_counts) - 2 * statistics.stdev(usual_counts)
+
+    assert calculate_baseline_threshold(days, counts) == pytest.approx(expected)
@@ -0,0 +1,125 @@
+from datetime import date, datetime
+from unittest.mock import Mock
+
+import pytest
+
+from chalicelib.batched_splunk_queries import group_overlapping_date_ranges, get_telemetry_batch_from_splunk, \
+    get_baseline_telemetry_batch_from_splunk
+from chalicelib.get_data_from_splunk import SplunkParseError
+
+
+@pytest.fixture
+def splunk_request(monkeypatch):
+    mock = Mock()
+    monkeypatch.setattr("chalicelib.batched_splunk_queries.make_splunk_request", mock)
+    yield mock
+
+
+def aDateRange(start_date, end_date):
+    return {"start_date": start_date, "end_date": end_date}
+
+
+def test_group_overlapping_date_ranges_groups_ranges_that_all_overlap():
+    date_ranges = [
+        aDateRange(date(2021, 7, 10), date(2021, 7, 20)),
+        aDateRange(date(2021, 7, 1), date(2021, 7, 12)),
+        aDateRange(date(2021, 7, 12), date(2021, 7, 30)),
+        aDateRange(date(2021, 7, 15), date(2021, 7, 30))
+    ]
+
+    assert group_overlapping_date_ranges(date_ranges, 10) == [[1, 0, 2], [3]]
+
+
+def test_group_overlapping_date_ranges_limits_size_of_groups():
+    date_ranges = [aDateRange(date(2021, 7, 1), date(2021, 7, 21))] * 5
+
+    assert group_overlapping_date_ranges(date_ranges, 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_get_telemetry_batch_from_splunk_searches_all_asids_over_all_date_ranges(splunk_request):
+    splunk_request.return_value = b"_time,1234\n2021-07-05T00:00:00,1\n"
+    requests = [
+        ("1234", aDateRange(datetime(2021, 7, 5), datetime(2021, 7, 25))),
+        ("5678", aDateRange(datetime(2021, 7, 12), datetime(2021, 8, 1)))
+    ]
+
+    get_telemetry_batch_from_splunk("test-splunk", "token", requests)
+
+    splunk_request.assert_called_once_with(
+        "test-splunk", "token", aDateRange(datetime(2021, 7, 5), datetime(2021, 8, 1)),
+        """search index="spine2vfmmonitor" messageSender IN (1234, 5678)
+| timechart span=1d limit=0 useother=false count by messageSender
+| fillnull
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)""")
+
+
+def test_get_telemetry_batch_from_splunk_splits_weekday_telemetry_by_asid_and_date_range(splunk_request):
+    splunk_request.return_value = b"""_time,1234,5678
+2021-07-09T00:00:00,10,0
+2021-07-10T00:00:00,4,0
+2021-07-12T00:00:00,8,0
+2021-07-13T00:00:00,0,3
+"""
+    requests = [
+        ("1234", aDateRange(date(2021, 7, 9), date(2021, 7, 12))),
+        ("5678", aDateRange(date(2021, 7, 12), date(2021, 7, 13)))
+    ]
+
+    telemetry = get_telemetry_batch_from_splunk("", "", requests)
+
+    assert telemetry == [
+        b"_time,count\n2021-07-09T00:00:00,10\n2021-07-12T00:00:00,8\n",
+        b"_time,count\n2021-07-12T00:00:00,0\n2021-07-13T00:00:00,3\n"
+    ]
+
+
+def test_get_telemetry_batch_from_splunk_returns_no_telemetry_for_asid_without_messages(splunk_request):
+    splunk_request.return_value = b"""_time,1234
+2021-07-12T00:00:00,8
+2021-07-13T00:00:00,0
+"""
+    requests = [
+        ("1234", aDateRange(date(2021, 7, 13), date(2021, 7, 13))),
+        ("5678", aDateRange(date(2021, 7, 12), date(2021, 7, 13)))
+    ]
+
+    assert get_telemetry_batch_from_splunk("", "", requests) == [b"", b""]
+
+
+def test_get_telemetry_batch_from_splunk_retries_empty_response(splunk_request):
+    splunk_request.side_effect = [b"", b"_time,1234\n2021-07-12T00:00:00,8\n"]
+
+    telemetry = get_telemetry_batch_from_splunk("", "", [("1234", aDateRange(date(2021, 7, 12), date(2021, 7, 12)))])
+
+    assert telemetry == [b"_time,count\n2021-07-12T00:00:00,8\n"]
+    assert splunk_request.call_count == 2
+
+
+def test_get_baseline_telemetry_batch_from_splunk_splits_telemetry_by_asid_and_date_range(splunk_request):
+    splunk_request.return_value = b"""_time,messageSender,count
+2021-04-05T00:00:00,1234,210
+2021-04-05T00:00:00,5678,20
+2021-04-06T00:00:00,1234,205
+2021-04-10T00:00:00,5678,15
+"""
+    requests = [
+        ("1234", aDateRange(date(2021, 4, 1), date(2021, 4, 5))),
+        ("5678", aDateRange(date(2021, 4, 1), date(2021, 4, 30))),
+        ("9999", aDateRange(date(2021, 4, 1), date(2021, 4, 30)))
+    ]
+
+    telemetry = get_baseline_telemetry_batch_from_splunk("", "", requests)
+
+    assert telemetry == [
+        b"_time,count\n2021-04-05T00:00:00,210\n",
+        b"_time,count\n2021-04-05T00:00:00,20\n2021-04-10T00:00:00,15\n",
+        b""
+    ]
+    assert "| stats count by _time, messageSender" in splunk_request.call_args.args[3]
+
+
+def test_get_baseline_telemetry_batch_from_splunk_raises_error_for_unexpected_time(splunk_request):
+    splunk_request.return_value = b"_time,messageSender,count\nyesterday,1234,210\n"
+
+    with pytest.raises(SplunkParseError):
+        get_baseline_telemetry_batch_from_splunk("", "", [("1234", aDateRange(date(2021, 4, 1), date(2021, 4, 5)))])
@@ -1,6 +1,7 @@
+import gzip
 from io import BytesIO
 
-from chalicelib.csv_rows import csv_rows
+from chalicelib.csv_rows import csv_rows, filtered_csv_rows
 from tests.builders.file import build_gzip_csv
 
 
@@ -21,3 +22,63 @@ def test_csv_rows():
     actual = csv_rows(stream)
 
     assert list(actual) == expected
+
+
+def test_filtered_csv_rows_only_yields_rows_with_wanted_values_in_the_column():
+    gzipped_content = build_gzip_csv(
+        header=["code", "name"],
+        rows=[["A1", "First"], ["A12", "Second"], ["B2", "A1"], ["A2", "Third"]],
+    )
+
+    expected = [
+        {"code": "A1", "name": "First"},
+        {"code": "A2", "name": "Third"},
+    ]
+
+    actual = filtered_csv_rows(BytesIO(gzipped_content), "code", {"A1", "A2"})
+
+    assert list(actual) == expected
+
+
+def test_filtered_csv_rows_passes_through_rows_with_quoted_fields_before_the_column():
+    gzipped_content = gzip.compress(
+        b'name,code,count\r\n'
+        b'"Smith, Jones",B2,1\r\n'
+        b'Surgery,"A1",2\r\n'
+        b'"Multi\r\nline",A1,3\r\n'
+        b'Clinic,A1,4\r\n')
+
+    expected = [
+        {"name": "Smith, Jones", "code": "B2", "count": "1"},
+        {"name": "Surgery", "code": "A1", "count": "2"},
+        {"name": "Multi\nline", "code": "A1", "count": "3"},
+        {"name": "Clinic", "code": "A1", "count": "4"},
+    ]
+
+    actual = filtered_csv_rows(BytesIO(gzipped_content), "code", {"A1"})
+
+    assert list(actual) == expected
+
+
+def test_filtered_csv_rows_does_not_match_lines_inside_a_quoted_field():
+    gzipped_content = gzip.compress(b'code,comment\nB2,"see\nA1,below"\nA1,ok\n')
+
+    expected = [{"code": "A1", "comment": "ok"}]
+
+    actual = filtered_csv_rows(BytesIO(gzipped_content), "code", {"A1"})
+
+    assert list(actual) == expected
+
+
+def test_filtered_csv_rows_yields_every_row_when_the_column_is_missing():
+    gzipped_content = build_gzip_csv(header=["id"], rows=[["1"], ["2"]])
+
+    actual = filtered_csv_rows(BytesIO(gzipped_content), "code", {"1"})
+
+    assert list(actual) == [{"id": "1"}, {"id": "2"}]
+
+
+def test_filtered_csv_rows_with_empty_file():
+    actual = filtered_csv_rows(BytesIO(gzip.compress(b"")), "code", {"A1"})
+
+    assert list(actual) == []
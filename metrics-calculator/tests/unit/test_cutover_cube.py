@@ -0,0 +1,59 @@
+from datetime import date
+
+import pytest
+
+from chalicelib.cutover_cube import CutoverCube, CutoverCubeError
+
+
+def a_metric(ccg_name="CCG", source_system="EMIS Web", target_system="SystmOne", cutover_duration=1):
+    return {
+        "ccg_name": ccg_name,
+        "source_system": source_system,
+        "target_system": target_system,
+        "cutover_duration": cutover_duration
+    }
+
+
+def test_cutover_cube_aggregates_durations_by_month_ccg_and_systems():
+    cutover_cube = CutoverCube()
+    cutover_cube.add(date(2021, 7, 1), a_metric(cutover_duration=2))
+    cutover_cube.add(date(2021, 7, 31), a_metric(cutover_duration=3))
+    cutover_cube.add(date(2021, 8, 1), a_metric(cutover_duration=4))
+    cutover_cube.add(date(2021, 8, 1), a_metric(source_system="Vision", cutover_duration=5))
+
+    assert cutover_cube.to_json() == {
+        "version": 1,
+        "dimensions": ["month", "ccg_name", "source_system", "target_system"],
+        "values": [["2021-07", "2021-08"], ["CCG"], ["EMIS Web", "Vision"], ["SystmOne"]],
+        "cells": [
+            [0, 0, 0, 0, 2, 5, 13, [[2, 1], [3, 1]]],
+            [1, 0, 0, 0, 1, 4, 16, [[4, 1]]],
+            [1, 0, 1, 0, 1, 5, 25, [[5, 1]]]
+        ]
+    }
+
+
+def test_cutover_cube_merge_matches_cube_for_all_migrations():
+    migrations = [(date(2021, 7 + i % 2, 1), a_metric(ccg_name=f"CCG {i % 3}", cutover_duration=i)) for i in range(12)]
+    all_migrations, first_shard, second_shard = CutoverCube(), CutoverCube(), CutoverCube()
+    for i, (migration_date, metric) in enumerate(migrations):
+        all_migrations.add(migration_date, metric)
+        (first_shard if i < 5 else second_shard).add(migration_date, metric)
+
+    merged = first_shard.merge(second_shard)
+
+    assert merged == all_migrations
+    assert sorted(map(str, merged.to_json()["cells"])) == sorted(map(str, all_migrations.to_json()["cells"]))
+
+
+def test_cutover_cube_round_trips_through_json():
+    cutover_cube = CutoverCube()
+    cutover_cube.add(date(2021, 7, 1), a_metric(cutover_duration=-1))
+    cutover_cube.add(date(2021, 8, 1), a_metric(ccg_name="Other CCG", cutover_duration=6))
+
+    assert CutoverCube.from_json(cutover_cube.to_json()).to_json() == cutover_cube.to_json()
+
+
+def test_cutover_cube_from_json_raises_error_for_unsupported_version():
+    with pytest.raises(CutoverCubeError):
+        CutoverCube.from_json({"version": 0, "dimensions": [], "values": [], "cells": []})
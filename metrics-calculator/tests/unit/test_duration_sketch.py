@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+import pytest
+
+from chalicelib.duration_sketch import DurationSketch
+
+
+def test_duration_sketch_summarises_durations():
+    sketch = DurationSketch()
+    for duration in [5, 1, 3, 3]:
+        sketch.add(duration)
+
+    assert sketch.count == 4
+    assert sketch.mean == 3
+    assert sketch.min == 1
+    assert sketch.max == 5
+    assert sketch.quantile(0.5) == 3
+
+
+def test_duration_sketch_quantiles_match_numpy_percentiles():
+    generator = random.Random(0)
+    durations = [generator.randint(-5, 30) for _ in range(1001)]
+    sketch = DurationSketch()
+    for duration in durations:
+        sketch.add(duration)
+
+    for q in [0, 0.1, 0.25, 0.5, 0.9, 1]:
+        assert sketch.quantile(q) == pytest.approx(np.percentile(durations, q * 100))
+
+
+def test_duration_sketch_merge_adds_counts():
+    sketch = DurationSketch({1: 2, 4: 1})
+
+    sketch.merge(DurationSketch({4: 1, 7: 3}))
+
+    assert sketch == DurationSketch({1: 2, 4: 2, 7: 3})
+    assert sketch.count == 7
+    assert sketch.total == 31
+
+
+def test_duration_sketch_round_trips_through_json():
+    sketch = DurationSketch({7: 3, 1: 2})
+
+    assert sketch.to_json() == [[1, 2], [7, 3]]
+    assert DurationSketch.from_json(sketch.to_json()) == sketch
+
+
+def test_duration_sketch_rejects_fractional_durations():
+    with pytest.raises(ValueError):
+        DurationSketch().add(1.5)
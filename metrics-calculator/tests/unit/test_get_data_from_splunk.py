@@ -1,12 +1,20 @@
+import gzip
 import pytest as pytest
 import urllib.parse
 
 from datetime import date
+from io import BytesIO
 from unittest.mock import Mock, MagicMock
 
 from chalicelib.get_data_from_splunk import SplunkQueryError, SplunkParseError, \
-    get_telemetry_from_splunk, parse_threshold_from_telemetry, get_baseline_telemetry_from_splunk, make_splunk_request, \
-    SplunkTelemetryMissing
+    parse_threshold_from_telemetry, get_baseline_telemetry_from_splunk, make_splunk_request, \
+    SplunkTelemetryMissing, close_splunk_connections, configure_splunk_connections, get_telemetry_stream_from_splunk
+
+
+@pytest.fixture(autouse=True)
+def splunk_connections():
+    yield
+    configure_splunk_connections()
 
 
 @pytest.fixture(scope="function")
@@ -33,23 +41,45 @@ def splunk_request(monkeypatch):
     }
 
 
-def test_parse_threshold_from_telemetry_extracts_threshold_from_splunk_telemetry():
-    telemetry = b"""_time",count,avgmin2std
-"2021-09-06T00:00:00.000+0000",2,"4537.33933970307"""
+def test_parse_threshold_from_telemetry_calculates_threshold_from_weekday_counts():
+    telemetry = b"""_time,count
+2021-09-03T00:00:00,1000
+2021-09-04T00:00:00,5
+2021-09-05T00:00:00,5
+2021-09-06T00:00:00,1100
+2021-09-07T00:00:00,1200"""
 
     baseline_threshold = parse_threshold_from_telemetry(telemetry)
 
-    assert baseline_threshold == "4537.33933970307"
+    assert baseline_threshold == pytest.approx(900)
 
 
 def test_parse_threshold_from_telemetry_raises_exception_when_threshold_is_not_positive():
-    telemetry = b"""_time",count,avgmin2std
-"2021-09-06T00:00:00.000+0000",2,"0"""
+    telemetry = b"""_time,count
+2021-09-06T00:00:00,0
+2021-09-07T00:00:00,0"""
 
     with pytest.raises(ValueError, match="Threshold is not a positive value"):
         parse_threshold_from_telemetry(telemetry)
 
 
+def test_parse_threshold_from_telemetry_raises_exception_when_only_weekend_telemetry_is_returned():
+    telemetry = b"""_time,count
+2021-09-04T00:00:00,1000
+2021-09-05T00:00:00,1000"""
+
+    with pytest.raises(SplunkTelemetryMissing):
+        parse_threshold_from_telemetry(telemetry)
+
+
+def test_parse_threshold_from_telemetry_raises_exception_when_counts_are_missing():
+    telemetry = b"""_time,avgmin2std
+2021-09-06T00:00:00,4537.33933970307"""
+
+    with pytest.raises(SplunkParseError):
+        parse_threshold_from_telemetry(telemetry)
+
+
 def test_parse_threshold_from_telemetry_handles_parse_failure():
     telemetry = "this-is-not-a-byte-string"
 
@@ -93,16 +123,10 @@ def test_get_baseline_telemetry_from_splunk_makes_correct_request(splunk_request
         "latest_time": "2021-06-28T24:00:00",
         "search": f"""search index="spine2vfmmonitor" messageSender={asid}
 | bucket span=1d _time
-| eval day_of_week = strftime(_time,"%A")
-| where NOT (day_of_week="Saturday" OR day_of_week="Sunday")
 | stats count by _time
-| outlier action=remove
-| eventstats avg(count) as average stdev(count) as stdd
-| eval avgmin2std=average-(stdd*2)
-| fields - stdd
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)"""
     })
-    expected_headers = {"Authorization": f"Bearer {token}"}
+    expected_headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
     splunk_request["connection"].assert_called_once_with(splunk_host)
     splunk_request["request"].assert_called_once_with(
         "POST", "/services/search/jobs/export", expected_request_body, expected_headers)
@@ -124,44 +148,15 @@ def test_get_baseline_telemetry_from_splunk_makes_request_twice_if_empty_telemet
     assert telemetry == expected_telemetry
 
 
-def test_get_telemetry_from_splunk_get_cutover_telemetry(splunk_response):
-    threshold = "4537.33933970307"
-    expected_telemetry = b"""_time",count,avgmin2std
-"2021-09-06T00:00:00.000+0000",2,"4537.33933970307"""
-    splunk_response.return_value = Mock(
-        read=lambda: expected_telemetry, status=200)
-
-    telemetry = get_telemetry_from_splunk(
-        "", anApiToken(), anAsid(), aDateRange(), threshold)
-
-    assert telemetry == expected_telemetry
-
-
-def test_get_telemetry_makes_request_twice_if_empty_telemetry_is_returned_first(splunk_response):
-    threshold = "4537.33933970307"
-    expected_telemetry = b"""_time",count,avgmin2std
-"2021-09-06T00:00:00.000+0000",2,"4537.33933970307"""
-    splunk_response.side_effect = [
-        Mock(
-            read=lambda: b"", status=200),
-        Mock(
-            read=lambda: expected_telemetry, status=200)
-    ]
-
-    telemetry = get_telemetry_from_splunk(
-        "", anApiToken(), anAsid(), aDateRange(), threshold)
-
-    assert telemetry == expected_telemetry
-
-
-def test_get_telemetry_from_splunk_makes_correct_request(splunk_request):
+def test_get_telemetry_stream_from_splunk_makes_correct_request(splunk_request):
     asid = anAsid()
     date_range = aDateRange()
-    threshold = "4537.33933970307"
     splunk_host = "test-splunk"
     token = anApiToken()
+    splunk_request["connection"].return_value.getresponse.return_value = aStreamedResponse(b"""_time",count
+"2021-09-06T00:00:00.000+0000",2""")
 
-    get_telemetry_from_splunk(splunk_host, token, asid, date_range, threshold)
+    get_telemetry_stream_from_splunk(splunk_host, token, asid, date_range).close()
 
     expected_request_body = urllib.parse.urlencode({
         "output_mode": "csv",
@@ -172,11 +167,10 @@ def test_get_telemetry_from_splunk_makes_correct_request(splunk_request):
 | fillnull
 | eval day_of_week = strftime(_time,"%A")
 | where NOT (day_of_week="Saturday" OR day_of_week="Sunday")
-| eval avgmin2std={threshold}
 | fields - day_of_week
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(_time)"""
     })
-    expected_headers = {"Authorization": f"Bearer {token}"}
+    expected_headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
     splunk_request["connection"].assert_called_once_with(splunk_host)
     splunk_request["request"].assert_called_once_with(
         "POST", "/services/search/jobs/export", expected_request_body, expected_headers)
@@ -189,6 +183,100 @@ def test_make_splunk_request_handles_http_response_failure(splunk_response):
         make_splunk_request("", anApiToken(), aDateRange(), "")
 
 
+def test_make_splunk_request_reuses_connection_for_consecutive_requests(splunk_request):
+    splunk_request["connection"].return_value.getresponse.return_value.will_close = False
+
+    make_splunk_request("test-splunk", anApiToken(), aDateRange(), "")
+    make_splunk_request("test-splunk", anApiToken(), aDateRange(), "")
+
+    splunk_request["connection"].assert_called_once_with("test-splunk")
+    assert splunk_request["request"].call_count == 2
+
+
+def test_close_splunk_connections_closes_kept_alive_connections(splunk_request):
+    connection = splunk_request["connection"].return_value
+    connection.getresponse.return_value.will_close = False
+    make_splunk_request("test-splunk", anApiToken(), aDateRange(), "")
+
+    close_splunk_connections()
+
+    connection.close.assert_called_once()
+
+
+def test_get_telemetry_stream_from_splunk_streams_cutover_telemetry(splunk_response):
+    expected_telemetry = b"""_time",count
+"2021-09-06T00:00:00.000+0000",2"""
+    splunk_response.return_value = aStreamedResponse(expected_telemetry)
+
+    with get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange()) as telemetry_stream:
+        assert gzip.decompress(telemetry_stream.read()) == expected_telemetry
+
+
+def test_get_telemetry_stream_from_splunk_makes_request_twice_if_empty_telemetry_is_returned_first(splunk_response):
+    expected_telemetry = b"""_time",count
+"2021-09-06T00:00:00.000+0000",2"""
+    splunk_response.side_effect = [aStreamedResponse(b""), aStreamedResponse(expected_telemetry)]
+
+    telemetry_stream = get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange())
+
+    assert gzip.decompress(telemetry_stream.read()) == expected_telemetry
+    assert splunk_response.call_count == 2
+
+
+def test_get_telemetry_stream_from_splunk_passes_gzipped_telemetry_through(splunk_response):
+    zipped_telemetry = gzip.compress(b"""_time",count
+"2021-09-06T00:00:00.000+0000",2""")
+    splunk_response.return_value = aStreamedResponse(zipped_telemetry, content_encoding="gzip")
+
+    telemetry_stream = get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange())
+
+    assert telemetry_stream.read() == zipped_telemetry
+
+
+def test_get_telemetry_stream_from_splunk_returns_none_when_gzipped_telemetry_is_empty(splunk_response):
+    splunk_response.side_effect = [
+        aStreamedResponse(gzip.compress(b""), content_encoding="gzip"),
+        aStreamedResponse(gzip.compress(b""), content_encoding="gzip")]
+
+    assert get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange()) is None
+
+
+def test_get_telemetry_stream_from_splunk_raises_error_for_invalid_gzipped_telemetry(splunk_response):
+    splunk_response.return_value = aStreamedResponse(b"not gzip", content_encoding="gzip")
+
+    with pytest.raises(SplunkParseError):
+        get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange())
+
+
+def test_make_splunk_request_decompresses_gzipped_response(splunk_response):
+    telemetry = b"""_time",count
+"2021-09-06T00:00:00",1500"""
+    splunk_response.return_value = aStreamedResponse(gzip.compress(telemetry), content_encoding="gzip")
+
+    assert make_splunk_request("", anApiToken(), aDateRange(), "") == telemetry
+
+
+def test_get_telemetry_stream_from_splunk_returns_none_when_no_telemetry_is_returned(splunk_response):
+    splunk_response.side_effect = [aStreamedResponse(b""), aStreamedResponse(b"")]
+
+    assert get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange()) is None
+
+
+def test_get_telemetry_stream_from_splunk_handles_http_response_failure(splunk_response):
+    splunk_response.return_value = Mock(status=500, read=lambda: b"error")
+
+    with pytest.raises(SplunkQueryError, match="Splunk request returned a 500 code"):
+        get_telemetry_stream_from_splunk("", anApiToken(), anAsid(), aDateRange())
+
+
+def aStreamedResponse(body, content_encoding=None):
+    body_stream = BytesIO(body)
+    headers = {"Content-Encoding": content_encoding} if content_encoding else {}
+    return Mock(
+        status=200, read=body_stream.read, will_close=False, isclosed=lambda: body_stream.tell() == len(body),
+        getheader=lambda name, default=None: headers.get(name, default))
+
+
 def anAsid():
     return "12345"
 
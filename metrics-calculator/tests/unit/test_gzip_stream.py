@@ -0,0 +1,36 @@
+import gzip
+import io
+
+from chalicelib.gzip_stream import GzipCompressingReader
+
+
+def test_gzip_compressing_reader_compresses_stream():
+    data = b"_time,count\n" + b"2021-09-06T00:00:00,2\n" * 1000
+
+    compressed = GzipCompressingReader(io.BytesIO(data), chunk_size=100).read()
+
+    assert gzip.decompress(compressed) == data
+
+
+def test_gzip_compressing_reader_reads_stream_a_chunk_at_a_time():
+    stream = io.BytesIO(b"telemetry" * 1000)
+    reader = GzipCompressingReader(stream, chunk_size=100)
+
+    reader.read(1)
+
+    assert stream.tell() <= 200
+
+
+def test_gzip_compressing_reader_fills_buffered_reads():
+    data = bytes(range(256)) * 400
+    reader = io.BufferedReader(GzipCompressingReader(io.BytesIO(data), chunk_size=10), buffer_size=16)
+
+    parts = iter(lambda: reader.read(1000), b"")
+    compressed_parts = list(parts)
+
+    assert all(len(part) == 1000 for part in compressed_parts[:-1])
+    assert gzip.decompress(b"".join(compressed_parts)) == data
+
+
+def test_gzip_compressing_reader_compresses_empty_stream():
+    assert gzip.decompress(GzipCompressingReader(io.BytesIO(b"")).read()) == b""
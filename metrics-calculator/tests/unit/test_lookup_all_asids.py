@@ -0,0 +1,30 @@
+from chalicelib.lookup_all_asids import parse_lookup_file_month, order_lookup_files
+
+
+def test_parse_lookup_file_month_parses_year_and_month_from_key():
+    assert parse_lookup_file_month("2021/1/asidLookup.csv.gz") == 2021 * 12
+    assert parse_lookup_file_month("2021/12/asidLookup.csv.gz") == 2021 * 12 + 11
+
+
+def test_parse_lookup_file_month_returns_none_for_keys_without_a_month():
+    assert parse_lookup_file_month("asid-lookup.csv.gz") is None
+    assert parse_lookup_file_month("2021/13/asidLookup.csv.gz") is None
+
+
+def test_order_lookup_files_orders_by_nearest_month_then_newest_first():
+    keys = ["2021/1/a.csv.gz", "2021/10/a.csv.gz", "2021/5/a.csv.gz", "2021/7/a.csv.gz", "undated.csv.gz"]
+    lookup_file_months = {key: parse_lookup_file_month(key) for key in keys}
+
+    ordered_keys = order_lookup_files(lookup_file_months, 2021 * 12 + 5)
+
+    assert ordered_keys == ["2021/7/a.csv.gz", "2021/5/a.csv.gz", "2021/10/a.csv.gz", "2021/1/a.csv.gz",
+                            "undated.csv.gz"]
+
+
+def test_order_lookup_files_keeps_listing_order_without_a_migration_month():
+    keys = ["2021/1/a.csv.gz", "2021/10/a.csv.gz", "undated.csv.gz"]
+    lookup_file_months = {key: parse_lookup_file_month(key) for key in keys}
+
+    ordered_keys = order_lookup_files(lookup_file_months, None)
+
+    assert ordered_keys == keys
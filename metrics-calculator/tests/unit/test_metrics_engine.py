@@ -1,7 +1,22 @@
+from io import BytesIO
 from unittest.mock import ANY
 
-from chalicelib.metrics_engine import calculate_cutover_start_and_end_date, \
-    calculate_migrations_stats_per_supplier_combination
+import pytest
+
+from chalicelib.metrics_engine import calculate_cutover_start_and_end_date, SupplierCombinationStats
+from chalicelib.telemetry_series import TelemetryStream
+from tests.builders.file import build_gzip_csv
+
+
+def a_telemetry_stream(rows, threshold=None):
+    return TelemetryStream(BytesIO(build_gzip_csv(header=["_time", "count"], rows=rows)), threshold)
+
+
+def supplier_combination_stats(metrics):
+    stats = SupplierCombinationStats()
+    for metric in metrics:
+        stats.add(metric)
+    return stats.results()
 
 
 def test_calculate_cutover_start_and_end_date():
@@ -38,7 +53,7 @@ def test_calculate_cutover_start_and_end_date():
     }
 
 
-def test_calculate_migrations_stats_per_supplier_combination_returns_correct_count_for_multiple_occurrences_for_multiple_combination():
+def test_supplier_combination_stats_returns_correct_count_for_multiple_occurrences_for_multiple_combination():
     metrics = [{"source_system": "source-system-1",
                 "target_system": "target-system",
                 "cutover_duration": 4
@@ -56,25 +71,33 @@ def test_calculate_migrations_stats_per_supplier_combination_returns_correct_cou
                 "cutover_duration": 4
                 }]
 
-    result = calculate_migrations_stats_per_supplier_combination(metrics)
+    result = supplier_combination_stats(metrics)
 
     expected_result = [
         {
             "source_system": metrics[0]["source_system"],
             "target_system": metrics[0]["target_system"],
             "count": 2,
-            "mean_duration": ANY
+            "mean_duration": ANY,
+            "median_duration": ANY,
+            "p90_duration": ANY,
+            "min_duration": ANY,
+            "max_duration": ANY
         },
         {
             "source_system": metrics[2]["source_system"],
             "target_system": metrics[2]["target_system"],
             "count": 2,
-            "mean_duration": ANY
+            "mean_duration": ANY,
+            "median_duration": ANY,
+            "p90_duration": ANY,
+            "min_duration": ANY,
+            "max_duration": ANY
         }]
     assert result == expected_result
 
 
-def test_calculate_migrations_stats_per_supplier_combination_returns_correct_mean_cutover_duration_for_multiple_combination():
+def test_supplier_combination_stats_returns_correct_mean_cutover_duration_for_multiple_combination():
     metrics = [{"source_system": "source-system-1",
                 "target_system": "target-system",
                 "cutover_duration": 5
@@ -91,20 +114,109 @@ def test_calculate_migrations_stats_per_supplier_combination_returns_correct_mea
                 "target_system": "target-system",
                 "cutover_duration": 8
                 }]
-    result = calculate_migrations_stats_per_supplier_combination(metrics)
+    result = supplier_combination_stats(metrics)
 
     expected_result = [
         {
             "source_system": metrics[0]["source_system"],
             "target_system": metrics[0]["target_system"],
             "count": ANY,
-            "mean_duration": 5.3
+            "mean_duration": 5.3,
+            "median_duration": ANY,
+            "p90_duration": ANY,
+            "min_duration": ANY,
+            "max_duration": ANY
         },
         {
             "source_system": metrics[3]["source_system"],
             "target_system": metrics[3]["target_system"],
             "count": ANY,
-            "mean_duration": 8.0
+            "mean_duration": 8.0,
+            "median_duration": ANY,
+            "p90_duration": ANY,
+            "min_duration": ANY,
+            "max_duration": ANY
         }]
     assert result == expected_result
 
+
+def test_supplier_combination_stats_returns_cutover_duration_distribution():
+    metrics = [{"source_system": "source-system", "target_system": "target-system", "cutover_duration": duration}
+               for duration in [3, 9, 1, 4, 2]]
+
+    result = supplier_combination_stats(metrics)
+
+    assert result == [{
+        "source_system": "source-system",
+        "target_system": "target-system",
+        "count": 5,
+        "mean_duration": 3.8,
+        "median_duration": 3.0,
+        "p90_duration": 7.0,
+        "min_duration": 1,
+        "max_duration": 9
+    }]
+
+
+def test_supplier_combination_stats_merge_matches_stats_for_all_metrics():
+    metrics = [{"source_system": f"source-system-{i % 2}", "target_system": "target-system", "cutover_duration": i}
+               for i in range(10)]
+    first_half, second_half = SupplierCombinationStats(), SupplierCombinationStats()
+    for metric in metrics[:5]:
+        first_half.add(metric)
+    for metric in metrics[5:]:
+        second_half.add(metric)
+
+    assert first_half.merge(second_half).results() == supplier_combination_stats(metrics)
+
+
+def test_calculate_cutover_start_and_end_date_starts_on_first_day_when_last_day_is_above_threshold():
+    old_asid_telemetry = a_telemetry_stream([
+        ["2021-11-25T00:00:00", "2000"], ["2021-11-26T00:00:00", "200"], ["2021-11-27T00:00:00", "2854"]], 1044.7)
+    new_asid_telemetry = a_telemetry_stream([["2021-11-30T00:00:00", "300"], ["2021-12-01T00:00:00", "2854"]])
+
+    result = calculate_cutover_start_and_end_date(old_asid_telemetry, new_asid_telemetry)
+
+    assert result["cutover_startdate"] == "2021-11-25T00:00:00"
+    assert result["cutover_duration"] == 6
+
+
+def test_calculate_cutover_start_and_end_date_raises_error_when_no_day_before_cutover_is_above_threshold():
+    old_asid_telemetry = a_telemetry_stream([["2021-11-25T00:00:00", "200"], ["2021-11-26T00:00:00", "200"]], 1044.7)
+    new_asid_telemetry = a_telemetry_stream([["2021-11-30T00:00:00", "2854"]])
+
+    with pytest.raises(Exception, match="Start date out of range"):
+        calculate_cutover_start_and_end_date(old_asid_telemetry, new_asid_telemetry)
+
+
+def test_calculate_cutover_start_and_end_date_stops_reading_after_first_day_above_threshold_following_cutover():
+    def new_asid_telemetry():
+        yield {"_time": "2021-11-30T00:00:00", "count": "300", "avgmin2std": "1044.7"}
+        yield {"_time": "2021-12-01T00:00:00", "count": "2854", "avgmin2std": "1044.7"}
+        raise AssertionError("Read past the first day above the threshold")
+
+    old_asid_telemetry = a_telemetry_stream([
+        ["2021-11-25T00:00:00", "2000"], ["2021-11-26T00:00:00", "2854"], ["2021-11-27T00:00:00", "200"]], 1044.7)
+
+    result = calculate_cutover_start_and_end_date(old_asid_telemetry, new_asid_telemetry())
+
+    assert result["cutover_enddate"] == "2021-12-01T00:00:00"
+
+
+def test_calculate_cutover_start_and_end_date_from_telemetry_streams_closes_them():
+    old_asid_stream = BytesIO(build_gzip_csv(
+        header=["_time", "count", "avgmin2std"],
+        rows=[["2021-11-25T00:00:00", "2000", "1044.7"], ["2021-11-26T00:00:00", "200", "1044.7"]]))
+    new_asid_stream = BytesIO(build_gzip_csv(
+        header=["_time", "count", "avgmin2std"],
+        rows=[["2021-11-30T00:00:00", "2854", "1044.7"], ["2021-12-01T00:00:00", "2854", "1044.7"]]))
+
+    result = calculate_cutover_start_and_end_date(TelemetryStream(old_asid_stream), TelemetryStream(new_asid_stream))
+
+    assert result == {
+        "cutover_startdate": "2021-11-26T00:00:00",
+        "cutover_enddate": "2021-11-30T00:00:00",
+        "cutover_duration": 4,
+    }
+    assert old_asid_stream.closed
+    assert new_asid_stream.closed
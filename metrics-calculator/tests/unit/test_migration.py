@@ -0,0 +1,76 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from chalicelib.migration import Migration, MigrationMetrics, record_to_json
+
+
+def aMigration(ccg_name="A Test CCG"):
+    return Migration(
+        ods_code="A12345",
+        ccg_name=ccg_name,
+        practice_name="A Test Practice",
+        supplier_id="10000",
+        product_id="10000-001",
+        date=datetime(2021, 5, 11))
+
+
+def test_migration_can_be_read_like_a_dict():
+    migration = aMigration()
+
+    assert migration["ods_code"] == "A12345"
+    assert migration.get("date") == datetime(2021, 5, 11)
+    assert migration.get("unknown") is None
+    assert migration == {
+        "ods_code": "A12345",
+        "ccg_name": "A Test CCG",
+        "practice_name": "A Test Practice",
+        "supplier_id": "10000",
+        "product_id": "10000-001",
+        "date": datetime(2021, 5, 11)
+    }
+    with pytest.raises(KeyError):
+        migration["unknown"]
+
+
+def test_migration_shares_repeated_ccg_names():
+    first, second = aMigration("".join(["A Test", " CCG"])), aMigration("".join(["A Test ", "CCG"]))
+
+    assert first["ccg_name"] is second["ccg_name"]
+
+
+def test_migration_metrics_serialise_to_the_same_json_as_the_equivalent_dict():
+    metrics_dict = {
+        "cutover_startdate": "2021-12-02T00:00:00+00:00",
+        "cutover_enddate": "2021-12-06T00:00:00+00:00",
+        "cutover_duration": 4,
+        "ods_code": "A12345",
+        "ccg_name": "A Test CCG",
+        "practice_name": "A Test Practice",
+        "patient_registration_count": 1000,
+        "source_system": "SystmOne",
+        "target_system": "EMIS Web"
+    }
+
+    metrics = MigrationMetrics(**metrics_dict)
+
+    assert json.dumps({"migrations": [metrics]}, default=record_to_json) == json.dumps({"migrations": [metrics_dict]})
+
+
+def test_migration_metrics_leave_out_unknown_patient_registration_count():
+    metrics = MigrationMetrics(
+        cutover_startdate="2021-12-02T00:00:00+00:00",
+        cutover_enddate="2021-12-06T00:00:00+00:00",
+        cutover_duration=4,
+        ods_code="A12345",
+        ccg_name="A Test CCG",
+        practice_name="A Test Practice",
+        source_system="SystmOne",
+        target_system="EMIS Web")
+
+    assert "patient_registration_count" not in metrics
+    assert json.dumps(metrics, default=record_to_json) == (
+        '{"cutover_startdate": "2021-12-02T00:00:00+00:00", "cutover_enddate": "2021-12-06T00:00:00+00:00", '
+        '"cutover_duration": 4, "ods_code": "A12345", "ccg_name": "A Test CCG", "practice_name": "A Test Practice", '
+        '"source_system": "SystmOne", "target_system": "EMIS Web"}')
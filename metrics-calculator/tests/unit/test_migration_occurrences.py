@@ -2,7 +2,11 @@ from datetime import datetime
 
 import pytest as pytest
 
-from chalicelib.migration_occurrences import _parse_migration
+from io import BytesIO
+
+from chalicelib.csv_rows import csv_rows
+from chalicelib.migration_occurrences import _parse_migration, _parse_occurrences_csv, _parse_occurrences_rows
+from tests.builders.file import build_gzip_csv
 
 test_dates = [
     ("29/03/2021", datetime(2021, 3, 29)),
@@ -45,4 +49,47 @@ def test_parse_migration_raises_exception_if_given_american_date_format():
     }
 
     with pytest.raises(ValueError):
-        _parse_migration(input_row)
\ No newline at end of file
+        _parse_migration(input_row)
+
+OCCURRENCES_HEADER = [
+    "Service Recipient ID (e.g. ODS code where this is available)", "Change Status", "Call Off Ordering Party name",
+    "Service Recipient Name", "Supplier ID", "Product ID ", "Actual M1 date"]
+
+
+def test_parse_occurrences_csv_matches_parsing_row_by_row():
+    gzipped_content = build_gzip_csv(
+        header=OCCURRENCES_HEADER,
+        rows=[
+            ["A12345", "Activation", "ccg-name", "practice-name", "10000", "10000-001", "29/03/2021"],
+            ["B12345", "Activation", "ccg-name", "\"practice, name\"", "10046", "10046-001", "not-a-date"],
+            ["C12345", "Activation", "", "practice-name", "10052", "10052-002", "1/7/2021"],
+        ],
+    )
+
+    migrations = _parse_occurrences_csv(BytesIO(gzipped_content))
+
+    assert migrations == _parse_occurrences_rows(csv_rows(BytesIO(gzipped_content)))
+    assert [type(migration["date"]) for migration in migrations] == [datetime, datetime]
+
+
+def test_parse_occurrences_csv_raises_exception_if_given_american_date_format():
+    gzipped_content = build_gzip_csv(
+        header=OCCURRENCES_HEADER,
+        rows=[["A12345", "Activation", "ccg-name", "practice-name", "10000", "10000-001", "03/29/2021"]],
+    )
+
+    with pytest.raises(ValueError):
+        _parse_occurrences_csv(BytesIO(gzipped_content))
+
+
+def test_parse_occurrences_csv_raises_exception_if_given_blank_date():
+    gzipped_content = build_gzip_csv(
+        header=OCCURRENCES_HEADER,
+        rows=[
+            ["A12345", "Activation", "ccg-name", "practice-name", "10000", "10000-001", "29/03/2021"],
+            ["B12345", "Activation", "ccg-name", "practice-name", "10000", "10000-001", ""]
+        ],
+    )
+
+    with pytest.raises(ValueError):
+        _parse_occurrences_csv(BytesIO(gzipped_content))
@@ -0,0 +1,79 @@
+from unittest.mock import Mock
+
+from chalicelib import s3
+from chalicelib.s3 import select_csv_rows_s3
+
+
+def a_selectable_object(*payloads):
+    client = Mock()
+    client.select_object_content.side_effect = [
+        {"Payload": [{"Records": {"Payload": payload}} for payload in batch] + [{"End": {}}]}
+        for batch in payloads
+    ]
+    return Mock(bucket_name="test-bucket", key="test-object.csv.gz", meta=Mock(client=client))
+
+
+def test_select_csv_rows_s3_selects_projected_columns_of_matching_rows():
+    s3_object = a_selectable_object([b"A1,SystmOne,11\nA2,\"EMIS", b" Web\",21\n"])
+
+    rows = list(select_csv_rows_s3(s3_object, "NACS", {"A2", "A1"}, ["NACS", "PName", "ASID"]))
+
+    assert rows == [
+        {"NACS": "A1", "PName": "SystmOne", "ASID": "11"},
+        {"NACS": "A2", "PName": "EMIS Web", "ASID": "21"},
+    ]
+    s3_object.meta.client.select_object_content.assert_called_once_with(
+        Bucket="test-bucket",
+        Key="test-object.csv.gz",
+        ExpressionType="SQL",
+        Expression="SELECT s.\"NACS\", s.\"PName\", s.\"ASID\" FROM S3Object s WHERE s.\"NACS\" IN ('A1', 'A2')",
+        InputSerialization={
+            "CSV": {"FileHeaderInfo": "USE", "AllowQuotedRecordDelimiter": True},
+            "CompressionType": "GZIP"
+        },
+        OutputSerialization={"CSV": {}},
+    )
+
+
+def test_select_csv_rows_s3_escapes_quotes_in_values():
+    s3_object = a_selectable_object([b""])
+
+    list(select_csv_rows_s3(s3_object, "CODE", {"O'Brien"}, ["CODE"]))
+
+    expression = s3_object.meta.client.select_object_content.call_args.kwargs["Expression"]
+    assert expression.endswith("IN ('O''Brien')")
+
+
+def test_select_csv_rows_s3_splits_values_across_queries_to_stay_within_expression_size_limit(monkeypatch):
+    monkeypatch.setattr(s3, "S3_SELECT_MAX_EXPRESSION_BYTES", 85)
+    s3_object = a_selectable_object([b"A1,1\n"], [b"A4,4\n"])
+
+    rows = list(select_csv_rows_s3(s3_object, "CODE", {"A1", "A2", "A3", "A4", "A5"}, ["CODE", "COUNT"]))
+
+    assert rows == [{"CODE": "A1", "COUNT": "1"}, {"CODE": "A4", "COUNT": "4"}]
+    expressions = [call.kwargs["Expression"] for call in s3_object.meta.client.select_object_content.call_args_list]
+    assert all(len(expression) <= 85 for expression in expressions)
+    assert [expression.split("IN ")[1] for expression in expressions] == [
+        "('A1', 'A2', 'A3')", "('A4', 'A5')"]
+
+
+def test_select_csv_rows_s3_yields_rows_as_their_records_arrive():
+    def events():
+        yield {"Records": {"Payload": b"A1,1\nA2,"}}
+        yield {"Records": {"Payload": b"2\n"}}
+        raise AssertionError("Read past the records for the rows asked for")
+    client = Mock()
+    client.select_object_content.return_value = {"Payload": events()}
+    s3_object = Mock(bucket_name="test-bucket", key="test-object.csv.gz", meta=Mock(client=client))
+
+    rows = select_csv_rows_s3(s3_object, "CODE", {"A1", "A2"}, ["CODE", "COUNT"])
+
+    assert [next(rows), next(rows)] == [{"CODE": "A1", "COUNT": "1"}, {"CODE": "A2", "COUNT": "2"}]
+
+
+def test_get_s3_resource_uses_s3_endpoint_url(monkeypatch):
+    monkeypatch.setenv("S3_ENDPOINT_URL", "http://localhost:9000")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+
+    assert s3.get_s3_resource().meta.client.meta.endpoint_url == "http://localhost:9000"
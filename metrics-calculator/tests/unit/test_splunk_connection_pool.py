@@ -0,0 +1,138 @@
+from http.client import RemoteDisconnected
+from io import BytesIO
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from chalicelib.splunk_connection_pool import SplunkConnectionPool
+
+
+def aConnection(*responses):
+    return MagicMock(getresponse=Mock(side_effect=list(responses)))
+
+
+def aResponse(body=b"telemetry", will_close=False):
+    return Mock(status=200, read=Mock(return_value=body), will_close=will_close, isclosed=Mock(return_value=True))
+
+
+def aStreamedResponse(body):
+    body_stream = BytesIO(body)
+    return Mock(
+        status=200, read=body_stream.read, will_close=False, isclosed=lambda: body_stream.tell() == len(body))
+
+
+def read_response(pool):
+    response = pool.open("POST", "/export", "body", {})
+    try:
+        return response.status, response.read()
+    finally:
+        response.close()
+
+
+def test_open_returns_response_status_and_body():
+    connection = aConnection(aResponse(b"telemetry"))
+    pool = SplunkConnectionPool(Mock(return_value=connection), size=1, idle_timeout=30)
+
+    assert read_response(pool) == (200, b"telemetry")
+    connection.connect.assert_called_once()
+    connection.request.assert_called_once_with("POST", "/export", "body", {})
+
+
+def test_open_reuses_kept_alive_connection():
+    connection = aConnection(aResponse(), aResponse())
+    connect = Mock(return_value=connection)
+    pool = SplunkConnectionPool(connect, size=1, idle_timeout=30)
+
+    read_response(pool)
+    read_response(pool)
+
+    connect.assert_called_once()
+    connection.close.assert_not_called()
+
+
+def test_open_closes_connection_the_server_will_close():
+    first_connection = aConnection(aResponse(will_close=True))
+    second_connection = aConnection(aResponse())
+    pool = SplunkConnectionPool(Mock(side_effect=[first_connection, second_connection]), size=1, idle_timeout=30)
+
+    read_response(pool)
+    read_response(pool)
+
+    first_connection.close.assert_called_once()
+    second_connection.request.assert_called_once()
+
+
+def test_open_does_not_reuse_connection_idle_for_longer_than_timeout(monkeypatch):
+    clock = Mock(side_effect=[0, 0, 31, 31])
+    monkeypatch.setattr("chalicelib.splunk_connection_pool.monotonic", clock)
+    first_connection = aConnection(aResponse())
+    second_connection = aConnection(aResponse())
+    pool = SplunkConnectionPool(Mock(side_effect=[first_connection, second_connection]), size=1, idle_timeout=30)
+
+    read_response(pool)
+    read_response(pool)
+
+    first_connection.close.assert_called_once()
+    second_connection.request.assert_called_once()
+
+
+def test_open_reconnects_when_kept_alive_connection_was_dropped():
+    first_connection = aConnection(aResponse(), RemoteDisconnected("Remote end closed connection"))
+    second_connection = aConnection(aResponse(b"retried"))
+    pool = SplunkConnectionPool(Mock(side_effect=[first_connection, second_connection]), size=1, idle_timeout=30)
+    read_response(pool)
+
+    assert read_response(pool) == (200, b"retried")
+    first_connection.close.assert_called_once()
+    second_connection.connect.assert_called_once()
+
+
+def test_open_raises_error_when_new_connection_fails():
+    connection = aConnection(ConnectionResetError())
+    pool = SplunkConnectionPool(Mock(return_value=connection), size=1, idle_timeout=30)
+
+    with pytest.raises(ConnectionResetError):
+        pool.open("POST", "/export", "body", {})
+    connection.close.assert_called_once()
+
+
+def test_pool_keeps_at_most_size_idle_connections():
+    connections = [aConnection(aResponse()) for _ in range(3)]
+    pool = SplunkConnectionPool(Mock(side_effect=connections), size=2, idle_timeout=30)
+    acquired_connections = [pool._acquire()[0] for _ in connections]
+    for connection in acquired_connections:
+        pool._release(connection)
+
+    connections[2].close.assert_called_once()
+    pool.close()
+    for connection in connections:
+        connection.close.assert_called_once()
+
+
+def test_open_returns_connection_to_pool_when_response_was_read_to_the_end():
+    connection = aConnection(aStreamedResponse(b"telemetry"), aResponse())
+    connect = Mock(return_value=connection)
+    pool = SplunkConnectionPool(connect, size=1, idle_timeout=30)
+
+    response = pool.open("POST", "/export", "body", {})
+    assert response.read(5) == b"telem"
+    assert response.read(100) == b"etry"
+    response.close()
+    read_response(pool)
+
+    connect.assert_called_once()
+    connection.close.assert_not_called()
+
+
+def test_open_closes_connection_when_response_was_not_read_to_the_end():
+    first_connection = aConnection(aStreamedResponse(b"telemetry"))
+    second_connection = aConnection(aResponse())
+    pool = SplunkConnectionPool(Mock(side_effect=[first_connection, second_connection]), size=1, idle_timeout=30)
+
+    response = pool.open("POST", "/export", "body", {})
+    response.read(5)
+    response.close()
+    read_response(pool)
+
+    first_connection.close.assert_called_once()
+    second_connection.request.assert_called_once()
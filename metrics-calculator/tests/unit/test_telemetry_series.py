@@ -0,0 +1,45 @@
+from datetime import timedelta, timezone
+from io import BytesIO
+
+import pytest
+
+from chalicelib.telemetry_series import TelemetryParseError, TelemetryStream, parse_day
+from tests.builders.file import build_gzip_csv
+
+
+def test_parse_day_returns_days_since_epoch_and_utc_timezone():
+    assert parse_day("2021-11-25T00:00:00.000+0000") == (18956, timezone.utc)
+
+
+def test_parse_day_returns_no_timezone_for_naive_timestamp():
+    assert parse_day("2021-11-25T00:00:00") == (18956, None)
+
+
+def test_parse_day_returns_timezone_with_offset():
+    assert parse_day("2021-11-25T00:00:00+01:00") == (18956, timezone(timedelta(hours=1)))
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2021-11-25T13:00:00", "2021-11-25T00:00:00.500", "2021-11-25", "25/11/2021", "2021-11-25T00:00:00+1"])
+def test_parse_day_raises_error_for_unexpected_timestamp(timestamp):
+    with pytest.raises(TelemetryParseError):
+        parse_day(timestamp)
+
+
+def test_telemetry_stream_decodes_one_day_at_a_time_and_closes_stream_when_stopped():
+    stream = BytesIO(build_gzip_csv(
+        header=["_time", "count", "avgmin2std"],
+        rows=[["2021-11-25T00:00:00.000+0000", "2000", "1044.7"], ["2021-11-26T00:00:00.000+0000", "2854", ""]]))
+
+    telemetry_days = iter(TelemetryStream(stream))
+
+    assert next(telemetry_days) == (18956, 2000, 1044.7, timezone.utc)
+    assert not stream.closed
+    telemetry_days.close()
+    assert stream.closed
+
+
+def test_telemetry_stream_uses_given_threshold_when_telemetry_has_no_threshold_column():
+    stream = BytesIO(build_gzip_csv(header=["_time", "count"], rows=[["2021-11-25T00:00:00", "2000"]]))
+
+    assert list(TelemetryStream(stream, 1044.7)) == [(18956, 2000, 1044.7, None)]
@@ -0,0 +1,35 @@
+from datetime import datetime
+from io import BytesIO
+
+from chalicelib.xlsx_rows import xlsx_rows
+from tests.builders.file import build_xlsx
+
+
+def test_xlsx_rows_reads_rows_of_the_wanted_worksheet_as_text():
+    xlsx_content = build_xlsx({
+        "Summary": [["id", "total"], ["999", 1]],
+        "Pending Act upload": [
+            [None],
+            ["id", "message", "date", "amount"],
+            [123, "A message", datetime(2021, 5, 11), 10.5],
+            [],
+            ["321", None, "11/5/2021"],
+        ],
+    })
+
+    expected = [
+        {"id": "123", "message": "A message", "date": "11/05/2021", "amount": "10.5"},
+        {"id": "321", "message": "", "date": "11/5/2021", "amount": ""},
+    ]
+
+    actual = xlsx_rows(BytesIO(xlsx_content), lambda name: name == "Pending Act upload")
+
+    assert list(actual) == expected
+
+
+def test_xlsx_rows_yields_nothing_when_no_worksheet_is_wanted():
+    xlsx_content = build_xlsx({"Summary": [["id"], ["999"]]})
+
+    actual = xlsx_rows(BytesIO(xlsx_content), lambda name: False)
+
+    assert list(actual) == []